@@ -1,4 +1,17 @@
-"""Telegram bot initialization package."""
-from tgcrm.bot.bot_factory import create_bot, create_dispatcher
+"""Telegram bot initialization package.
+
+The factories are imported on first access, so Celery tasks can use a
+submodule such as :mod:`tgcrm.bot.rate_limit` without loading every handler
+dependency.
+"""
+from typing import Any
 
 __all__ = ["create_bot", "create_dispatcher"]
+
+
+def __getattr__(name: str) -> Any:
+    if name in __all__:
+        from tgcrm.bot import bot_factory
+
+        return getattr(bot_factory, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,28 +1,83 @@
 """Factory helpers for aiogram bot and dispatcher instances."""
 from __future__ import annotations
 
+from typing import Optional
+
 from aiogram import Bot, Dispatcher, Router
 from aiogram.client.default import DefaultBotProperties
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisEventIsolation
 
+from tgcrm.bot.middlewares import (
+    AIJobsMiddleware,
+    DbSessionMiddleware,
+    QueryCountMiddleware,
+)
+from tgcrm.bot.rate_limit import RateLimitMiddleware, get_send_limiter
+from tgcrm.bot.scheduler import ChatEventIsolation
+from tgcrm.bot.storage import MsgpackRedisStorage
+from tgcrm.bot.utils.history import HistoryStore, MemoryHistoryStore, RedisHistoryStore
 from tgcrm.config import get_settings
 
 
 def create_bot() -> Bot:
-    """Create a :class:`Bot` configured for the current environment."""
+    """Create a :class:`Bot` configured for the current environment.
+
+    Sends go through the process-wide :class:`~tgcrm.bot.rate_limit.SendLimiter`.
+    """
 
     settings = get_settings()
     default_properties = DefaultBotProperties(parse_mode=settings.telegram.parse_mode)
-    return Bot(token=settings.telegram.bot_token, default=default_properties)
+    bot = Bot(token=settings.telegram.bot_token, default=default_properties)
+    bot.session.middleware(
+        RateLimitMiddleware(get_send_limiter(), max_retries=settings.telegram.send_max_retries)
+    )
+    return bot
+
+
+def create_storage() -> BaseStorage:
+    """Return the FSM storage selected by ``FSM_STORAGE``."""
+
+    settings = get_settings()
+    if settings.telegram.fsm_storage == "redis":
+        return MsgpackRedisStorage.from_url(settings.redis.dsn, ttl=settings.telegram.fsm_ttl)
+    return MemoryStorage()
+
+
+def create_history_store() -> HistoryStore:
+    """Return the message history store matching ``FSM_STORAGE``."""
+
+    settings = get_settings()
+    if settings.telegram.fsm_storage == "redis":
+        return RedisHistoryStore.from_url(settings.redis.dsn, ttl=settings.telegram.fsm_ttl)
+    return MemoryHistoryStore()
+
 
+def create_dispatcher(*routers: Router, concurrency: Optional[int] = None) -> Dispatcher:
+    """Create a :class:`Dispatcher` and attach the provided routers.
 
-def create_dispatcher(*routers: Router) -> Dispatcher:
-    """Create a :class:`Dispatcher` and attach the provided routers."""
+    ``concurrency`` enables per-chat ordering of polled updates with at most
+    that many chats handled at once. Webhook mode orders updates itself; with
+    Redis FSM storage its replicas also lock each chat in Redis, so two
+    replicas never handle updates of one chat at the same time.
+    """
 
-    dispatcher = Dispatcher(storage=MemoryStorage())
+    storage = create_storage()
+    # The isolation lock is taken by aiogram's FSM middleware, before the chat's state is read.
+    isolation: Optional[BaseEventIsolation] = None
+    if concurrency:
+        isolation = ChatEventIsolation(concurrency)
+    elif isinstance(storage, MsgpackRedisStorage):
+        isolation = RedisEventIsolation(storage.redis, key_builder=storage.key_builder)
+    dispatcher = Dispatcher(storage=storage, events_isolation=isolation)
+    dispatcher.update.outer_middleware(QueryCountMiddleware())
+    # Inside the query count, so the closing COMMIT is counted with the update.
+    dispatcher.update.outer_middleware(DbSessionMiddleware())
+    dispatcher.update.outer_middleware(AIJobsMiddleware())
     if routers:
         dispatcher.include_routers(*routers)
     return dispatcher
 
 
-__all__ = ["create_bot", "create_dispatcher"]
+__all__ = ["create_bot", "create_dispatcher", "create_history_store", "create_storage"]
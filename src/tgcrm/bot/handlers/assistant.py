@@ -5,63 +5,70 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
 from tgcrm.bot.menu import render_main_menu
-from tgcrm.bot.nlu_parser import detect_intent, extract_entities
+from tgcrm.bot.middlewares import UpdateDb
+from tgcrm.bot.nlu_parser import extract_entities
 from tgcrm.bot.states import BotStates
 from tgcrm.bot.utils.history import delete_message_safe, purge_history, remember_message
-from tgcrm.db.session import get_session
-from tgcrm.services.deals import ensure_manager
 
 from .client import start_client_creation
-from .deal import handle_interaction, handle_status_change, list_manager_deals, select_deal_by_suffix
+from .deal import (
+    handle_interaction,
+    handle_status_change,
+    list_manager_deals,
+    search_clients_by_text,
+    select_deal_by_suffix,
+)
 from .reminder import handle_reminder
 from .settings import start_settings_flow
 from .supervisor import start_supervisor_report
 
-
 router = Router()
 
 
 @router.message(BotStates.idle)
-async def interpret_message(message: Message, state: FSMContext) -> None:
+async def interpret_message(message: Message, state: FSMContext, db: UpdateDb) -> None:
     text = message.text or ""
-    intent = detect_intent(text)
     entities = extract_entities(text)
+    intent = entities["intent"]
 
     if intent == "main_menu":
-        await purge_history(message.bot, message.chat.id, state)
-        await delete_message_safe(message)
+        await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
         sent = await message.answer(render_main_menu())
         await remember_message(state, sent.message_id)
         return
 
     if intent == "create_client":
-        await start_client_creation(message, state, entities.get("phone", text))
+        await start_client_creation(message, state, db, entities.get("phone", text))
         return
 
     if intent == "search_deal_by_last4":
         suffix = str(entities.get("last4") or text[-4:])
-        await select_deal_by_suffix(message, state, suffix)
+        await select_deal_by_suffix(message, state, db, suffix)
         return
 
     if intent == "list_deals":
-        await list_manager_deals(message, state)
+        await list_manager_deals(message, state, db)
+        return
+
+    if intent == "search_client":
+        await search_clients_by_text(message, state, db, text)
         return
 
     if intent == "add_interaction":
         summary = entities.get("interaction") or text
         if summary.strip():
-            await handle_interaction(message, state, summary)
+            await handle_interaction(message, state, db, summary)
             return
 
     if intent == "set_reminder":
-        await handle_reminder(message, state)
+        await handle_reminder(message, state, db)
         return
 
     if intent == "change_status":
         identifier = entities.get("identifier")
         if identifier and not (await state.get_data()).get("active_deal_id") and len(str(identifier)) >= 4:
-            await select_deal_by_suffix(message, state, str(identifier)[-4:])
-        await handle_status_change(message, state, entities.get("status", text))
+            await select_deal_by_suffix(message, state, db, str(identifier)[-4:])
+        await handle_status_change(message, state, db, entities.get("status", text))
         return
 
     if intent == "upload_invoice":
@@ -72,8 +79,7 @@ async def interpret_message(message: Message, state: FSMContext) -> None:
             await remember_message(state, sent.message_id)
             return
         await state.set_state(BotStates.awaiting_pdf)
-        await purge_history(message.bot, message.chat.id, state)
-        await delete_message_safe(message)
+        await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
         sent = await message.answer("Отправьте PDF-файл счёта для анализа")
         await remember_message(state, sent.message_id)
         return
@@ -86,13 +92,12 @@ async def interpret_message(message: Message, state: FSMContext) -> None:
         await start_settings_flow(message, state)
         return
 
-    await _unknown_intent_response(message, state)
+    await _unknown_intent_response(message, state, db)
 
 
-async def _unknown_intent_response(message: Message, state: FSMContext) -> None:
+async def _unknown_intent_response(message: Message, state: FSMContext, db: UpdateDb) -> None:
     await delete_message_safe(message)
-    async with get_session() as session:
-        await ensure_manager(session, message.from_user.id, name=message.from_user.full_name)
+    await db.manager()
     sent = await message.answer(
         "Я пока не понял запрос. Попробуйте сформулировать иначе или воспользуйтесь меню.\n\n"
         f"{render_main_menu()}"
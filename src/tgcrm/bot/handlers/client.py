@@ -1,21 +1,59 @@
 """
 Handler для работы с клиентами.
 """
+from __future__ import annotations
 
 from aiogram import Router, types
 from aiogram.filters import Command
-from tgcrm.services.ai_assistant import AIService
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+
+from tgcrm.bot.menu import render_deal_context
+from tgcrm.bot.middlewares import UpdateDb
+from tgcrm.bot.utils.history import purge_history, remember_message
+from tgcrm.db.session import get_session
+from tgcrm.services.ai_assistant import AIAssistant
+from tgcrm.services.deals import create_deal_for_manager, get_or_create_client
+from tgcrm.services.phones import PhoneValidationError
+
+from .deal import ACTIVE_DEAL_KEY
 
 router = Router()
 
 
+async def start_client_creation(
+    message: Message, state: FSMContext, db: UpdateDb, phone: str
+) -> None:
+    """Create (or reuse) a client by phone number and open a new deal for it."""
+
+    await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
+
+    manager = await db.manager()
+    try:
+        async with get_session() as session:
+            client = await get_or_create_client(session, phone)
+            deal = await create_deal_for_manager(session, client, manager)
+            deal_id = deal.id
+            phone_number = client.phone_number
+    except PhoneValidationError:
+        sent = await message.answer("⚠️ Не удалось распознать номер. Пример: +7 777 123 45 67")
+        await remember_message(state, sent.message_id)
+        return
+
+    await state.update_data({ACTIVE_DEAL_KEY: deal_id})
+    sent = await message.answer(
+        f"✅ Клиент {phone_number} добавлен, создана сделка #{deal_id}.\n\n{render_deal_context()}"
+    )
+    await remember_message(state, sent.message_id)
+
+
 @router.message(Command("newclient"))
-async def create_client(message: types.Message, ai: AIService | None = None):
+async def create_client(message: types.Message, ai: AIAssistant | None = None):
     """Создание нового клиента с AI-подсказкой."""
     await message.answer("📞 Введите номер телефона клиента:")
 
     if ai:
-        tip = await ai.get_advice(
+        tip = await ai.get_ai_advice(
             "Подскажи менеджеру, что стоит уточнить при первом разговоре с новым клиентом."
         )
         await message.answer(f"💡 Совет: {tip}")
@@ -26,3 +64,6 @@ async def create_client(message: types.Message, ai: AIService | None = None):
         await message.delete()
     except Exception:
         pass
+
+
+__all__ = ["router", "start_client_creation"]
@@ -1,22 +1,386 @@
 """
-Handler для сделок: загрузка счетов, статусы, советы AI.
+Handler для сделок: поиск по номеру, взаимодействия, статусы, загрузка счетов.
 """
+from __future__ import annotations
 
-from aiogram import Router, types
+import re
+from typing import Optional
+
+from aiogram import F, Router, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from tgcrm.services.ai_assistant import AIService
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy import select
+
+from tgcrm.bot.keyboards.deals import CALLBACK_PREFIX, FILTER_LABELS, deals_page_keyboard
+from tgcrm.bot.menu import render_deal_context, render_main_menu
+from tgcrm.bot.middlewares import UpdateDb
+from tgcrm.bot.utils.ai_jobs import answer_in_background
+from tgcrm.bot.utils.history import purge_history, remember_message
+from tgcrm.db.models import Deal, Manager
+from tgcrm.db.session import get_session
+from tgcrm.db.statuses import DealStatus
+from tgcrm.services.ai import interaction_advice_prompt
+from tgcrm.services.ai_assistant import AIAssistant, stream_ai_advice
+from tgcrm.services.client_search import search_clients
+from tgcrm.services.deals import (
+    DealCursor,
+    DealSummary,
+    change_deal_status,
+    find_deal_summary_by_phone_suffix,
+    get_deal_summary,
+    list_deals_page,
+    load_recent_interactions,
+)
+from tgcrm.services.interaction_writer import attach_ai_advice, record_interaction
 
 router = Router()
 
+ACTIVE_DEAL_KEY = "active_deal_id"
+DEALS_LISTING_KEY = "deals_listing"
+
+# Checked in order; "нов" goes last because it also occurs inside verbs like "обнови".
+STATUS_ALIASES = {
+    "счёт": DealStatus.INVOICE_SENT,
+    "счет": DealStatus.INVOICE_SENT,
+    "ожида": DealStatus.PAYMENT_PENDING,
+    "оплач": DealStatus.PAID,
+    "отмен": DealStatus.CANCELLED,
+    "долгосроч": DealStatus.LONG_TERM,
+    "нов": DealStatus.NEW,
+}
+
+
+async def _get_active_deal(state: FSMContext) -> Optional[int]:
+    data = await state.get_data()
+    deal_id = data.get(ACTIVE_DEAL_KEY)
+    return int(deal_id) if deal_id else None
+
+
+async def _set_active_deal(state: FSMContext, deal_id: int) -> None:
+    await state.update_data({ACTIVE_DEAL_KEY: deal_id})
+
+
+async def _load_deal_for_manager(session, deal_id: int, manager: Manager) -> Optional[Deal]:
+    """Load a deal owned by ``manager`` together with its recent interactions."""
+
+    result = await session.execute(
+        select(Deal).where(Deal.id == deal_id, Deal.manager_id == manager.id)
+    )
+    deal = result.scalar_one_or_none()
+    if deal is not None:
+        await load_recent_interactions(session, deal)
+    return deal
+
+
+def _parse_status(text: str) -> Optional[DealStatus]:
+    lowered = text.strip().lower()
+    for status in DealStatus:
+        if status.value.lower() == lowered:
+            return status
+    for alias, status in STATUS_ALIASES.items():
+        if alias in lowered:
+            return status
+    return None
+
+
+def render_deal_card(summary: DealSummary) -> str:
+    amount = f"{summary.amount:.2f}" if summary.amount is not None else "—"
+    last_contact = (
+        f"{summary.last_interaction_at:%d.%m.%Y %H:%M}" if summary.last_interaction_at else "—"
+    )
+    lines = [
+        f"🤝 Сделка #{summary.id}",
+        f"Клиент: {summary.client_name or 'без имени'} ({summary.client_phone})",
+        f"Город: {summary.client_city or '—'}",
+        f"Статус: {summary.status}",
+        f"Сумма: {amount}",
+        f"Последний контакт: {last_contact}",
+    ]
+    return "\n".join(lines)
+
+
+async def select_deal_by_suffix(
+    message: Message, state: FSMContext, db: UpdateDb, suffix: str
+) -> None:
+    """Find the newest deal by the last four phone digits and make it active."""
+
+    await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
+    manager_id = (await db.manager()).id
+
+    # The card only needs a handful of columns, so no ORM graph is loaded here.
+    async with get_session(readonly=True) as session:
+        summary = await find_deal_summary_by_phone_suffix(
+            session, phone_suffix=suffix, manager_id=manager_id
+        )
+
+    if summary is None:
+        sent = await message.answer(
+            f"Сделка с номером, оканчивающимся на {suffix[-4:]}, не найдена.\n\n"
+            f"{render_main_menu()}"
+        )
+        await remember_message(state, sent.message_id)
+        return
+
+    await _set_active_deal(state, summary.id)
+    sent = await message.answer(f"{render_deal_card(summary)}\n\n{render_deal_context()}")
+    await remember_message(state, sent.message_id)
+
+
+SEARCH_KEYWORDS = re.compile(r"^\s*(?:найди|найти|поиск|ищи)\s*(?:клиента)?\s*", re.IGNORECASE)
+OPEN_DEAL_PREFIX = "deal:open"
+
+
+async def search_clients_by_text(
+    message: Message, state: FSMContext, db: UpdateDb, text: str
+) -> None:
+    """Fuzzy search among the manager's clients and offer their deals as buttons."""
+
+    await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
+
+    query = SEARCH_KEYWORDS.sub("", text).strip()
+    manager_id = (await db.manager()).id
+
+    async with get_session(readonly=True) as session:
+        matches = await search_clients(session, manager_id=manager_id, query=query)
+
+    if not matches:
+        sent = await message.answer(
+            f"По запросу «{query}» клиентов не найдено.\n\n{render_main_menu()}"
+        )
+        await remember_message(state, sent.message_id)
+        return
+
+    builder = InlineKeyboardBuilder()
+    for match in matches:
+        label = " · ".join(part for part in (match.name, match.city, match.phone_number) if part)
+        builder.button(text=label, callback_data=f"{OPEN_DEAL_PREFIX}:{match.deal_id}")
+    builder.adjust(1)
+    sent = await message.answer("🔎 Найденные клиенты:", reply_markup=builder.as_markup())
+    await remember_message(state, sent.message_id)
+
+
+@router.callback_query(F.data.startswith(f"{OPEN_DEAL_PREFIX}:"))
+async def open_deal(callback: CallbackQuery, state: FSMContext, db: UpdateDb) -> None:
+    """Make the deal picked from search results active and show its card."""
+
+    try:
+        deal_id = int((callback.data or "").rsplit(":", 1)[-1])
+    except ValueError:
+        await callback.answer()
+        return
+
+    manager_id = (await db.manager()).id
+
+    async with get_session(readonly=True) as session:
+        summary = await get_deal_summary(session, deal_id=deal_id, manager_id=manager_id)
+
+    if summary is None:
+        await callback.answer("Сделка не найдена", show_alert=True)
+        return
+
+    await _set_active_deal(state, summary.id)
+    if isinstance(callback.message, Message):
+        await callback.message.edit_text(f"{render_deal_card(summary)}\n\n{render_deal_context()}")
+    await callback.answer()
+
+
+async def handle_interaction(
+    message: Message, state: FSMContext, db: UpdateDb, summary: str
+) -> None:
+    """Record a manager interaction for the active deal, then follow up with an AI tip.
+
+    The interaction is committed and confirmed first. The tip is streamed by a
+    background job, which stores it on the interaction once delivered.
+    """
+
+    await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
+
+    deal_id = await _get_active_deal(state)
+    if not deal_id:
+        sent = await message.answer("Сначала выберите сделку по последним 4 цифрам клиента.")
+        await remember_message(state, sent.message_id)
+        return
+
+    manager = await db.manager()
+    async with get_session() as session:
+        deal = await _load_deal_for_manager(session, deal_id, manager)
+        if deal is not None:
+            prompt = await interaction_advice_prompt(deal, "message")
+            recorded = await record_interaction(
+                session,
+                deal,
+                interaction_type="message",
+                ai_advice=None,
+                manager_summary=summary,
+            )
+
+    if deal is None:
+        sent = await message.answer("Сделка не найдена. Повторите поиск клиента.")
+        await remember_message(state, sent.message_id)
+        return
+
+    # The interaction is committed; the advice follows without holding up the manager.
+    sent = await message.answer("📝 Взаимодействие сохранено.")
+    await remember_message(state, sent.message_id)
+
+    async def store_advice(advice: str) -> None:
+        async with get_session() as session:
+            await attach_ai_advice(session, recorded, advice)
+
+    answer_in_background(
+        message,
+        state,
+        stream_ai_advice(prompt),
+        prefix="💬 ",
+        suffix=f"\n\n{render_deal_context()}",
+        on_answer=store_advice,
+    )
+
+
+async def handle_status_change(
+    message: Message, state: FSMContext, db: UpdateDb, status_text: str
+) -> None:
+    """Change the status of the active deal."""
+
+    await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
+
+    deal_id = await _get_active_deal(state)
+    if not deal_id:
+        sent = await message.answer("Сначала выберите сделку по последним 4 цифрам клиента.")
+        await remember_message(state, sent.message_id)
+        return
+
+    new_status = _parse_status(status_text)
+    if new_status is None:
+        options = ", ".join(status.value for status in DealStatus)
+        sent = await message.answer(f"Не понял статус. Доступные варианты: {options}.")
+        await remember_message(state, sent.message_id)
+        return
+
+    manager = await db.manager()
+    error: Optional[str] = None
+    async with get_session() as session:
+        result = await session.execute(
+            select(Deal).where(Deal.id == deal_id, Deal.manager_id == manager.id)
+        )
+        deal = result.scalar_one_or_none()
+        if deal is None:
+            error = "Сделка не найдена. Повторите поиск клиента."
+        else:
+            try:
+                await change_deal_status(session, deal, new_status.value)
+            except ValueError as exc:
+                error = f"⚠️ {exc}"
+
+    # Replies go out after the block has committed.
+    if error is not None:
+        sent = await message.answer(error)
+        await remember_message(state, sent.message_id)
+        return
+
+    sent = await message.answer(
+        f"✅ Статус обновлён: {new_status.value}.\n\n{render_deal_context()}"
+    )
+    await remember_message(state, sent.message_id)
+
+
+def _empty_listing_text(status_filter: str) -> str:
+    if status_filter == "all":
+        return "У вас пока нет сделок."
+    return f"В разделе «{FILTER_LABELS[status_filter]}» сделок нет."
+
+
+async def _render_deals_page(
+    state: FSMContext,
+    manager_id: int,
+    *,
+    status_filter: str,
+    cursor: Optional[DealCursor] = None,
+    backwards: bool = False,
+) -> tuple[str, InlineKeyboardMarkup]:
+    async with get_session(readonly=True) as session:
+        page = await list_deals_page(
+            session,
+            manager_id=manager_id,
+            status_filter=status_filter,
+            cursor=cursor,
+            backwards=backwards,
+        )
+
+    await state.update_data(
+        {
+            DEALS_LISTING_KEY: {
+                "filter": status_filter,
+                "first": page.first.to_state() if page.first else None,
+                "last": page.last.to_state() if page.last else None,
+            }
+        }
+    )
+
+    if page.items:
+        lines = [f"📂 Ваши сделки ({FILTER_LABELS[status_filter]}):"]
+        lines.extend(
+            f"• #{item.id} {item.client_name or 'без имени'} ({item.client_phone}) — {item.status}"
+            for item in page.items
+        )
+    else:
+        lines = [_empty_listing_text(status_filter)]
+    return "\n".join(lines), deals_page_keyboard(page, status_filter)
+
+
+async def list_manager_deals(message: Message, state: FSMContext, db: UpdateDb) -> None:
+    """Show the first page of the current manager's deals."""
+
+    await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
+    manager_id = (await db.manager()).id
+
+    text, keyboard = await _render_deals_page(state, manager_id, status_filter="all")
+    sent = await message.answer(text, reply_markup=keyboard)
+    await remember_message(state, sent.message_id)
+
+
+@router.callback_query(F.data.startswith(f"{CALLBACK_PREFIX}:"))
+async def paginate_deals(callback: CallbackQuery, state: FSMContext, db: UpdateDb) -> None:
+    """Move between pages or switch the status filter of the deal listing."""
+
+    listing = (await state.get_data()).get(DEALS_LISTING_KEY) or {}
+    action = (callback.data or "").split(":")[1:]
+    status_filter = listing.get("filter", "all")
+    cursor: Optional[DealCursor] = None
+    backwards = False
+
+    if action[:1] == ["filter"] and len(action) == 2 and action[1] in FILTER_LABELS:
+        status_filter = action[1]
+    elif action == ["next"] and listing.get("last"):
+        cursor = DealCursor.from_state(listing["last"])
+    elif action == ["prev"] and listing.get("first"):
+        cursor = DealCursor.from_state(listing["first"])
+        backwards = True
+
+    manager_id = (await db.manager()).id
+
+    text, keyboard = await _render_deals_page(
+        state, manager_id, status_filter=status_filter, cursor=cursor, backwards=backwards
+    )
+    if isinstance(callback.message, Message):
+        try:
+            await callback.message.edit_text(text, reply_markup=keyboard)
+        except TelegramBadRequest:
+            pass  # the page did not change
+    await callback.answer()
+
 
 @router.message(Command("upload_invoice"))
-async def upload_invoice(message: types.Message, ai: AIService | None = None):
+async def upload_invoice(message: types.Message, ai: AIAssistant | None = None):
     """Загрузка PDF-счета и анализ содержимого."""
     await message.answer("📄 Отправьте PDF-файл счета.")
     if not ai:
         return
 
-    if message.document and message.document.file_name.endswith(".pdf"):
+    if message.document and (message.document.file_name or "").endswith(".pdf"):
         await message.answer("🔍 Обрабатываю документ...")
         advice = await ai.summarize_invoice("Текст PDF распознан.")
         await message.answer(f"✅ Счёт загружен.\n💬 {advice}")
@@ -26,14 +390,27 @@ async def upload_invoice(message: types.Message, ai: AIService | None = None):
 
 
 @router.message(Command("change_status"))
-async def change_status(message: types.Message, ai: AIService | None = None):
+async def change_status(message: types.Message, ai: AIAssistant | None = None):
     """Изменение статуса сделки."""
     await message.answer("Введите новый статус сделки (например: 'оплачен', 'отменен').")
     if not ai:
         return
 
-    advice = await ai.get_advice(
+    advice = await ai.get_ai_advice(
         "Создай короткий совет менеджеру после смены статуса сделки, чтобы поддержать клиента."
     )
     await message.answer(f"💬 {advice}")
     await message.answer("✅ Статус обновлен. Возвращаюсь в главное меню.")
+
+
+__all__ = [
+    "handle_interaction",
+    "handle_status_change",
+    "list_manager_deals",
+    "open_deal",
+    "paginate_deals",
+    "render_deal_card",
+    "router",
+    "search_clients_by_text",
+    "select_deal_by_suffix",
+]
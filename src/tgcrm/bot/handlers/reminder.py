@@ -5,23 +5,25 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
 from tgcrm.bot.menu import render_main_menu
+from tgcrm.bot.middlewares import UpdateDb
 from tgcrm.bot.nlu_parser import extract_entities
-from tgcrm.bot.utils.history import delete_message_safe, purge_history, remember_message
+from tgcrm.bot.utils.ai_jobs import answer_in_background
+from tgcrm.bot.utils.history import purge_history, remember_message
 from tgcrm.db.models import Deal
 from tgcrm.db.session import get_session
-from tgcrm.services.ai_assistant import build_reminder_tip
-from tgcrm.services.deals import create_reminder, ensure_manager
+from tgcrm.services.ai_assistant import reminder_tip_context, stream_ai_advice
+from tgcrm.services.deals import create_reminder
 
-from .deal import _get_active_deal as _get_active_deal_id, _load_deal_for_manager
+from .deal import _get_active_deal as _get_active_deal_id
+from .deal import _load_deal_for_manager
 
 
-async def handle_reminder(message: Message, state: FSMContext) -> None:
+async def handle_reminder(message: Message, state: FSMContext, db: UpdateDb) -> None:
     entities = extract_entities(message.text or "")
     if entities.get("intent") != "set_reminder":
         return
 
-    await purge_history(message.bot, message.chat.id, state)
-    await delete_message_safe(message)
+    await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
 
     deal_id = await _get_active_deal_id(state)
     if not deal_id:
@@ -37,25 +39,28 @@ async def handle_reminder(message: Message, state: FSMContext) -> None:
         await remember_message(state, sent.message_id)
         return
 
+    manager = await db.manager()
     async with get_session() as session:
-        manager = await ensure_manager(session, message.from_user.id, name=message.from_user.full_name)
         deal: Deal | None = await _load_deal_for_manager(session, deal_id, manager)
-        if not deal:
-            sent = await message.answer("Сделка не найдена. Повторите поиск клиента.")
-            await remember_message(state, sent.message_id)
-            return
-        await create_reminder(session, deal, remind_at=remind_at)
+        if deal is not None:
+            await create_reminder(session, deal, remind_at=remind_at)
 
-    reminder_text = entities.get("reminder_text") or ""
-    tip = await build_reminder_tip(reminder_text)
+    if deal is None:
+        sent = await message.answer("Сделка не найдена. Повторите поиск клиента.")
+        await remember_message(state, sent.message_id)
+        return
 
-    response = (
-        "⏰ Напоминание создано.\n"
-        f"Совет: {tip}\n\n{render_main_menu()}"
-    )
-    sent = await message.answer(response)
+    sent = await message.answer(f"⏰ Напоминание создано.\n\n{render_main_menu()}")
     await remember_message(state, sent.message_id)
 
+    reminder_text = entities.get("reminder_text") or ""
+    answer_in_background(
+        message,
+        state,
+        stream_ai_advice(reminder_tip_context(reminder_text)),
+        prefix="💡 Совет: ",
+    )
+
 
 __all__ = ["handle_reminder"]
 
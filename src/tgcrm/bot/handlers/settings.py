@@ -9,27 +9,25 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
 from tgcrm.bot.menu import render_main_menu
+from tgcrm.bot.middlewares import UpdateDb
 from tgcrm.bot.states import BotStates
 from tgcrm.bot.utils.history import delete_message_safe, purge_history, remember_message
 from tgcrm.config import get_settings
 from tgcrm.db.session import get_session
-from tgcrm.services.deals import ensure_manager
-from tgcrm.services.settings import get_setting, set_setting
+from tgcrm.services.settings import set_setting, settings_cache
 
 router = Router()
 
 
 async def _fetch_password() -> str:
-    async with get_session() as session:
-        stored = await get_setting(session, "supervisor_password")
+    stored = await settings_cache.get("supervisor_password")
     if stored:
         return stored
     return get_settings().behaviour.supervisor_password
 
 
 async def _authorize(message: Message, state: FSMContext, *, context: str = "settings") -> None:
-    await purge_history(message.bot, message.chat.id, state)
-    await delete_message_safe(message)
+    await purge_history(message.bot, message.chat.id, state, also=(message.message_id,))
     await state.set_state(BotStates.settings_auth)
     await state.update_data({"auth_context": context})
     sent = await message.answer("Введите пароль для доступа")
@@ -46,7 +44,7 @@ async def open_settings_command(message: Message, state: FSMContext) -> None:
 
 
 @router.message(BotStates.settings_auth, F.text)
-async def check_password(message: Message, state: FSMContext) -> None:
+async def check_password(message: Message, state: FSMContext, db: UpdateDb) -> None:
     data = await state.get_data()
     password = await _fetch_password()
     if (message.text or "").strip() != password:
@@ -60,7 +58,7 @@ async def check_password(message: Message, state: FSMContext) -> None:
         await state.set_data(remaining)
         from tgcrm.bot.handlers.supervisor import send_overview  # local import to avoid cycle
 
-        await send_overview(message, state)
+        await send_overview(message, state, db)
         return
 
     await state.set_state(BotStates.settings_menu)
@@ -82,44 +80,41 @@ def _parse_range(text: str) -> tuple[str, str] | None:
     return match.group(1), match.group(2)
 
 
+def _parse_command(text: str) -> dict[str, str] | str:
+    """Map a settings command to the overrides it sets, or return the error to show."""
+
+    lowered = text.lower()
+    if lowered.startswith("рабочее время"):
+        parsed = _parse_range(text.split(" ", 2)[-1])
+        if not parsed:
+            return "Используйте формат HH:MM-HH:MM для рабочего времени."
+        return {"workday_start": parsed[0], "workday_end": parsed[1]}
+    if lowered.startswith("обед"):
+        parsed = _parse_range(text.split(" ", 1)[-1])
+        if not parsed:
+            return "Используйте формат HH:MM-HH:MM для обеда."
+        return {"lunch_start": parsed[0], "lunch_end": parsed[1]}
+    if lowered.startswith("openai"):
+        return {"openai_api_key": text.split(" ", 1)[-1].strip()}
+    if lowered.startswith("пароль"):
+        return {"supervisor_password": text.split(" ", 1)[-1].strip()}
+    return "Неизвестная команда. Попробуйте снова."
+
+
 @router.message(BotStates.settings_menu, F.text)
-async def apply_setting(message: Message, state: FSMContext) -> None:
+async def apply_setting(message: Message, state: FSMContext, db: UpdateDb) -> None:
     await delete_message_safe(message)
-    text = (message.text or "").strip()
-    lowered = text.lower()
+    await db.manager()
+
+    overrides = _parse_command((message.text or "").strip())
+    if isinstance(overrides, str):
+        sent = await message.answer(overrides)
+        await remember_message(state, sent.message_id)
+        return
 
     async with get_session() as session:
-        await ensure_manager(session, message.from_user.id, name=message.from_user.full_name)
-        if lowered.startswith("рабочее время"):
-            value = text.split(" ", 2)[-1]
-            parsed = _parse_range(value)
-            if not parsed:
-                sent = await message.answer("Используйте формат HH:MM-HH:MM для рабочего времени.")
-                await remember_message(state, sent.message_id)
-                return
-            start, end = parsed
-            await set_setting(session, "workday_start", start)
-            await set_setting(session, "workday_end", end)
-        elif lowered.startswith("обед"):
-            value = text.split(" ", 1)[-1]
-            parsed = _parse_range(value)
-            if not parsed:
-                sent = await message.answer("Используйте формат HH:MM-HH:MM для обеда.")
-                await remember_message(state, sent.message_id)
-                return
-            start, end = parsed
-            await set_setting(session, "lunch_start", start)
-            await set_setting(session, "lunch_end", end)
-        elif lowered.startswith("openai"):
-            token = text.split(" ", 1)[-1].strip()
-            await set_setting(session, "openai_api_key", token)
-        elif lowered.startswith("пароль"):
-            new_password = text.split(" ", 1)[-1].strip()
-            await set_setting(session, "supervisor_password", new_password)
-        else:
-            sent = await message.answer("Неизвестная команда. Попробуйте снова.")
-            await remember_message(state, sent.message_id)
-            return
+        for key, value in overrides.items():
+            await set_setting(session, key, value)
 
     sent = await message.answer(f"Настройка обновлена.\n\n{render_main_menu()}")
     await remember_message(state, sent.message_id)
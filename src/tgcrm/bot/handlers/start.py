@@ -19,7 +19,7 @@ async def handle_start(message: Message, ai=None) -> None:
 
     if ai:
         try:
-            advice = await ai.get_advice(
+            advice = await ai.get_ai_advice(
                 "Создай дружелюбное приветственное сообщение для менеджера CRM, который только начал работу с ботом."
             )
             await message.answer(f"{base_text}\n\n💡 {advice}")
@@ -7,16 +7,16 @@ from aiogram.types import Message
 from sqlalchemy import func, select
 
 from tgcrm.bot.menu import render_main_menu
+from tgcrm.bot.middlewares import UpdateDb
 from tgcrm.bot.states import BotStates
+from tgcrm.bot.utils.ai_jobs import answer_in_background
 from tgcrm.bot.utils.history import remember_message
 from tgcrm.db.models import Deal
 from tgcrm.db.session import get_session
-from tgcrm.services.ai_assistant import generate_supervisor_summary
-from tgcrm.services.deals import ensure_manager
+from tgcrm.services.ai_assistant import stream_ai_advice, supervisor_summary_context
 
 from .settings import _authorize
 
-
 router = Router()
 
 
@@ -24,9 +24,10 @@ async def start_supervisor_report(message: Message, state: FSMContext) -> None:
     await _authorize(message, state, context="supervisor")
 
 
-async def send_overview(message: Message, state: FSMContext) -> None:
-    async with get_session() as session:
-        await ensure_manager(session, message.from_user.id, name=message.from_user.full_name)
+async def send_overview(message: Message, state: FSMContext, db: UpdateDb) -> None:
+    await db.manager()
+
+    async with get_session(readonly=True) as session:
         query = select(
             Deal.status,
             func.count(Deal.id),
@@ -39,12 +40,19 @@ async def send_overview(message: Message, state: FSMContext) -> None:
         "total_deals": sum(row[1] for row in rows),
         "statuses": {status: {"count": count, "amount": float(total or 0)} for status, count, total in rows},
     }
-    analysis = await generate_supervisor_summary(snapshot)
-
-    lines = ["📈 AI-отчёт для руководителя", analysis, "", render_main_menu()]
-    sent = await message.answer("\n".join(lines))
+    sent = await message.answer(
+        "📈 Готовлю AI-отчёт для руководителя, пришлю его отдельным сообщением.\n\n"
+        f"{render_main_menu()}"
+    )
     await remember_message(state, sent.message_id)
     await state.set_state(BotStates.idle)
 
+    answer_in_background(
+        message,
+        state,
+        stream_ai_advice(supervisor_summary_context(snapshot), role="supervisor"),
+        prefix="📈 AI-отчёт для руководителя\n",
+    )
+
 
 __all__ = ["router", "send_overview", "start_supervisor_report"]
@@ -0,0 +1,46 @@
+"""Inline keyboard for the paginated deal listing."""
+from __future__ import annotations
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from tgcrm.services.deals import DealPage
+
+CALLBACK_PREFIX = "deals"
+
+FILTER_LABELS = {
+    "all": "Все",
+    "active": "В работе",
+    "new": "Новые",
+    "invoice_sent": "Счёт",
+    "payment_pending": "Ждут оплату",
+    "paid": "Оплачены",
+    "cancelled": "Отменены",
+    "long_term": "Долгосрочные",
+}
+
+
+def deals_page_keyboard(page: DealPage, active_filter: str) -> InlineKeyboardMarkup:
+    """Navigation row plus status filter buttons.
+
+    Callback data only carries the action; the cursors live in FSM data.
+    """
+
+    builder = InlineKeyboardBuilder()
+    navigation = 0
+    if page.has_prev:
+        builder.button(text="◀️ Назад", callback_data=f"{CALLBACK_PREFIX}:prev")
+        navigation += 1
+    if page.has_next:
+        builder.button(text="Вперёд ▶️", callback_data=f"{CALLBACK_PREFIX}:next")
+        navigation += 1
+    for key, label in FILTER_LABELS.items():
+        marker = "• " if key == active_filter else ""
+        builder.button(text=f"{marker}{label}", callback_data=f"{CALLBACK_PREFIX}:filter:{key}")
+
+    rows = [navigation] if navigation else []
+    builder.adjust(*rows, 2, 2, 2, 2)
+    return builder.as_markup()
+
+
+__all__ = ["CALLBACK_PREFIX", "FILTER_LABELS", "deals_page_keyboard"]
@@ -3,26 +3,56 @@
 """
 
 from __future__ import annotations
+
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
 
+from aiogram import Dispatcher
+
+from tgcrm.bot.bot_factory import create_bot, create_dispatcher, create_history_store
+from tgcrm.bot.handlers import assistant as assistant_handlers
+from tgcrm.bot.handlers import client as client_handlers
+from tgcrm.bot.handlers import deal as deal_handlers
+from tgcrm.bot.handlers import settings as settings_handlers
+from tgcrm.bot.handlers import start as start_handlers
+from tgcrm.bot.handlers import supervisor as supervisor_handlers
+from tgcrm.bot.utils.ai_jobs import get_ai_jobs
+from tgcrm.bot.utils.history import get_history_store, set_history_store, wait_for_deletes
+from tgcrm.bot.webhook import run_webhook
 from tgcrm.config import get_settings
 from tgcrm.logging import configure_logging
-from tgcrm.services.ai_assistant import AIService
-from tgcrm.bot.handlers import (
-    start as start_handlers,
-    client as client_handlers,
-    deal as deal_handlers,
-    reminder as reminder_handlers,
-    supervisor as supervisor_handlers,
-    settings as settings_handlers
+from tgcrm.services.ai_assistant import create_ai_assistant, set_ai_assistant
+from tgcrm.services.interaction_writer import get_interaction_writer
+from tgcrm.services.settings import (
+    close_redis_client,
+    start_invalidation_listener,
+    wait_for_publishes,
 )
 
 configure_logging()
 logger = logging.getLogger(__name__)
 
 
+async def on_startup(dispatcher: Dispatcher) -> None:
+    """Инициализация ChatGPT-сервиса и подписка на изменения настроек."""
+    assistant = await create_ai_assistant()
+    set_ai_assistant(assistant)
+    dispatcher["ai"] = assistant  # Контекстный доступ к AI в любом handler
+    start_invalidation_listener()
+    if get_settings().database.interactions_write_behind:
+        await get_interaction_writer().start()
+
+
+async def on_shutdown() -> None:
+    """Отменить фоновые AI-ответы, дописать буфер взаимодействий и дождаться удаления сообщений."""
+    await get_ai_jobs().close()
+    if get_settings().database.interactions_write_behind:
+        await get_interaction_writer().stop()
+    await wait_for_deletes()
+    await wait_for_publishes()
+    await close_redis_client()
+
+
 async def main() -> None:
     """Запуск Telegram-бота."""
     settings = get_settings()
@@ -30,23 +60,34 @@ async def main() -> None:
     if not settings.telegram.bot_token.strip():
         raise RuntimeError("❌ TELEGRAM_BOT_TOKEN не указан в .env")
 
-    bot = Bot(token=settings.telegram.bot_token, parse_mode=settings.telegram.parse_mode)
-    dp = Dispatcher()
+    bot = create_bot()
+    # Регистрация всех router’ов; assistant последним, он принимает любой текст
+    dp = create_dispatcher(
+        start_handlers.router,
+        settings_handlers.router,
+        client_handlers.router,
+        deal_handlers.router,
+        supervisor_handlers.router,
+        assistant_handlers.router,
+        concurrency=(
+            settings.telegram.update_concurrency if settings.telegram.mode == "polling" else None
+        ),
+    )
+    set_history_store(create_history_store())
 
-    # Инициализация ChatGPT-сервиса
-    ai = AIService(api_key=settings.openai.api_key, model=settings.openai.model)
-    dp["ai"] = ai  # Контекстный доступ к AI в любом handler
-
-    # Регистрация всех router’ов
-    dp.include_router(start_handlers.router)
-    dp.include_router(client_handlers.router)
-    dp.include_router(deal_handlers.router)
-    dp.include_router(reminder_handlers.router)
-    dp.include_router(supervisor_handlers.router)
-    dp.include_router(settings_handlers.router)
+    await on_startup(dp)
 
     logger.info("🚀 Бот запущен и готов к работе.")
-    await dp.start_polling(bot)
+    try:
+        if settings.telegram.mode == "webhook":
+            await run_webhook(dp, bot, settings.telegram)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await on_shutdown()
+        await dp.storage.close()
+        await get_history_store().close()
+        await bot.session.close()
 
 
 if __name__ == "__main__":
@@ -3,7 +3,7 @@ from __future__ import annotations
 
 MAIN_MENU_ITEMS = [
     "Добавить клиента (пришлите номер телефона)",
-    "Найти клиента (введите последние 4 цифры)",
+    "Найти клиента (последние 4 цифры или 'найди Иванов Алматы')",
     "Мои сделки",
     "Добавить напоминание",
     "Настройки",
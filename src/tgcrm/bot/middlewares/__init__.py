@@ -0,0 +1,11 @@
+"""Dispatcher middlewares."""
+from tgcrm.bot.middlewares.ai_jobs import AIJobsMiddleware
+from tgcrm.bot.middlewares.db_session import DbSessionMiddleware, UpdateDb
+from tgcrm.bot.middlewares.query_count import QueryCountMiddleware
+
+__all__ = [
+    "AIJobsMiddleware",
+    "DbSessionMiddleware",
+    "QueryCountMiddleware",
+    "UpdateDb",
+]
@@ -0,0 +1,35 @@
+"""Cancel a chat's pending AI reply when the manager moves on."""
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Chat, TelegramObject
+
+from tgcrm.bot.utils.ai_jobs import AIJobPool, get_ai_jobs
+
+
+class AIJobsMiddleware(BaseMiddleware):
+    """Cancel the background AI job of the chat an update comes from.
+
+    A tip for the previous action is stale once the manager sends something
+    new; a handler that wants another one submits a fresh job.
+    """
+
+    def __init__(self, pool: Optional[AIJobPool] = None) -> None:
+        self._pool = pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat: Optional[Chat] = data.get("event_chat")
+        bot = data.get("bot")
+        if chat is not None and bot is not None:
+            (self._pool or get_ai_jobs()).cancel(bot.id, chat.id)
+        return await handler(event, data)
+
+
+__all__ = ["AIJobsMiddleware"]
@@ -0,0 +1,67 @@
+"""One database session and one manager lookup per update."""
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from tgcrm.db.models import Manager
+from tgcrm.db.session import SessionScope, session_scope
+from tgcrm.services.deals import ensure_manager
+
+
+class UpdateDb:
+    """Handler-facing view of the update's :class:`SessionScope`.
+
+    Handlers receive it as the ``db`` argument. Nothing touches the database
+    until :meth:`session` or :meth:`manager` is awaited.
+    """
+
+    def __init__(self, scope: SessionScope, user: Optional[User]) -> None:
+        self.scope = scope
+        self.user = user
+        self._manager: Optional[Manager] = None
+
+    async def session(self) -> AsyncSession:
+        return await self.scope.session()
+
+    async def manager(self) -> Manager:
+        """Return the sender's manager row, creating it on first contact.
+
+        The lookup is committed at once, so no transaction stays open while
+        the handler talks to Telegram.
+        """
+
+        if self._manager is None:
+            if self.user is None:
+                raise LookupError("The update has no sender")
+            async with self.scope.block() as session:
+                self._manager = await ensure_manager(
+                    session, self.user.id, name=self.user.full_name
+                )
+        return self._manager
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Run each update inside :func:`~tgcrm.db.session.session_scope`.
+
+    Every ``get_session()`` during the update shares one lazily opened session.
+    Each ``get_session()`` block commits when it exits, so a reply sent after
+    the block reports work that is already committed, and the connection goes
+    back to the pool while the handler waits on Telegram or OpenAI.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with session_scope() as scope:
+            data["db"] = UpdateDb(scope, data.get("event_from_user"))
+            return await handler(event, data)
+
+
+__all__ = ["DbSessionMiddleware", "UpdateDb"]
@@ -0,0 +1,30 @@
+"""Per-update SQL statement counting."""
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from tgcrm.db.instrumentation import count_queries
+
+
+class QueryCountMiddleware(BaseMiddleware):
+    """Count the statements each update issues; see :func:`count_queries`.
+
+    Registered as an outer middleware on ``dispatcher.update`` so the count
+    covers filters and every handler the update passes through.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        unit = f"update:{event.event_type}" if isinstance(event, Update) else "update"
+        with count_queries(unit):
+            return await handler(event, data)
+
+
+__all__ = ["QueryCountMiddleware"]
@@ -1,10 +1,17 @@
-"""Natural language utilities for recognising manager intents."""
+"""Natural language utilities for recognising manager intents.
+
+A message is classified once: :func:`detect_intent` and :func:`extract_entities`
+share a memoized classification, so the handler calling both pays for one.
+Keywords are matched with one compiled alternation per intent, searched in
+``INTENT_KEYWORDS`` order; the first intent with any keyword in the text wins.
+``tests/data/nlu_corpus.tsv`` pins the accuracy of this on real manager phrases.
+"""
 from __future__ import annotations
 
 import re
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional
-
+from functools import lru_cache
+from typing import Dict, Optional, Pattern, Tuple
 
 INTENT_KEYWORDS = {
     "upload_invoice": ("pdf", "счёт", "счет", "инвойс", "документ"),
@@ -15,8 +22,16 @@ INTENT_KEYWORDS = {
     "settings": ("настрой", "token", "токен"),
     "main_menu": ("меню", "главное меню"),
     "list_deals": ("мои сделки", "список сделок"),
+    "search_client": ("найди", "найти", "поиск", "ищи"),
 }
 
+# A single pattern over all keywords would have to find every match to honour
+# the intent order, which CPython's ``re`` does slower than these short searches.
+_KEYWORD_PATTERNS: Tuple[Tuple[str, Pattern[str]], ...] = tuple(
+    (intent, re.compile("|".join(re.escape(keyword) for keyword in keywords)))
+    for intent, keywords in INTENT_KEYWORDS.items()
+)
+
 PHONE_PATTERN = re.compile(r"\+?7[\d\s\-()]{8,}")
 FOUR_DIGITS_PATTERN = re.compile(r"\b(\d{4})\b")
 STATUS_PATTERN = re.compile(
@@ -34,26 +49,39 @@ def _normalise(text: str) -> str:
     return text.strip().lower()
 
 
-def detect_intent(message_text: str) -> str:
+def _match_keywords(text: str) -> Optional[str]:
+    for intent, pattern in _KEYWORD_PATTERNS:
+        if pattern.search(text):
+            return intent
+    return None
+
+
+@lru_cache(maxsize=1024)
+def _classify(message_text: str) -> Tuple[str, str]:
+    """Return the intent and the normalised text of ``message_text``."""
+
     text = _normalise(message_text)
     if not text:
-        return "add_interaction"
+        return "add_interaction", text
 
     if PHONE_PATTERN.fullmatch(text.replace(" ", "")):
-        return "create_client"
+        return "create_client", text
 
-    digits_match = FOUR_DIGITS_PATTERN.findall(text)
-    if digits_match and len(text) <= 10:
-        return "search_deal_by_last4"
+    if len(text) <= 10 and FOUR_DIGITS_PATTERN.search(text):
+        return "search_deal_by_last4", text
 
-    for intent, keywords in INTENT_KEYWORDS.items():
-        if any(keyword in text for keyword in keywords):
-            return intent
+    intent = _match_keywords(text)
+    if intent is not None:
+        return intent, text
 
     if text.isdigit() and len(text) >= 4:
-        return "search_deal_by_last4"
+        return "search_deal_by_last4", text
 
-    return "add_interaction"
+    return "add_interaction", text
+
+
+def detect_intent(message_text: str) -> str:
+    return _classify(message_text)[0]
 
 
 def _parse_phone(text: str) -> Optional[str]:
@@ -93,8 +121,7 @@ def _parse_relative_time(text: str) -> Optional[datetime]:
 
 
 def extract_entities(message_text: str) -> Dict[str, object]:
-    intent = detect_intent(message_text)
-    text = _normalise(message_text)
+    intent, text = _classify(message_text)
 
     if intent == "create_client":
         phone = _parse_phone(message_text)
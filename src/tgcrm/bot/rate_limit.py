@@ -0,0 +1,411 @@
+"""Outbound rate limiting for Bot API sends.
+
+Telegram allows roughly 30 messages per second per bot, one per second in a
+private chat and 20 per minute in a group. :class:`SendLimiter` paces every
+``send*``/``copy*``/``forward*`` and ``editMessageText`` request made through a
+bot created by :func:`~tgcrm.bot.bot_factory.create_bot`:
+
+* each chat has its own pacing slot (``TELEGRAM_RATE_CHAT_INTERVAL`` seconds
+  apart, or ``60 / TELEGRAM_RATE_GROUP_PER_MINUTE`` for groups). Waiting for
+  it does not use up global capacity. Chat actions such as ``typing`` are
+  not paced per chat, so they never delay the reply they announce;
+* a global token bucket (``TELEGRAM_RATE_GLOBAL`` per second) is shared by
+  three priority lanes. A lower lane only takes a token when no higher lane
+  is waiting, so interactive replies overtake a reminder or proactive burst;
+* a ``429`` pauses the chat for ``retry_after`` seconds (or the whole bot when
+  the request has no chat) and the request is retried up to
+  ``TELEGRAM_SEND_MAX_RETRIES`` times.
+
+The lane is taken from :func:`send_priority`, a context manager around the
+code that sends, for example the body of a Celery task. The limiter keeps no
+loop-bound state, so one instance serves the bot and every ``asyncio.run`` of a
+Celery worker process.
+
+With ``TELEGRAM_RATE_SHARED=true`` (the default) the global bucket and the
+bot-wide ``429`` pause live in Redis (:class:`RedisTokenBucket`), so the bot
+and every Celery worker draw from one budget. Lanes still order the sends of
+each process. Across processes a lower lane takes a shared token only while
+the bucket holds more than its :data:`SHARED_RESERVE`, so a reminder burst in a
+worker leaves tokens for the bot's interactive replies. Per-chat pacing stays
+per process. If Redis cannot be reached, the limiter falls back to its
+in-process bucket.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendChatAction
+
+from tgcrm.db.instrumentation import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Text edits count too: a streamed answer edits its message about once a second.
+RATE_LIMITED_PREFIXES = ("Send", "Copy", "Forward", "EditMessageText")
+WAIT_BUCKETS_MS = (10, 100, 500, 1000, 2000, 5000, 10_000, 30_000, 60_000)
+# Chats whose pacing slot is in the past are forgotten once this many are tracked.
+_PRUNE_AT = 10_000
+BUCKET_KEY = "tgcrm:telegram:send_bucket"
+# Seconds the limiter stays on its local bucket after Redis failed.
+SHARED_RETRY_AFTER = 30.0
+
+# Refills the bucket from Redis' own clock and takes a token, leaving at least
+# ARGV[3] tokens behind. Returns how long to wait before trying again, as a
+# string because Lua numbers become integers.
+_TAKE_TOKEN = """
+local paused = redis.call('PTTL', KEYS[2])
+if paused > 0 then
+    return tostring(paused / 1000)
+end
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or capacity
+local at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - at) * rate)
+local wait = 0
+if tokens >= 1 + reserve then
+    tokens = tokens - 1
+else
+    wait = (1 + reserve - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class SendPriority(IntEnum):
+    INTERACTIVE = 0
+    REMINDER = 1
+    PROACTIVE = 2
+
+
+# Share of the shared bucket each lane leaves to the lanes above it.
+SHARED_RESERVE = {
+    SendPriority.INTERACTIVE: 0.0,
+    SendPriority.REMINDER: 0.25,
+    SendPriority.PROACTIVE: 0.5,
+}
+
+_current_priority: ContextVar[SendPriority] = ContextVar(
+    "tgcrm_send_priority", default=SendPriority.INTERACTIVE
+)
+
+
+@contextmanager
+def send_priority(priority: SendPriority) -> Iterator[None]:
+    """Send everything inside the block in the ``priority`` lane."""
+
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class SendMetrics:
+    """Per-lane counters and the time requests waited for their slot."""
+
+    def __init__(self) -> None:
+        self.sent: Dict[str, int] = {lane.name.lower(): 0 for lane in SendPriority}
+        self.waiting: Dict[str, int] = {lane.name.lower(): 0 for lane in SendPriority}
+        self.retried = 0
+        self.failed = 0
+        self.wait_times = LatencyHistogram(WAIT_BUCKETS_MS)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "sent": dict(self.sent),
+            "waiting": dict(self.waiting),
+            "retried": self.retried,
+            "failed": self.failed,
+            "wait_ms": self.wait_times.snapshot(),
+        }
+
+
+ChatId = Union[int, str]
+
+
+def _is_group(chat_id: ChatId) -> bool:
+    # Groups, supergroups and channels have negative ids or an @username.
+    return isinstance(chat_id, str) or chat_id < 0
+
+
+class RedisTokenBucket:
+    """A token bucket kept in Redis and shared by every process that sends.
+
+    Tokens are taken by a Lua script, atomically and against the Redis clock,
+    so processes on different hosts agree on the refill. ``client_factory``
+    builds a ``redis.asyncio`` client; the client is rebuilt when the event
+    loop changes, because Celery runs every task in a fresh loop.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        *,
+        rate: float,
+        key: str = BUCKET_KEY,
+    ) -> None:
+        self.rate = rate
+        # A one-second burst at most, so a quiet period cannot bank a flood.
+        self.capacity = max(1.0, rate)
+        self.key = key
+        self._client_factory = client_factory
+        self._client: Any = None
+        self._script: Any = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_url(cls, url: str, *, rate: float) -> "RedisTokenBucket":
+        from redis import asyncio as aioredis
+
+        return cls(
+            lambda: aioredis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0),
+            rate=rate,
+        )
+
+    def _redis(self) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = self._client_factory()
+            self._script = self._client.register_script(_TAKE_TOKEN)
+            self._loop = loop
+        return self._client
+
+    async def take(self, reserve: float = 0.0) -> float:
+        """Take a token unless fewer than ``reserve`` would be left.
+
+        Returns 0, or the seconds to wait before trying again.
+        """
+
+        self._redis()
+        keys = [self.key, f"{self.key}:paused"]
+        # Never reserve the whole bucket, or the lane could not send at all.
+        reserve = min(reserve, self.capacity - 1)
+        wait = await self._script(keys=keys, args=[self.rate, self.capacity, reserve])
+        return float(wait)
+
+    async def pause(self, seconds: float) -> None:
+        """Hold back every process for ``seconds``."""
+
+        await self._redis().set(f"{self.key}:paused", 1, px=max(1, int(seconds * 1000)))
+
+
+class SendLimiter:
+    """Global token bucket with priority lanes plus per-chat pacing."""
+
+    def __init__(
+        self,
+        *,
+        global_rate: float,
+        chat_interval: float,
+        group_interval: float,
+        shared_bucket: Optional[RedisTokenBucket] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.shared_bucket = shared_bucket
+        self._clock = clock
+        # A one-second burst at most, so a quiet period cannot bank a flood.
+        self._capacity = max(1.0, global_rate)
+        self._tokens = self._capacity
+        self._refilled_at = clock()
+        self._paused_until = 0.0
+        self._shared_retry_at = 0.0
+        self._chat_next_free: Dict[ChatId, float] = {}
+        self._waiting = {lane: 0 for lane in SendPriority}
+        self.metrics = SendMetrics()
+
+    async def acquire(
+        self, chat_id: Optional[ChatId], priority: SendPriority, *, pace_chat: bool = True
+    ) -> None:
+        lane = priority.name.lower()
+        started = self._clock()
+        self.metrics.waiting[lane] += 1
+        try:
+            if chat_id is not None and pace_chat:
+                await self._wait_for_chat(chat_id)
+            await self._wait_for_token(priority)
+        finally:
+            self.metrics.waiting[lane] -= 1
+        self.metrics.wait_times.observe(lane, (self._clock() - started) * 1000)
+
+    def pause(self, chat_id: Optional[ChatId], seconds: float) -> None:
+        """Hold back ``chat_id`` (or every chat, when ``None``) for ``seconds``."""
+
+        until = self._clock() + seconds
+        if chat_id is None:
+            self._paused_until = max(self._paused_until, until)
+        else:
+            self._chat_next_free[chat_id] = max(self._chat_next_free.get(chat_id, 0.0), until)
+
+    async def _wait_for_chat(self, chat_id: ChatId) -> None:
+        # Reserve the chat's next free slot up front: concurrent sends to one chat
+        # queue behind each other in call order.
+        now = self._clock()
+        interval = self.group_interval if _is_group(chat_id) else self.chat_interval
+        slot = max(now, self._chat_next_free.get(chat_id, 0.0))
+        self._chat_next_free[chat_id] = slot + interval
+        if len(self._chat_next_free) > _PRUNE_AT:
+            self._prune(now)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _wait_for_token(self, priority: SendPriority) -> None:
+        self._waiting[priority] += 1
+        try:
+            while True:
+                now = self._clock()
+                self._refill(now)
+                higher_waiting = any(
+                    self._waiting[lane] for lane in SendPriority if lane < priority
+                )
+                if now >= self._paused_until and not higher_waiting:
+                    shared_wait = await self._take_shared_token(priority)
+                    if shared_wait is not None:
+                        if shared_wait == 0:
+                            return
+                        await asyncio.sleep(shared_wait)
+                        continue
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.global_rate)
+                # Behind a higher lane, poll at token pace until it has drained.
+                await asyncio.sleep(max(delay, 1 / self.global_rate))
+        finally:
+            self._waiting[priority] -= 1
+
+    async def pause_everywhere(self, seconds: float) -> None:
+        """Pause the whole bot here and, through the shared bucket, in every process."""
+
+        self.pause(None, seconds)
+        if self.shared_bucket is None or self._clock() < self._shared_retry_at:
+            return
+        try:
+            await self.shared_bucket.pause(seconds)
+        except Exception as exc:
+            self._shared_failed(exc)
+
+    async def _take_shared_token(self, priority: SendPriority) -> Optional[float]:
+        """Wait reported by the shared bucket, or ``None`` to use the local one."""
+
+        if self.shared_bucket is None or self._clock() < self._shared_retry_at:
+            return None
+        try:
+            return await self.shared_bucket.take(
+                SHARED_RESERVE[priority] * self.shared_bucket.capacity
+            )
+        except Exception as exc:
+            self._shared_failed(exc)
+            return None
+
+    def _shared_failed(self, exc: Exception) -> None:
+        # Do not pay a Redis timeout on every send while it is down.
+        self._shared_retry_at = self._clock() + SHARED_RETRY_AFTER
+        logger.warning(
+            "Shared send bucket unavailable for %ss, limiting per process: %s",
+            SHARED_RETRY_AFTER,
+            exc,
+        )
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._tokens = min(self._capacity, self._tokens + elapsed * self.global_rate)
+
+    def _prune(self, now: float) -> None:
+        for chat_id in [key for key, free in self._chat_next_free.items() if free < now]:
+            del self._chat_next_free[chat_id]
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Bot session middleware that routes sends through a :class:`SendLimiter`."""
+
+    def __init__(self, limiter: SendLimiter, *, max_retries: int) -> None:
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    async def __call__(self, make_request, bot, method):  # type: ignore[override]
+        if not type(method).__name__.startswith(RATE_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        # A chat action announces the reply that follows; it must not take the reply's slot.
+        pace_chat = not isinstance(method, SendChatAction)
+        priority = _current_priority.get()
+        metrics = self.limiter.metrics
+        retries = 0
+        while True:
+            await self.limiter.acquire(chat_id, priority, pace_chat=pace_chat)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                if retries >= self.max_retries:
+                    metrics.failed += 1
+                    raise
+                retries += 1
+                metrics.retried += 1
+                logger.warning(
+                    "Flood control on %s, retrying in %ss", type(method).__name__, exc.retry_after
+                )
+                if chat_id is None:
+                    await self.limiter.pause_everywhere(exc.retry_after)
+                else:
+                    self.limiter.pause(chat_id, exc.retry_after)
+                continue
+            metrics.sent[priority.name.lower()] += 1
+            return response
+
+
+_limiter: Optional[SendLimiter] = None
+
+
+def get_send_limiter() -> SendLimiter:
+    """Return the process-wide limiter, configured from settings on first use."""
+
+    global _limiter
+    if _limiter is None:
+        from tgcrm.config import get_settings
+
+        settings = get_settings()
+        telegram = settings.telegram
+        shared_bucket = None
+        if telegram.rate_shared:
+            shared_bucket = RedisTokenBucket.from_url(
+                settings.redis.dsn, rate=telegram.rate_global_per_second
+            )
+        _limiter = SendLimiter(
+            global_rate=telegram.rate_global_per_second,
+            chat_interval=telegram.rate_chat_interval,
+            group_interval=60 / telegram.rate_group_per_minute,
+            shared_bucket=shared_bucket,
+        )
+    return _limiter
+
+
+__all__ = [
+    "SHARED_RESERVE",
+    "RateLimitMiddleware",
+    "RedisTokenBucket",
+    "SendLimiter",
+    "SendMetrics",
+    "SendPriority",
+    "get_send_limiter",
+    "send_priority",
+]
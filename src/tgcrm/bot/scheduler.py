@@ -0,0 +1,283 @@
+"""Per-chat ordered, cross-chat concurrent processing of updates.
+
+Two front ends share the same rules and :class:`SchedulerMetrics`:
+:class:`ChatScheduler` owns a queue and its workers (webhook mode), and
+:class:`ChatEventIsolation` gates the tasks that aiogram's polling loop spawns
+per update.
+
+Updates are grouped by chat. At most one update of a chat is processed at a
+time and in arrival order, so FSM transitions of one conversation never
+interleave. Different chats are processed concurrently by up to ``workers``
+tasks (``TELEGRAM_UPDATE_CONCURRENCY``), so one slow OpenAI call only delays
+its own chat.
+
+A chat with queued updates sits in the ready queue once. A worker takes it,
+processes its oldest update and puts the chat back at the end of the ready
+queue if more updates arrived meanwhile, so a chatty manager cannot starve the
+others.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+from aiogram.types import Update
+
+from tgcrm.db.instrumentation import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update: Update) -> Hashable:
+    """Return the ordering key of ``update``: its chat, its sender, or the update itself."""
+
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        # Callback queries carry the chat on the message they belong to.
+        chat = getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return ("update", update.update_id)
+
+
+WAIT_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10_000, 30_000)
+
+
+class SchedulerMetrics:
+    """Queue depth and queueing delay of updates.
+
+    ``waiting`` counts updates queued behind their chat or behind the
+    concurrency limit, ``running`` those being handled. Wait times (arrival to
+    the start of handling) are kept per update type.
+    """
+
+    def __init__(self) -> None:
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_waiting = 0
+        self._depth: Dict[Hashable, int] = {}
+        self.wait_times = LatencyHistogram(WAIT_BUCKETS_MS)
+
+    def enqueued(self, key: Hashable) -> float:
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        self._depth[key] = self._depth.get(key, 0) + 1
+        return time.perf_counter()
+
+    def started(self, key: Hashable, event_type: str, enqueued_at: float) -> None:
+        self._leave_queue(key)
+        self.running += 1
+        self.wait_times.observe(event_type, (time.perf_counter() - enqueued_at) * 1000)
+
+    def abandoned(self, key: Hashable) -> None:
+        """An update stopped waiting without being handled (its task was cancelled)."""
+
+        self._leave_queue(key)
+
+    def _leave_queue(self, key: Hashable) -> None:
+        self.waiting -= 1
+        depth = self._depth[key] - 1
+        if depth:
+            self._depth[key] = depth
+        else:
+            del self._depth[key]
+
+    def finished(self, *, failed: bool = False) -> None:
+        self.running -= 1
+        self.processed += 1
+        if failed:
+            self.failed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "processed": self.processed,
+            "failed": self.failed,
+            "max_waiting": self.max_waiting,
+            "chats_waiting": len(self._depth),
+            "deepest_chat_queue": max(self._depth.values(), default=0),
+            "wait_ms": self.wait_times.snapshot(),
+        }
+
+
+class SchedulerFull(RuntimeError):
+    """More than ``max_pending`` updates are waiting."""
+
+
+class ChatScheduler:
+    """Run ``process(update)`` per chat in order, across chats concurrently."""
+
+    def __init__(
+        self,
+        process: Callable[[Update], Awaitable[Any]],
+        *,
+        workers: int,
+        max_pending: int = 10_000,
+        metrics: Optional[SchedulerMetrics] = None,
+    ) -> None:
+        self._process = process
+        self.workers = workers
+        self.max_pending = max_pending
+        self.metrics = metrics or SchedulerMetrics()
+        self._pending: Dict[Hashable, Deque[Tuple[Update, float]]] = {}
+        self._ready: "asyncio.Queue[Hashable]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task[None]] = []
+        self._idle: Optional[asyncio.Event] = None
+        self.queued = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"chat-scheduler-{index}")
+            for index in range(self.workers)
+        ]
+
+    async def stop(self, *, drain: bool = True) -> None:
+        """Stop the workers, by default after everything queued has been processed."""
+
+        if not self._tasks:
+            return
+        if drain and self._idle is not None:
+            await self._idle.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, update: Update) -> None:
+        """Queue ``update`` behind the earlier updates of its chat."""
+
+        if self.queued >= self.max_pending:
+            raise SchedulerFull(f"{self.queued} updates are already waiting")
+        key = chat_key(update)
+        entry = (update, self.metrics.enqueued(key))
+        queue = self._pending.get(key)
+        if queue is None:
+            self._pending[key] = deque([entry])
+            self._ready.put_nowait(key)
+        else:
+            # The chat is already queued or being processed; its worker picks this up.
+            queue.append(entry)
+        self.queued += 1
+        assert self._idle is not None, "ChatScheduler.start() was not awaited"
+        self._idle.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            update, enqueued_at = queue[0]
+            self.metrics.started(key, update.event_type, enqueued_at)
+            failed = False
+            try:
+                await self._process(update)
+            except Exception:
+                failed = True
+                logger.exception("Update %s failed", update.update_id)
+            finally:
+                self.metrics.finished(failed=failed)
+                queue.popleft()
+                self.queued -= 1
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                    if not self._pending and self._idle is not None:
+                        self._idle.set()
+
+
+update_metrics = SchedulerMetrics()
+
+
+class ChatEventIsolation(BaseEventIsolation):
+    """Serialise polled updates per chat and cap how many chats are handled at once.
+
+    Passed to the :class:`~aiogram.Dispatcher` as ``events_isolation``, so
+    aiogram's FSM middleware takes this lock before it loads the chat's state:
+    an update sees the state its chat's previous update left behind. Meant for
+    polling with ``handle_as_tasks=True``, where aiogram spawns one task per
+    update in arrival order. Each task first waits for its chat's lock, which
+    is FIFO, and then for one of ``concurrency`` slots, so a chat queued behind
+    its own previous update does not hold a slot. Updates without a chat or a
+    sender have no FSM context and are not isolated.
+    """
+
+    # aiogram reports the key only, so polled wait times are kept under one tag.
+    EVENT_TYPE = "update"
+
+    def __init__(self, concurrency: int, *, metrics: Optional[SchedulerMetrics] = None) -> None:
+        self.metrics = metrics or update_metrics
+        self._slots = asyncio.Semaphore(concurrency)
+        # Lock and number of updates holding or waiting for it, per chat.
+        self._chats: Dict[Hashable, Tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncIterator[None]:
+        chat = ("chat", key.bot_id, key.chat_id)
+        lock, users = self._chats.get(chat, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._chats[chat] = (lock, users + 1)
+        enqueued_at = self.metrics.enqueued(chat)
+        started = False
+        try:
+            async with lock, self._slots:
+                self.metrics.started(chat, self.EVENT_TYPE, enqueued_at)
+                started = True
+                failed = True
+                try:
+                    yield
+                    failed = False
+                finally:
+                    self.metrics.finished(failed=failed)
+        finally:
+            if not started:
+                self.metrics.abandoned(chat)
+            lock, users = self._chats[chat]
+            if users == 1:
+                del self._chats[chat]
+            else:
+                self._chats[chat] = (lock, users - 1)
+
+    async def close(self) -> None:
+        self._chats.clear()
+
+
+__all__ = [
+    "ChatEventIsolation",
+    "ChatScheduler",
+    "SchedulerFull",
+    "SchedulerMetrics",
+    "chat_key",
+    "update_metrics",
+]
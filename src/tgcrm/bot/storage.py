@@ -0,0 +1,115 @@
+"""Redis FSM storage with msgpack-encoded data and a sliding TTL.
+
+Each chat/user pair owns two keys:
+
+* ``<prefix>:<chat_id>:<user_id>:state``: a plain string with the state name;
+* ``<prefix>:<chat_id>:<user_id>:data``: a hash with one msgpack-encoded field
+  per top-level data key.
+
+Keeping data fields separate lets :meth:`MsgpackRedisStorage.update_data` write
+only the keys it changes and read the merged result back in the same
+``MULTI``, so an update is one round-trip with no read-modify-write race
+between bot processes. Every write refreshes the TTL of both keys in the same
+``MULTI``, so the state of an active conversation never expires before its
+data, and conversations that go quiet expire instead of accumulating.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Mapping, Optional
+
+import msgpack
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.redis import DefaultKeyBuilder, KeyBuilder
+from redis.asyncio import Redis
+
+DEFAULT_PREFIX = "tgcrm:fsm"
+
+
+def pack(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def unpack(raw: bytes) -> Any:
+    return msgpack.unpackb(raw, raw=False)
+
+
+def _decode_field(name: Any) -> str:
+    return name.decode() if isinstance(name, bytes) else name
+
+
+class MsgpackRedisStorage(BaseStorage):
+    """FSM storage shared by every bot process through Redis."""
+
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        ttl: Optional[int] = None,
+        key_builder: Optional[KeyBuilder] = None,
+    ) -> None:
+        self.redis = redis
+        self.ttl_ms = ttl * 1000 if ttl else None
+        self.key_builder = key_builder or DefaultKeyBuilder(prefix=DEFAULT_PREFIX)
+
+    @classmethod
+    def from_url(cls, url: str, *, ttl: Optional[int] = None) -> "MsgpackRedisStorage":
+        return cls(Redis.from_url(url), ttl=ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        redis_key = self.key_builder.build(key, "state")
+        value = state.state if isinstance(state, State) else state
+        pipe = self.redis.pipeline(transaction=True)
+        # ``State()`` without a name resets the state, like ``None``.
+        if value is None:
+            pipe.delete(redis_key)
+        else:
+            pipe.set(redis_key, value)
+        self._refresh_ttl(pipe, key)
+        await pipe.execute()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        value = await self.redis.get(self.key_builder.build(key, "state"))
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        redis_key = self.key_builder.build(key, "data")
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(redis_key)
+        if data:
+            pipe.hset(redis_key, mapping={name: pack(value) for name, value in data.items()})
+        self._refresh_ttl(pipe, key)
+        await pipe.execute()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        raw = await self.redis.hgetall(self.key_builder.build(key, "data"))
+        return {_decode_field(name): unpack(value) for name, value in raw.items()}
+
+    async def get_value(
+        self, storage_key: StorageKey, dict_key: str, default: Optional[Any] = None
+    ) -> Optional[Any]:
+        raw = await self.redis.hget(self.key_builder.build(storage_key, "data"), dict_key)
+        return default if raw is None else unpack(raw)
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        if not data:
+            return await self.get_data(key)
+        redis_key = self.key_builder.build(key, "data")
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(redis_key, mapping={name: pack(value) for name, value in data.items()})
+        self._refresh_ttl(pipe, key)
+        pipe.hgetall(redis_key)
+        results = await pipe.execute()
+        return {_decode_field(name): unpack(value) for name, value in results[-1].items()}
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+    def _refresh_ttl(self, pipe: Any, key: StorageKey) -> None:
+        # PEXPIRE on a missing key is a no-op, so a deleted key stays deleted.
+        if self.ttl_ms:
+            pipe.pexpire(self.key_builder.build(key, "state"), self.ttl_ms)
+            pipe.pexpire(self.key_builder.build(key, "data"), self.ttl_ms)
+
+
+__all__ = ["DEFAULT_PREFIX", "MsgpackRedisStorage", "pack", "unpack"]
@@ -0,0 +1,140 @@
+"""AI replies generated in the background, after the handler has answered."""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+from typing import AsyncIterable, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+from aiogram.utils.chat_action import ChatActionSender
+
+from tgcrm.bot.utils.history import remember_message
+from tgcrm.bot.utils.streaming import answer_streaming
+
+logger = logging.getLogger(__name__)
+
+JobKey = Tuple[int, int]
+
+
+class AIJobPool:
+    """Run at most ``concurrency`` AI jobs at once, one per chat.
+
+    A job shows ``typing`` in its chat from the moment it is submitted, also
+    while it waits for a slot. Submitting a job for a chat cancels the job
+    that chat already has; so does :meth:`cancel`, which
+    :class:`~tgcrm.bot.middlewares.AIJobsMiddleware` calls for every new
+    update.
+    """
+
+    def __init__(self, concurrency: int) -> None:
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._jobs: Dict[JobKey, "asyncio.Task[None]"] = {}
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def submit(
+        self, bot: Bot, chat_id: int, job: Callable[[], Awaitable[None]]
+    ) -> "asyncio.Task[None]":
+        key = (bot.id, chat_id)
+        self.cancel(bot.id, chat_id)
+        # The job outlives the update: start it without the update's context
+        # variables, such as its database session scope.
+        task = contextvars.Context().run(asyncio.create_task, self._run(bot, chat_id, job))
+        self._jobs[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    def cancel(self, bot_id: int, chat_id: int) -> bool:
+        task = self._jobs.get((bot_id, chat_id))
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def close(self) -> None:
+        """Cancel every job and wait for them to finish."""
+
+        tasks = list(self._jobs.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, bot: Bot, chat_id: int, job: Callable[[], Awaitable[None]]) -> None:
+        try:
+            async with ChatActionSender.typing(bot=bot, chat_id=chat_id):
+                async with self._slots:
+                    await job()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            logger.exception("AI job for chat %s failed", chat_id)
+        else:
+            self.completed += 1
+
+    def _forget(self, key: JobKey, task: "asyncio.Task[None]") -> None:
+        if self._jobs.get(key) is task:
+            del self._jobs[key]
+
+
+_pool: Optional[AIJobPool] = None
+
+
+def get_ai_jobs() -> AIJobPool:
+    """Return the process-wide pool, sized by ``OPENAI_MAX_CONCURRENCY`` on first use."""
+
+    global _pool
+    if _pool is None:
+        from tgcrm.config import get_settings
+
+        _pool = AIJobPool(get_settings().openai.max_concurrency)
+    return _pool
+
+
+def answer_in_background(
+    message: Message,
+    state: FSMContext,
+    chunks: AsyncIterable[str],
+    *,
+    prefix: str = "",
+    suffix: str = "",
+    on_answer: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> "asyncio.Task[None]":
+    """Post ``prefix + answer + suffix`` as a follow-up once ``chunks`` start arriving.
+
+    The handler returns immediately. The reply is streamed with
+    :func:`~tgcrm.bot.utils.streaming.answer_streaming` and remembered for
+    the next history purge. If the job is cancelled, its partial reply is deleted.
+    ``on_answer`` receives the delivered answer, for example to store it; it
+    runs outside the update, so it opens its own sessions.
+    """
+
+    bot = message.bot
+    if bot is None:
+        raise RuntimeError("The message is not bound to a bot")
+
+    async def job() -> None:
+        try:
+            sent, answer = await answer_streaming(message, chunks, prefix=prefix, suffix=suffix)
+        except TelegramAPIError as exc:
+            logger.warning("Could not deliver AI reply to chat %s: %s", message.chat.id, exc)
+            return
+        await remember_message(state, sent.message_id)
+        if on_answer is not None:
+            await on_answer(answer)
+
+    return get_ai_jobs().submit(bot, message.chat.id, job)
+
+
+__all__ = ["AIJobPool", "answer_in_background", "get_ai_jobs"]
@@ -1,33 +1,186 @@
-"""Utilities for managing bot message history."""
+"""Utilities for managing bot message history.
+
+The ids of the bot's recent messages in a chat live in a :class:`HistoryStore`,
+a fixed-size ring buffer per chat kept apart from the FSM data. Remembering a
+message is one atomic append (no read-modify-write of the FSM payload), and
+purging takes the whole buffer in one step, so concurrent replies in a chat
+cannot drop each other's ids.
+"""
 from __future__ import annotations
 
-from typing import Iterable, List
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.types import Message
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+HISTORY_LIMIT = 20
+HISTORY_PREFIX = "tgcrm:history"
+# Bot API limit of message ids per deleteMessages call.
+DELETE_BATCH_SIZE = 100
+
+_pending_deletes: Set["asyncio.Task[None]"] = set()
+
+
+class HistoryStore(ABC):
+    """Ring buffer of the last ``limit`` bot message ids per chat."""
+
+    limit: int = HISTORY_LIMIT
+
+    @abstractmethod
+    async def push(self, key: StorageKey, message_id: int) -> None:
+        """Remember ``message_id``, dropping the oldest id beyond ``limit``."""
+
+    @abstractmethod
+    async def pop_all(self, key: StorageKey) -> List[int]:
+        """Return the remembered ids, oldest first, and forget them."""
+
+    async def close(self) -> None:
+        return None
+
+
+class MemoryHistoryStore(HistoryStore):
+    """Per-process history; the default, matching ``FSM_STORAGE=memory``."""
+
+    def __init__(self, *, limit: int = HISTORY_LIMIT) -> None:
+        self.limit = limit
+        self._chats: Dict[Tuple[int, int], Deque[int]] = {}
+
+    async def push(self, key: StorageKey, message_id: int) -> None:
+        chat = (key.bot_id, key.chat_id)
+        history = self._chats.get(chat)
+        if history is None:
+            history = self._chats[chat] = deque(maxlen=self.limit)
+        history.append(message_id)
+
+    async def pop_all(self, key: StorageKey) -> List[int]:
+        return list(self._chats.pop((key.bot_id, key.chat_id), ()))
+
+
+class RedisHistoryStore(HistoryStore):
+    """History shared by bot processes: one Redis list per chat, newest id first.
+
+    ``push`` is ``LPUSH`` + ``LTRIM`` (+ ``EXPIRE``) in one ``MULTI`` and
+    ``pop_all`` is ``LRANGE`` + ``DEL`` in another, one round-trip each.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        limit: int = HISTORY_LIMIT,
+        ttl: Optional[int] = None,
+        prefix: str = HISTORY_PREFIX,
+    ) -> None:
+        self.redis = redis
+        self.limit = limit
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, *, ttl: Optional[int] = None) -> "RedisHistoryStore":
+        return cls(Redis.from_url(url), ttl=ttl)
+
+    def _key(self, key: StorageKey) -> str:
+        return f"{self.prefix}:{key.bot_id}:{key.chat_id}"
+
+    async def push(self, key: StorageKey, message_id: int) -> None:
+        redis_key = self._key(key)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.lpush(redis_key, message_id)
+        pipe.ltrim(redis_key, 0, self.limit - 1)
+        if self.ttl:
+            pipe.expire(redis_key, self.ttl)
+        await pipe.execute()
+
+    async def pop_all(self, key: StorageKey) -> List[int]:
+        redis_key = self._key(key)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.lrange(redis_key, 0, -1)
+        pipe.delete(redis_key)
+        newest_first, _ = await pipe.execute()
+        return [int(message_id) for message_id in reversed(newest_first)]
 
+    async def close(self) -> None:
+        await self.redis.aclose()
 
-HISTORY_KEY = "sent_messages"
+
+_store: HistoryStore = MemoryHistoryStore()
+
+
+def get_history_store() -> HistoryStore:
+    return _store
+
+
+def set_history_store(store: HistoryStore) -> None:
+    global _store
+    _store = store
 
 
 async def remember_message(state: FSMContext, message_id: int) -> None:
-    data = await state.get_data()
-    history: List[int] = list(data.get(HISTORY_KEY, []))
-    history.append(message_id)
-    await state.update_data({HISTORY_KEY: history[-20:]})
+    await _store.push(state.key, message_id)
+
+
+async def purge_history(
+    bot: Bot, chat_id: int, state: FSMContext, *, also: Iterable[int] = ()
+) -> None:
+    """Forget the remembered messages and delete them, plus ``also``, in the background.
+
+    The reply does not wait for Telegram: the deletion runs as a separate task,
+    see :func:`wait_for_deletes`.
+    """
+
+    message_ids = [*await _store.pop_all(state.key), *also]
+    if message_ids:
+        task = asyncio.create_task(_delete_in_background(bot, chat_id, message_ids))
+        _pending_deletes.add(task)
+        task.add_done_callback(_pending_deletes.discard)
+
+
+async def delete_messages(bot: Bot, chat_id: int, message_ids: Sequence[int]) -> None:
+    """Delete ``message_ids`` with one ``deleteMessages`` call per 100 ids.
 
+    A batch Telegram rejects (for example, when the API is older than 7.0) is
+    retried message by message, concurrently; messages that cannot be deleted
+    are skipped.
+    """
 
-async def purge_history(bot: Bot, chat_id: int, state: FSMContext) -> None:
-    data = await state.get_data()
-    history: Iterable[int] = data.get(HISTORY_KEY, [])
-    for message_id in history:
+    for start in range(0, len(message_ids), DELETE_BATCH_SIZE):
+        batch = list(message_ids[start : start + DELETE_BATCH_SIZE])
         try:
-            await bot.delete_message(chat_id, message_id)
+            await bot.delete_messages(chat_id, batch)
         except TelegramBadRequest:
-            continue
-    await state.update_data({HISTORY_KEY: []})
+            await asyncio.gather(*(_delete_one(bot, chat_id, message_id) for message_id in batch))
+
+
+async def wait_for_deletes() -> None:
+    """Wait until the background deletions started by :func:`purge_history` finish."""
+
+    if _pending_deletes:
+        await asyncio.gather(*_pending_deletes, return_exceptions=True)
+
+
+async def _delete_in_background(bot: Bot, chat_id: int, message_ids: Sequence[int]) -> None:
+    try:
+        await delete_messages(bot, chat_id, message_ids)
+    except TelegramAPIError as exc:
+        logger.warning("Could not purge chat %s history: %s", chat_id, exc)
+
+
+async def _delete_one(bot: Bot, chat_id: int, message_id: int) -> None:
+    try:
+        await bot.delete_message(chat_id, message_id)
+    except TelegramBadRequest:
+        return
 
 
 async def delete_previous(bot: Bot, chat_id: int, message_id: int) -> None:
@@ -47,4 +200,16 @@ async def delete_message_safe(message: Message) -> None:
         return
 
 
-__all__ = ["delete_message_safe", "delete_previous", "purge_history", "remember_message"]
+__all__ = [
+    "HistoryStore",
+    "MemoryHistoryStore",
+    "RedisHistoryStore",
+    "delete_message_safe",
+    "delete_messages",
+    "delete_previous",
+    "get_history_store",
+    "purge_history",
+    "remember_message",
+    "set_history_store",
+    "wait_for_deletes",
+]
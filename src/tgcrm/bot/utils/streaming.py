@@ -0,0 +1,127 @@
+"""Progressive rendering of streamed AI answers into one Telegram message."""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import AsyncIterable, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from tgcrm.config import get_settings
+
+# Bot API limit for the text of one message.
+MESSAGE_LIMIT = 4096
+PLACEHOLDER = "…"
+
+
+def _preview(text: str) -> str:
+    if len(text) <= MESSAGE_LIMIT:
+        return text
+    return text[: MESSAGE_LIMIT - len(PLACEHOLDER)] + PLACEHOLDER
+
+
+async def answer_streaming(
+    message: Message,
+    chunks: AsyncIterable[str],
+    *,
+    prefix: str = "",
+    suffix: str = "",
+    edit_interval: Optional[float] = None,
+) -> Tuple[Message, str]:
+    """Answer ``message`` with ``prefix + answer + suffix`` while ``answer`` streams in.
+
+    A placeholder is sent at once and edited as ``chunks`` arrive, at most once
+    per ``edit_interval`` seconds (``TELEGRAM_STREAM_EDIT_INTERVAL``). The last
+    edit carries the same text ``message.answer`` would have sent with the whole
+    answer. An edit Telegram rejects mid-stream, for example because an HTML tag
+    is still open, is skipped. A flood-control error delays the next edit. If
+    the stream fails or the caller is cancelled, the placeholder is deleted.
+    Returns the message holding the end of the answer and the stripped answer.
+
+    Edits go through the send rate limiter like any reply. If the last edit
+    still hits flood control, it is retried once after ``retry_after``. If it
+    is rejected, the answer is sent as a new message and the placeholder is
+    deleted. A final text longer than ``MESSAGE_LIMIT`` is split, preferably at
+    a line break: the first part replaces the placeholder and the rest follows
+    as new messages.
+    """
+
+    interval = (
+        get_settings().telegram.stream_edit_interval if edit_interval is None else edit_interval
+    )
+    sent = await message.answer(prefix + PLACEHOLDER)
+    shown = prefix + PLACEHOLDER
+    parts = []
+    next_edit_at = time.monotonic() + interval
+    try:
+        async for chunk in chunks:
+            parts.append(chunk)
+            if time.monotonic() < next_edit_at:
+                continue
+            preview = _preview(prefix + "".join(parts).lstrip() + PLACEHOLDER)
+            next_edit_at = time.monotonic() + interval
+            try:
+                await sent.edit_text(preview)
+                shown = preview
+            except TelegramRetryAfter as exc:
+                next_edit_at = time.monotonic() + exc.retry_after
+            except TelegramBadRequest:
+                continue
+    except BaseException:  # Including cancellation: the partial answer must not stay behind.
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()  # Closes the OpenAI stream if an edit, not the stream, failed.
+        try:
+            await sent.delete()
+        except TelegramBadRequest:
+            pass
+        raise
+
+    answer = "".join(parts).strip()
+    final = prefix + answer + suffix
+    if final != shown:
+        sent = await _show_final(message, sent, final)
+    return sent, answer
+
+
+def _split(text: str) -> List[str]:
+    parts = []
+    while len(text) > MESSAGE_LIMIT:
+        cut = text.rfind("\n", 0, MESSAGE_LIMIT)
+        if cut <= 0:
+            cut = MESSAGE_LIMIT
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+
+async def _show_final(message: Message, sent: Message, text: str) -> Message:
+    first, *rest = _split(text)
+    sent = await _replace(message, sent, first)
+    for part in rest:
+        sent = await message.answer(part)
+    return sent
+
+
+async def _replace(message: Message, sent: Message, text: str) -> Message:
+    for attempt in range(2):
+        try:
+            await sent.edit_text(text)
+            return sent
+        except TelegramRetryAfter as exc:
+            if attempt:
+                break
+            await asyncio.sleep(exc.retry_after)
+        except TelegramBadRequest:
+            break
+    replacement = await message.answer(text)
+    try:
+        await sent.delete()
+    except TelegramBadRequest:
+        pass
+    return replacement
+
+
+__all__ = ["answer_streaming"]
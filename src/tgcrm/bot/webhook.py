@@ -0,0 +1,148 @@
+"""Webhook entry point served by aiohttp.
+
+Telegram POSTs each update to ``TELEGRAM_WEBHOOK_PATH`` with the
+``X-Telegram-Bot-Api-Secret-Token`` header it was given in ``setWebhook``.
+The handler checks the token, queues the update on a :class:`ChatScheduler`
+and answers ``200`` right away. Processing happens on the scheduler's
+``TELEGRAM_UPDATE_CONCURRENCY`` workers: in order within a chat and concurrently
+across chats.
+
+Several replicas can run behind a load balancer. Each replica keeps chat order
+only for the updates it receives, so run them with ``FSM_STORAGE=redis``: the
+replicas then share conversation state and lock each chat in Redis while one
+of its updates is handled.
+
+``SIGTERM`` and ``SIGINT`` stop the server gracefully: updates already
+acknowledged to Telegram are processed before the process exits.
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+import re
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from tgcrm.bot.scheduler import ChatScheduler, SchedulerFull, update_metrics
+from tgcrm.config import TelegramSettings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+SCHEDULER_KEY: web.AppKey[ChatScheduler] = web.AppKey("scheduler", ChatScheduler)
+# Characters and length Telegram accepts for ``secret_token``.
+_SECRET_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,256}")
+_STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+def create_webhook_app(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    *,
+    path: str,
+    secret: str,
+    workers: int,
+) -> web.Application:
+    """Build the aiohttp application; the scheduler starts and stops with it.
+
+    Requests without ``secret`` in :data:`SECRET_HEADER` are rejected, so an
+    empty secret is refused rather than accepting updates from anyone.
+    """
+
+    if not secret:
+        raise ValueError("A webhook secret is required")
+
+    scheduler = ChatScheduler(
+        lambda update: dispatcher.feed_update(bot, update),
+        workers=workers,
+        metrics=update_metrics,
+    )
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except ValueError:
+            logger.warning("Rejected a malformed webhook payload")
+            return web.Response(status=400)
+        try:
+            scheduler.submit(update)
+        except SchedulerFull:
+            # Telegram redelivers the update later.
+            logger.warning("Webhook backlog is full, deferring update %s", update.update_id)
+            return web.Response(status=503)
+        return web.Response()
+
+    async def start_scheduler(app: web.Application) -> None:
+        await scheduler.start()
+
+    async def stop_scheduler(app: web.Application) -> None:
+        await scheduler.stop()
+
+    app = web.Application()
+    app[SCHEDULER_KEY] = scheduler
+    app.router.add_post(path, handle_update)
+    app.on_startup.append(start_scheduler)
+    app.on_shutdown.append(stop_scheduler)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, telegram: TelegramSettings) -> None:
+    """Register the webhook with Telegram and serve updates until stopped.
+
+    Returns after ``SIGTERM`` or ``SIGINT`` once the queued updates are processed.
+    """
+
+    if not telegram.webhook_url:
+        raise RuntimeError("TELEGRAM_WEBHOOK_URL is required when TELEGRAM_MODE=webhook")
+    if not _SECRET_PATTERN.fullmatch(telegram.webhook_secret):
+        raise RuntimeError(
+            "TELEGRAM_WEBHOOK_SECRET is required when TELEGRAM_MODE=webhook: "
+            "1-256 characters from A-Z, a-z, 0-9, _ and -"
+        )
+
+    app = create_webhook_app(
+        dispatcher,
+        bot,
+        path=telegram.webhook_path,
+        secret=telegram.webhook_secret,
+        workers=telegram.update_concurrency,
+    )
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, telegram.webhook_host, telegram.webhook_port)
+    await site.start()
+
+    await bot.set_webhook(
+        telegram.webhook_url.rstrip("/") + telegram.webhook_path,
+        secret_token=telegram.webhook_secret,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=telegram.webhook_max_connections,
+    )
+    logger.info(
+        "Webhook server listening on %s:%s%s",
+        telegram.webhook_host,
+        telegram.webhook_port,
+        telegram.webhook_path,
+    )
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in _STOP_SIGNALS:
+        loop.add_signal_handler(signum, stopped.set)
+    try:
+        await stopped.wait()
+        logger.info("Stopping the webhook server")
+    finally:
+        for signum in _STOP_SIGNALS:
+            loop.remove_signal_handler(signum)
+        # Stops accepting requests, then drains the scheduler through its on_shutdown hook.
+        # The webhook stays registered: other replicas keep receiving updates.
+        await runner.cleanup()
+
+
+__all__ = ["SCHEDULER_KEY", "SECRET_HEADER", "create_webhook_app", "run_webhook"]
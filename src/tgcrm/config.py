@@ -2,36 +2,146 @@
 Конфигурация проекта с поддержкой OpenAI.
 """
 
-from pydantic import BaseModel, Field
-from pydantic_settings import BaseSettings
+from __future__ import annotations
 
+from functools import lru_cache
+from typing import List, Literal, Union
+
+from pydantic import Field, field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+_ENV_CONFIG = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
+
+
+def _split_csv(value: Union[List[str], str]) -> List[str]:
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return value
+
+
+class TelegramSettings(BaseSettings):
+    model_config = _ENV_CONFIG
 
-class TelegramSettings(BaseModel):
     bot_token: str = Field(..., alias="TELEGRAM_BOT_TOKEN")
     parse_mode: str = Field("HTML", alias="TELEGRAM_PARSE_MODE")
+    fsm_storage: Literal["memory", "redis"] = Field("memory", alias="FSM_STORAGE")
+    fsm_ttl: int = Field(7 * 24 * 3600, alias="FSM_TTL")
+
+    mode: Literal["polling", "webhook"] = Field("polling", alias="TELEGRAM_MODE")
+    update_concurrency: int = Field(16, alias="TELEGRAM_UPDATE_CONCURRENCY")
+    webhook_url: str = Field("", alias="TELEGRAM_WEBHOOK_URL")
+    webhook_path: str = Field("/telegram/webhook", alias="TELEGRAM_WEBHOOK_PATH")
+    webhook_secret: str = Field("", alias="TELEGRAM_WEBHOOK_SECRET")
+    webhook_host: str = Field("0.0.0.0", alias="TELEGRAM_WEBHOOK_HOST")
+    webhook_port: int = Field(8080, alias="TELEGRAM_WEBHOOK_PORT")
+    webhook_max_connections: int = Field(40, alias="TELEGRAM_WEBHOOK_MAX_CONNECTIONS")
+
+    rate_global_per_second: float = Field(30.0, alias="TELEGRAM_RATE_GLOBAL")
+    rate_shared: bool = Field(True, alias="TELEGRAM_RATE_SHARED")
+    rate_chat_interval: float = Field(1.0, alias="TELEGRAM_RATE_CHAT_INTERVAL")
+    rate_group_per_minute: float = Field(20.0, alias="TELEGRAM_RATE_GROUP_PER_MINUTE")
+    send_max_retries: int = Field(3, alias="TELEGRAM_SEND_MAX_RETRIES")
+    stream_edit_interval: float = Field(1.0, alias="TELEGRAM_STREAM_EDIT_INTERVAL")
 
 
-class OpenAISettings(BaseModel):
+class OpenAISettings(BaseSettings):
+    model_config = _ENV_CONFIG
+
     api_key: str = Field(..., alias="OPENAI_API_KEY")
     model: str = Field("gpt-4o", alias="OPENAI_MODEL")
     temperature: float = Field(0.4, alias="OPENAI_TEMPERATURE")
+    stream: bool = Field(True, alias="OPENAI_STREAM")
+    max_concurrency: int = Field(8, alias="OPENAI_MAX_CONCURRENCY")
 
 
-class Settings(BaseSettings):
-    telegram: TelegramSettings
-    openai: OpenAISettings
+class DatabaseSettings(BaseSettings):
+    """PostgreSQL connection and pool configuration.
+
+    ``pool_mode="transaction"`` is meant for deployments behind PgBouncer in
+    transaction pooling mode: pooling is delegated to PgBouncer and asyncpg
+    prepared statements are disabled, because a statement prepared on one
+    server connection is not visible on the next one.
+    """
+
+    model_config = _ENV_CONFIG
+
+    host: str = Field("localhost", alias="POSTGRES_HOST")
+    port: int = Field(5432, alias="POSTGRES_PORT")
+    user: str = Field("postgres", alias="POSTGRES_USER")
+    password: str = Field("postgres", alias="POSTGRES_PASSWORD")
+    name: str = Field("tgcrm", alias="POSTGRES_DB")
+    echo: bool = Field(False, alias="DB_ECHO")
+
+    pool_mode: Literal["session", "transaction"] = Field("session", alias="DB_POOL_MODE")
+    pool_size: int = Field(5, alias="DB_POOL_SIZE")
+    max_overflow: int = Field(10, alias="DB_MAX_OVERFLOW")
+    pool_timeout: float = Field(30.0, alias="DB_POOL_TIMEOUT")
+    pool_recycle: int = Field(1800, alias="DB_POOL_RECYCLE")
+    pool_pre_ping: bool = Field(True, alias="DB_POOL_PRE_PING")
+    statement_cache_size: int = Field(100, alias="DB_STATEMENT_CACHE_SIZE")
+
+    replica_dsns: Union[List[str], str] = Field(default_factory=lambda: [], alias="DB_REPLICA_DSNS")
+    replica_max_lag: float = Field(5.0, alias="DB_REPLICA_MAX_LAG")
+    replica_lag_check_interval: float = Field(10.0, alias="DB_REPLICA_LAG_CHECK_INTERVAL")
+
+    slow_query_ms: float = Field(200.0, alias="DB_SLOW_QUERY_MS")
+    query_count_warn: int = Field(25, alias="DB_QUERY_COUNT_WARN")
+    query_budget_strict: bool = Field(False, alias="DB_QUERY_BUDGET_STRICT")
+
+    _split_replica_dsns = field_validator("replica_dsns", mode="after")(_split_csv)
+
+    interactions_partitions_ahead: int = Field(2, alias="INTERACTIONS_PARTITIONS_AHEAD")
+    interactions_archive_after_months: int = Field(12, alias="INTERACTIONS_ARCHIVE_AFTER_MONTHS")
+
+    interactions_write_behind: bool = Field(False, alias="INTERACTIONS_WRITE_BEHIND")
+    interactions_flush_interval_ms: int = Field(250, alias="INTERACTIONS_FLUSH_INTERVAL_MS")
+    interactions_flush_max_rows: int = Field(200, alias="INTERACTIONS_FLUSH_MAX_ROWS")
+    interactions_buffer_limit: int = Field(5000, alias="INTERACTIONS_BUFFER_LIMIT")
+    interactions_flush_max_attempts: int = Field(3, alias="INTERACTIONS_FLUSH_MAX_ATTEMPTS")
+
+    @property
+    def async_dsn(self) -> str:
+        return (
+            f"postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.name}"
+        )
+
+
+class RedisSettings(BaseSettings):
+    model_config = _ENV_CONFIG
+
+    dsn: str = Field("redis://localhost:6379/0", alias="REDIS_URL")
+
+
+class BehaviourSettings(BaseSettings):
+    model_config = _ENV_CONFIG
+
+    workday_start: str = Field("10:00", alias="WORKDAY_START")
+    workday_end: str = Field("17:00", alias="WORKDAY_END")
+    lunch_start: str = Field("13:00", alias="LUNCH_START")
+    lunch_end: str = Field("14:00", alias="LUNCH_END")
     supervisor_password: str = Field("878707Server", alias="SUPERVISOR_PASSWORD")
+    proactive_excluded_statuses: Union[List[str], str] = Field(
+        default_factory=lambda: [], alias="PROACTIVE_EXCLUDED_STATUSES"
+    )
+    manager_cache_size: int = Field(1024, alias="MANAGER_CACHE_SIZE")
+    manager_cache_ttl: float = Field(300.0, alias="MANAGER_CACHE_TTL")
 
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    _split_statuses = field_validator("proactive_excluded_statuses", mode="after")(_split_csv)
 
 
-_settings: Settings | None = None
+class Settings(BaseSettings):
+    model_config = _ENV_CONFIG
+
+    # Each section reads its own fields from the environment, which mypy sees as
+    # required constructor arguments (the same reason get_settings ignores call-arg).
+    telegram: TelegramSettings = Field(default_factory=TelegramSettings)  # type: ignore[arg-type]
+    openai: OpenAISettings = Field(default_factory=OpenAISettings)  # type: ignore[arg-type]
+    database: DatabaseSettings = Field(default_factory=DatabaseSettings)  # type: ignore[arg-type]
+    redis: RedisSettings = Field(default_factory=RedisSettings)  # type: ignore[arg-type]
+    behaviour: BehaviourSettings = Field(default_factory=BehaviourSettings)  # type: ignore[arg-type]
+    supervisor_password: str = Field("878707Server", alias="SUPERVISOR_PASSWORD")
 
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    global _settings
-    if _settings is None:
-        _settings = Settings()  # type: ignore
-    return _settings
+    return Settings()  # type: ignore[call-arg]
@@ -1,4 +1,11 @@
-"""Database layer exports."""
-from tgcrm.db import models, session
+"""Database layer exports, imported on first access."""
+from importlib import import_module
+from typing import Any
 
 __all__ = ["models", "session"]
+
+
+def __getattr__(name: str) -> Any:
+    if name in __all__:
+        return import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
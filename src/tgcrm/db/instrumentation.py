@@ -0,0 +1,389 @@
+"""Per-statement timing, slow-query logging, query counting and query budgets.
+
+Cursor events of every engine are hooked when this module is imported. For
+every executed statement they record the latency, the row count reported by
+the driver and the current *query tag*:
+
+* the tag is the service function or task that issued the statement. It is
+  set by decorating the function with :func:`tag_queries` and is kept in a
+  context variable, so it follows the call through ``await``;
+* every statement lands in :data:`query_histogram`, per tag;
+* on engines passed to :func:`instrument_engine`, statements slower than
+  ``DB_SLOW_QUERY_MS`` are logged as ``Slow query`` records whose fields are
+  rendered by :class:`~tgcrm.logging.JsonLogFormatter`;
+* inside a :func:`count_queries` block (one bot update, one Celery task) the
+  statements are also added to a :class:`QueryCounter`, which is logged when
+  the block ends. A unit that issues ``DB_QUERY_COUNT_WARN`` statements or more
+  is logged as a warning, which is how N+1 loops show up.
+
+``@tag_queries(budget=N)`` also declares how many statements one call may
+issue, including the statements of the functions it calls and any lazy
+loads. A call over budget is logged as a warning, or raises
+:class:`QueryBudgetExceeded` in strict mode (``DB_QUERY_BUDGET_STRICT`` or
+:func:`strict_query_budgets`, which the test suite enables). Tests can also
+bound any block directly with :func:`assert_max_queries`.
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import logging
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    overload,
+)
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+UNTAGGED = "untagged"
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+MAX_LOGGED_STATEMENT = 1000
+
+_START_TIMES_KEY = "tgcrm_query_start_times"
+
+_current_tag: ContextVar[Optional[str]] = ContextVar("tgcrm_query_tag", default=None)
+_active_counters: ContextVar[Tuple["QueryCounter", ...]] = ContextVar(
+    "tgcrm_query_counters", default=()
+)
+_strict_budgets: ContextVar[Optional[bool]] = ContextVar("tgcrm_strict_budgets", default=None)
+
+_slow_query_thresholds: "weakref.WeakKeyDictionary[Engine, float]" = weakref.WeakKeyDictionary()
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A unit of work issued more statements than its declared budget."""
+
+    def __init__(self, unit: str, budget: int, counter: "QueryCounter") -> None:
+        self.unit = unit
+        self.budget = budget
+        self.counter = counter
+        super().__init__(
+            f"{unit} issued {counter.statements} statements, budget is {budget}: "
+            f"{dict(counter.by_tag)}"
+        )
+
+
+@dataclass(frozen=True)
+class BudgetedCall:
+    """What a callable budget sees: the bound arguments and the return value."""
+
+    arguments: Dict[str, Any]
+    result: Any
+
+
+Budget = Union[int, Callable[[BudgetedCall], int]]
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram per query tag.
+
+    Statements are executed from the event loop, Celery worker threads and the
+    settings listener thread, so updates are serialised with a lock.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, tag: str, elapsed_ms: float) -> None:
+        index = bisect_left(self.buckets, elapsed_ms)
+        with self._lock:
+            series = self._series.get(tag)
+            if series is None:
+                series = {
+                    "count": 0,
+                    "sum_ms": 0.0,
+                    "max_ms": 0.0,
+                    # The extra slot counts statements slower than the last bucket.
+                    "counts": [0] * (len(self.buckets) + 1),
+                }
+                self._series[tag] = series
+            series["count"] += 1
+            series["sum_ms"] += elapsed_ms
+            series["max_ms"] = max(series["max_ms"], elapsed_ms)
+            series["counts"][index] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return ``{tag: {count, sum_ms, max_ms, buckets}}`` with cumulative buckets."""
+
+        with self._lock:
+            result: Dict[str, Dict[str, Any]] = {}
+            for tag, series in self._series.items():
+                cumulative: Dict[str, int] = {}
+                running = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    running += count
+                    cumulative[f"{bound:g}"] = running
+                cumulative["+Inf"] = series["count"]
+                result[tag] = {
+                    "count": series["count"],
+                    "sum_ms": round(series["sum_ms"], 3),
+                    "max_ms": round(series["max_ms"], 3),
+                    "buckets": cumulative,
+                }
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+query_histogram = LatencyHistogram()
+
+
+@dataclass
+class QueryCounter:
+    """Statements issued by one unit of work (a bot update, a Celery task, a test)."""
+
+    unit: str
+    statements: int = 0
+    rows: int = 0
+    elapsed_ms: float = 0.0
+    by_tag: Counter = field(default_factory=Counter)
+
+    def record(self, tag: str, elapsed_ms: float, rows: Optional[int]) -> None:
+        self.statements += 1
+        self.elapsed_ms += elapsed_ms
+        if rows is not None:
+            self.rows += rows
+        self.by_tag[tag] += 1
+
+    def as_log_fields(self) -> Dict[str, Any]:
+        return {
+            "unit": self.unit,
+            "queries": self.statements,
+            "rows": self.rows,
+            "db_ms": round(self.elapsed_ms, 3),
+            "queries_by_tag": dict(self.by_tag),
+        }
+
+
+def current_query_tag() -> str:
+    return _current_tag.get() or UNTAGGED
+
+
+def current_query_counter() -> Optional[QueryCounter]:
+    """Return the innermost active counter."""
+
+    counters = _active_counters.get()
+    return counters[-1] if counters else None
+
+
+def budgets_are_strict() -> bool:
+    strict = _strict_budgets.get()
+    if strict is None:
+        from tgcrm.config import get_settings
+
+        strict = get_settings().database.query_budget_strict
+    return strict
+
+
+@contextmanager
+def strict_query_budgets(enabled: bool = True) -> Iterator[None]:
+    """Raise (or, with ``enabled=False``, only log) on exceeded budgets inside the block."""
+
+    token = _strict_budgets.set(enabled)
+    try:
+        yield
+    finally:
+        _strict_budgets.reset(token)
+
+
+@contextmanager
+def _collect(unit: str) -> Iterator[QueryCounter]:
+    counter = QueryCounter(unit)
+    token = _active_counters.set(_active_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active_counters.reset(token)
+
+
+def _check_budget(unit: str, budget: int, counter: QueryCounter, *, strict: bool) -> None:
+    if counter.statements <= budget:
+        return
+    if strict:
+        raise QueryBudgetExceeded(unit, budget, counter)
+    logger.warning(
+        "Query budget exceeded", extra={"extra": {**counter.as_log_fields(), "budget": budget}}
+    )
+
+
+@contextmanager
+def assert_max_queries(budget: int, unit: str = "block") -> Iterator[QueryCounter]:
+    """Raise :class:`QueryBudgetExceeded` if the block issues more than ``budget`` statements."""
+
+    with _collect(unit) as counter:
+        yield counter
+    _check_budget(unit, budget, counter, strict=True)
+
+
+@overload
+def tag_queries(func: F) -> F: ...
+
+
+@overload
+def tag_queries(
+    func: Optional[str] = None, *, budget: Optional[Budget] = None
+) -> Callable[[F], F]: ...
+
+
+def tag_queries(func: Any = None, *, budget: Optional[Budget] = None) -> Any:
+    """Attribute the statements issued while the coroutine runs to its name.
+
+    Usable bare (``@tag_queries``, the tag is the function name), with an
+    explicit tag (``@tag_queries("reminders.send_due")``) and/or with a
+    ``budget``: the most statements one call may issue, or a callable that
+    computes it from a :class:`BudgetedCall` for work that is chunked by
+    design. The innermost tagged function wins the attribution; budgets count
+    everything issued during the call.
+    """
+
+    def decorate(coroutine: F, tag: str) -> F:
+        signature = inspect.signature(coroutine)
+
+        @functools.wraps(coroutine)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            token = _current_tag.set(tag)
+            try:
+                if budget is None:
+                    return await coroutine(*args, **kwargs)
+                with _collect(tag) as counter:
+                    result = await coroutine(*args, **kwargs)
+            finally:
+                _current_tag.reset(token)
+
+            if isinstance(budget, int):
+                allowed = budget
+            else:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                allowed = budget(BudgetedCall(dict(bound.arguments), result))
+            _check_budget(tag, allowed, counter, strict=budgets_are_strict())
+            return result
+
+        wrapper.query_budget = budget  # type: ignore[attr-defined]
+        return wrapper  # type: ignore[return-value]
+
+    if func is None or isinstance(func, str):
+        return lambda coroutine: decorate(coroutine, func or coroutine.__name__)
+    return decorate(func, func.__name__)
+
+
+@contextmanager
+def count_queries(unit: str, *, warn_at: Optional[int] = None) -> Iterator[QueryCounter]:
+    """Count the statements issued inside the block and log the total on exit.
+
+    Blocks nest: a statement is counted by every enclosing block.
+    """
+
+    if warn_at is None:
+        from tgcrm.config import get_settings
+
+        warn_at = get_settings().database.query_count_warn
+
+    with _collect(unit) as counter:
+        try:
+            yield counter
+        finally:
+            if warn_at and counter.statements >= warn_at:
+                logger.warning(
+                    "Query count above threshold", extra={"extra": counter.as_log_fields()}
+                )
+            else:
+                logger.debug("Query count", extra={"extra": counter.as_log_fields()})
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault(_START_TIMES_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info[_START_TIMES_KEY].pop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    tag = current_query_tag()
+    rowcount = getattr(cursor, "rowcount", -1)
+    rows = rowcount if isinstance(rowcount, int) and rowcount >= 0 else None
+
+    query_histogram.observe(tag, elapsed_ms)
+    counters = _active_counters.get()
+    for counter in counters:
+        counter.record(tag, elapsed_ms, rows)
+
+    slow_query_ms = _slow_query_thresholds.get(conn.engine)
+    if slow_query_ms is None or elapsed_ms < slow_query_ms:
+        return
+    fields: Dict[str, Any] = {
+        "query_tag": tag,
+        "duration_ms": round(elapsed_ms, 3),
+        "rows": rows,
+        "executemany": executemany,
+        # Parameters are left out on purpose: they carry client phone numbers.
+        "statement": statement[:MAX_LOGGED_STATEMENT],
+    }
+    if counters:
+        fields["unit"] = counters[0].unit
+    logger.warning("Slow query", extra={"extra": fields})
+
+
+def _handle_error(context) -> None:
+    connection = context.connection
+    if connection is not None and connection.info.get(_START_TIMES_KEY):
+        connection.info[_START_TIMES_KEY].pop()
+
+
+# Timing, counting and budgets apply to every engine in the process, including
+# the throwaway engines tests create; slow-query logging is opted into per engine.
+event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+event.listen(Engine, "handle_error", _handle_error)
+
+
+def instrument_engine(engine: Engine | AsyncEngine, *, slow_query_ms: float) -> None:
+    """Log statements on ``engine`` that take ``slow_query_ms`` or longer."""
+
+    target = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    _slow_query_thresholds[target] = slow_query_ms
+
+
+__all__ = [
+    "Budget",
+    "BudgetedCall",
+    "LATENCY_BUCKETS_MS",
+    "LatencyHistogram",
+    "QueryBudgetExceeded",
+    "QueryCounter",
+    "UNTAGGED",
+    "assert_max_queries",
+    "budgets_are_strict",
+    "count_queries",
+    "current_query_counter",
+    "current_query_tag",
+    "instrument_engine",
+    "query_histogram",
+    "strict_query_budgets",
+    "tag_queries",
+]
@@ -4,12 +4,19 @@ from __future__ import annotations
 import argparse
 import asyncio
 import logging
-from typing import Sequence
+from pathlib import Path
+from typing import Optional, Sequence
 
 from sqlalchemy.exc import OperationalError
-from tenacity import AsyncRetrying, RetryError, retry_if_exception_type, stop_after_attempt, wait_exponential
-
-from tgcrm.db.session import init_models
+from tenacity import (
+    AsyncRetrying,
+    RetryError,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from tgcrm.db import migrations
 from tgcrm.logging import configure_logging
 
 
@@ -18,7 +25,7 @@ def _configure_logging() -> None:
     logging.getLogger(__name__).debug("Logging configured for database management CLI.")
 
 
-async def _handle_init_db(max_attempts: int, backoff: float) -> None:
+async def _handle_init_db(max_attempts: int, backoff: float, revision: str = "head") -> None:
     logger = logging.getLogger(__name__)
     logger.info("Ensuring database schema is up to date...")
 
@@ -37,7 +44,7 @@ async def _handle_init_db(max_attempts: int, backoff: float) -> None:
                     attempt.retry_state.attempt_number,
                     max_attempts,
                 )
-                await init_models()
+                await migrations.upgrade(revision)
     except RetryError as exc:  # pragma: no cover - defensive guard
         last_exc = exc.last_attempt.exception() if exc.last_attempt else exc
         logger.error("Failed to initialize database after %s attempts: %s", max_attempts, last_exc)
@@ -46,26 +53,110 @@ async def _handle_init_db(max_attempts: int, backoff: float) -> None:
         logger.info("Database schema is up to date.")
 
 
+async def _handle_import_clients(
+    path: Path, batch_size: int, manager_telegram_id: Optional[int]
+) -> None:
+    from tgcrm.db.session import engine
+    from tgcrm.services.client_import import import_clients, iter_source_rows
+
+    logger = logging.getLogger(__name__)
+    logger.info("Importing clients from %s", path)
+    report = await import_clients(
+        engine,
+        iter_source_rows(path),
+        batch_size=batch_size,
+        manager_telegram_id=manager_telegram_id,
+    )
+    logger.info(
+        "Import finished: inserted=%s skipped=%s rejected=%s deals_created=%s",
+        report.inserted,
+        report.skipped,
+        report.rejected,
+        report.deals_created,
+    )
+
+
+async def _handle_archive_interactions(
+    older_than_months: Optional[int], export_dir: Optional[Path]
+) -> None:
+    from tgcrm.config import get_settings
+    from tgcrm.db.partitions import archive_partitions
+    from tgcrm.db.session import engine
+
+    logger = logging.getLogger(__name__)
+    months = older_than_months or get_settings().database.interactions_archive_after_months
+    async with engine.connect() as connection:
+        processed = await archive_partitions(
+            connection, older_than_months=months, export_dir=export_dir
+        )
+    logger.info("Archived %s interaction partitions: %s", len(processed), ", ".join(processed))
+
+
 def main(argv: Sequence[str] | None = None) -> None:
     """Entry point for CLI commands."""
 
     parser = argparse.ArgumentParser(description="Database management utilities")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
-    init_parser = subparsers.add_parser("init-db", help="Create database tables if they do not exist")
-    init_parser.add_argument(
-        "--max-attempts",
+    init_parser = subparsers.add_parser(
+        "init-db", help="Wait for the database and apply all pending migrations"
+    )
+    _add_retry_arguments(init_parser)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Apply migrations up to a revision")
+    migrate_parser.add_argument(
+        "revision", nargs="?", default="head", help="Target revision (default: %(default)s)"
+    )
+    _add_retry_arguments(migrate_parser)
+
+    downgrade_parser = subparsers.add_parser("downgrade", help="Revert migrations to a revision")
+    downgrade_parser.add_argument("revision", help="Target revision, e.g. -1 or a revision id")
+
+    revision_parser = subparsers.add_parser(
+        "makemigrations", help="Generate a new migration by comparing models with the database"
+    )
+    revision_parser.add_argument("-m", "--message", required=True, help="Revision message")
+    revision_parser.add_argument(
+        "--empty", action="store_true", help="Create an empty revision without autogenerate"
+    )
+
+    import_parser = subparsers.add_parser(
+        "import-clients", help="Bulk load clients from a CSV or XLSX file"
+    )
+    import_parser.add_argument("path", type=Path, help="Path to the .csv or .xlsx file")
+    import_parser.add_argument(
+        "--batch-size",
         type=int,
-        default=5,
-        help="Number of attempts to initialize the database before giving up (default: %(default)s)",
+        default=5000,
+        help="Rows normalized and copied per transaction (default: %(default)s)",
     )
-    init_parser.add_argument(
-        "--retry-backoff",
-        type=float,
-        default=1.0,
+    import_parser.add_argument(
+        "--manager-telegram-id",
+        type=int,
+        default=None,
+        help="Create a new deal assigned to this manager for every inserted client",
+    )
+
+    archive_parser = subparsers.add_parser(
+        "archive-interactions",
+        help="Move monthly interaction partitions older than a given age out of the hot table",
+    )
+    archive_parser.add_argument(
+        "--older-than-months",
+        type=int,
+        default=None,
         help=(
-            "Initial wait time between retry attempts in seconds. An exponential backoff is applied "
-            "for subsequent retries (default: %(default)s)."
+            "Archive partitions older than this many months "
+            "(default: INTERACTIONS_ARCHIVE_AFTER_MONTHS)"
+        ),
+    )
+    archive_parser.add_argument(
+        "--export-dir",
+        type=Path,
+        default=None,
+        help=(
+            "Dump partitions to gzip-compressed CSV files in this directory and drop them "
+            "instead of moving them to the interactions_archive table"
         ),
     )
 
@@ -74,9 +165,39 @@ def main(argv: Sequence[str] | None = None) -> None:
 
     if args.command == "init-db":
         asyncio.run(_handle_init_db(args.max_attempts, args.retry_backoff))
+    elif args.command == "migrate":
+        asyncio.run(_handle_init_db(args.max_attempts, args.retry_backoff, args.revision))
+    elif args.command == "downgrade":
+        asyncio.run(migrations.downgrade(args.revision))
+    elif args.command == "makemigrations":
+        migrations.make_revision(args.message, autogenerate=not args.empty)
+    elif args.command == "archive-interactions":
+        asyncio.run(_handle_archive_interactions(args.older_than_months, args.export_dir))
+    elif args.command == "import-clients":
+        asyncio.run(
+            _handle_import_clients(args.path, args.batch_size, args.manager_telegram_id)
+        )
     else:  # pragma: no cover - defensive programming
         raise SystemExit(f"Unknown command: {args.command}")
 
 
+def _add_retry_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=5,
+        help="Number of attempts to initialize the database before giving up (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        type=float,
+        default=1.0,
+        help=(
+            "Initial wait time between retry attempts in seconds. An exponential backoff is applied "
+            "for subsequent retries (default: %(default)s)."
+        ),
+    )
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,60 @@
+"""Alembic migration environment bundled with the package.
+
+The scripts live next to the code so that ``python manage.py migrate`` works
+from an installed wheel or a container image without an ``alembic.ini``.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Callable
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy.engine import Connection
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent
+
+
+def alembic_config() -> Config:
+    """Return an Alembic configuration pointing at the bundled scripts."""
+
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    return config
+
+
+def _run_with_connection(
+    connection: Connection, action: Callable[..., Any], *args: Any, **kwargs: Any
+) -> None:
+    config = alembic_config()
+    config.attributes["connection"] = connection
+    action(config, *args, **kwargs)
+
+
+async def upgrade(revision: str = "head") -> None:
+    """Apply migrations up to ``revision`` using the application engine."""
+
+    from tgcrm.db.session import engine
+
+    async with engine.connect() as connection:
+        await connection.run_sync(_run_with_connection, command.upgrade, revision)
+        await connection.commit()
+
+
+async def downgrade(revision: str) -> None:
+    """Revert migrations down to ``revision`` using the application engine."""
+
+    from tgcrm.db.session import engine
+
+    async with engine.connect() as connection:
+        await connection.run_sync(_run_with_connection, command.downgrade, revision)
+        await connection.commit()
+
+
+def make_revision(message: str, *, autogenerate: bool = True) -> None:
+    """Create a new revision file, comparing models to the live schema when requested."""
+
+    command.revision(alembic_config(), message=message, autogenerate=autogenerate)
+
+
+__all__ = ["MIGRATIONS_DIR", "alembic_config", "downgrade", "make_revision", "upgrade"]
@@ -0,0 +1,59 @@
+"""Alembic environment for the CRM schema."""
+from __future__ import annotations
+
+import asyncio
+
+from alembic import context
+from sqlalchemy.engine import Connection
+
+from tgcrm.db.models import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def _run_migrations(connection: Connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        compare_type=True,
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def _run_async_migrations() -> None:
+    from tgcrm.db.session import engine
+
+    async with engine.connect() as connection:
+        await connection.run_sync(_run_migrations)
+        await connection.commit()
+
+
+def run_migrations_offline() -> None:
+    from tgcrm.config import get_settings
+
+    context.configure(
+        url=get_settings().database.async_dsn,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run_migrations(connection)
+        return
+    asyncio.run(_run_async_migrations())
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,125 @@
+"""Initial schema.
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2026-10-17
+
+Databases created earlier through ``Base.metadata.create_all`` already contain
+these tables, so each one is only created when it is missing. Running the
+upgrade against such a database simply records the baseline revision.
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0001_initial_schema"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    if op.get_context().as_sql:
+        return False
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if not _has_table("managers"):
+        op.create_table(
+            "managers",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("telegram_id", sa.Integer(), nullable=False, unique=True),
+            sa.Column("name", sa.String(255)),
+            sa.Column("role", sa.String(50), nullable=False),
+        )
+
+    if not _has_table("clients"):
+        op.create_table(
+            "clients",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("phone_number", sa.String(20), nullable=False),
+            sa.Column("phone_suffix", sa.String(4), nullable=False),
+            sa.Column("name", sa.String(255)),
+            sa.Column("city", sa.String(255)),
+        )
+        op.create_index("ix_clients_phone_number", "clients", ["phone_number"], unique=True)
+        op.create_index("ix_client_phone_suffix", "clients", ["phone_suffix"])
+
+    if not _has_table("deals"):
+        op.create_table(
+            "deals",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("client_id", sa.Integer(), sa.ForeignKey("clients.id", ondelete="CASCADE")),
+            sa.Column("manager_id", sa.Integer(), sa.ForeignKey("managers.id", ondelete="CASCADE")),
+            sa.Column("status", sa.String(50), nullable=False),
+            sa.Column("amount", sa.Numeric(12, 2)),
+            sa.Column("created_at", sa.DateTime(timezone=True)),
+            sa.Column("last_interaction_at", sa.DateTime(timezone=True)),
+        )
+        op.create_index("ix_deal_manager_status", "deals", ["manager_id", "status"])
+
+    if not _has_table("interactions"):
+        op.create_table(
+            "interactions",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("deal_id", sa.Integer(), sa.ForeignKey("deals.id", ondelete="CASCADE")),
+            sa.Column("type", sa.String(50), nullable=False),
+            sa.Column("ai_advice", sa.Text()),
+            sa.Column("manager_summary", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True)),
+        )
+
+    if not _has_table("invoices"):
+        op.create_table(
+            "invoices",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("deal_id", sa.Integer(), sa.ForeignKey("deals.id", ondelete="CASCADE")),
+            sa.Column("file_path", sa.String(255), nullable=False),
+            sa.Column("total_amount", sa.Numeric(12, 2), nullable=False),
+        )
+
+    if not _has_table("invoice_items"):
+        op.create_table(
+            "invoice_items",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column(
+                "invoice_id", sa.Integer(), sa.ForeignKey("invoices.id", ondelete="CASCADE")
+            ),
+            sa.Column("line_number", sa.Integer(), nullable=False),
+            sa.Column("item_description", sa.Text(), nullable=False),
+            sa.UniqueConstraint("invoice_id", "line_number", name="uq_invoice_line"),
+        )
+
+    if not _has_table("reminders"):
+        op.create_table(
+            "reminders",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("deal_id", sa.Integer(), sa.ForeignKey("deals.id", ondelete="CASCADE")),
+            sa.Column("remind_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("is_sent", sa.Boolean()),
+        )
+
+    if not _has_table("bot_settings"):
+        op.create_table(
+            "bot_settings",
+            sa.Column("key", sa.String(100), primary_key=True),
+            sa.Column("value", sa.Text(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    for table in (
+        "bot_settings",
+        "reminders",
+        "invoice_items",
+        "invoices",
+        "interactions",
+        "deals",
+        "clients",
+        "managers",
+    ):
+        op.drop_table(table)
@@ -0,0 +1,102 @@
+"""Indexes for suffix lookup, due reminders and stale deals.
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-17
+
+Indexes are built ``CONCURRENTLY`` on PostgreSQL so that production tables stay
+writable while the migration runs. A concurrent build that fails or is
+interrupted leaves an INVALID index behind and the revision is not recorded, so
+the upgrade is rerunnable: INVALID leftovers are dropped first and the rest is
+created or dropped only if needed.
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0002_hot_path_indexes"
+down_revision: Union[str, Sequence[str], None] = "0001_initial_schema"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of ``TERMINAL_STATUS_VALUES`` at the time of this revision.
+_TERMINAL_STATUSES = ("долгосрочный", "оплачен", "отменен")
+
+
+def _reminder_due_predicate() -> sa.ColumnElement[bool]:
+    return sa.column("is_sent") == sa.false()
+
+
+def _active_deal_predicate() -> sa.ColumnElement[bool]:
+    return sa.column("status").notin_(_TERMINAL_STATUSES)
+
+
+def _drop_if_invalid(name: str) -> None:
+    """Drop ``name`` if a failed ``CREATE INDEX CONCURRENTLY`` left it INVALID."""
+
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    invalid = bind.execute(
+        sa.text(
+            "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid"
+        ),
+        {"name": name},
+    ).first()
+    if invalid is not None:
+        op.drop_index(name, postgresql_concurrently=True, if_exists=True)
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in ("ix_client_phone_suffix_id", "ix_reminder_due", "ix_deal_followup_due"):
+            _drop_if_invalid(name)
+        op.create_index(
+            "ix_client_phone_suffix_id",
+            "clients",
+            ["phone_suffix", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_client_phone_suffix",
+            table_name="clients",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            "ix_reminder_due",
+            "reminders",
+            ["remind_at"],
+            postgresql_where=_reminder_due_predicate(),
+            sqlite_where=_reminder_due_predicate(),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_deal_followup_due",
+            "deals",
+            ["last_interaction_at"],
+            postgresql_where=_active_deal_predicate(),
+            sqlite_where=_active_deal_predicate(),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_deal_followup_due", table_name="deals", postgresql_concurrently=True)
+        op.drop_index("ix_reminder_due", table_name="reminders", postgresql_concurrently=True)
+        op.create_index(
+            "ix_client_phone_suffix",
+            "clients",
+            ["phone_suffix"],
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_client_phone_suffix_id", table_name="clients", postgresql_concurrently=True
+        )
@@ -0,0 +1,139 @@
+"""Partition interactions by month of created_at.
+
+Revision ID: 0003_partition_interactions
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-17
+
+The existing table is renamed, a range-partitioned ``interactions`` table is
+created with monthly partitions covering all existing rows plus the next two
+months, the rows are copied over and the old table is dropped. Row ids keep
+coming from the original sequence. PostgreSQL requires the partition key to be
+part of the primary key, hence ``(id, created_at)``.
+
+A ``DEFAULT`` partition catches rows outside the pre-created range so inserts
+never fail if the partition maintenance task falls behind.
+``tgcrm.db.partitions.ensure_partitions`` moves such rows into their month once
+it creates the month's partition.
+
+Other dialects (SQLite in tests) keep the plain table created from the models.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0003_partition_interactions"
+down_revision: Union[str, Sequence[str], None] = "0002_hot_path_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_MONTHS_AHEAD = 2
+
+
+def _add_months(value: date, months: int) -> date:
+    index = value.year * 12 + (value.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _is_postgresql() -> bool:
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def _create_month_partitions(parent: str, first: date, last: date) -> None:
+    current = date(first.year, first.month, 1)
+    while current <= last:
+        upper = _add_months(current, 1)
+        op.execute(
+            f"CREATE TABLE {parent}_y{current.year:04d}m{current.month:02d} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{current.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        current = upper
+
+
+def upgrade() -> None:
+    if not _is_postgresql():
+        return
+
+    op.execute("ALTER TABLE interactions RENAME TO interactions_legacy")
+    op.execute(
+        "ALTER TABLE interactions_legacy RENAME CONSTRAINT interactions_pkey "
+        "TO interactions_legacy_pkey"
+    )
+    op.execute(
+        "ALTER TABLE interactions_legacy RENAME CONSTRAINT interactions_deal_id_fkey "
+        "TO interactions_legacy_deal_id_fkey"
+    )
+    op.execute("ALTER SEQUENCE interactions_id_seq OWNED BY NONE")
+
+    op.execute(
+        """
+        CREATE TABLE interactions (
+            id integer NOT NULL DEFAULT nextval('interactions_id_seq'),
+            deal_id integer REFERENCES deals (id) ON DELETE CASCADE,
+            type varchar(50) NOT NULL,
+            ai_advice text,
+            manager_summary text NOT NULL,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            CONSTRAINT interactions_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE interactions_id_seq OWNED BY interactions.id")
+    op.execute(
+        "CREATE INDEX ix_interactions_deal_created ON interactions (deal_id, created_at DESC)"
+    )
+
+    oldest = None
+    if not op.get_context().as_sql:
+        oldest = op.get_bind().scalar(sa.text("SELECT min(created_at) FROM interactions_legacy"))
+    today = datetime.now(timezone.utc).date()
+    first = date(oldest.year, oldest.month, 1) if oldest else date(today.year, today.month, 1)
+    _create_month_partitions("interactions", first, _add_months(today, _MONTHS_AHEAD))
+    op.execute("CREATE TABLE interactions_default PARTITION OF interactions DEFAULT")
+
+    op.execute(
+        "INSERT INTO interactions (id, deal_id, type, ai_advice, manager_summary, created_at) "
+        "SELECT id, deal_id, type, ai_advice, manager_summary, COALESCE(created_at, now()) "
+        "FROM interactions_legacy"
+    )
+    op.execute("DROP TABLE interactions_legacy")
+
+    op.execute(
+        "CREATE TABLE interactions_archive (LIKE interactions INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+
+
+def downgrade() -> None:
+    if not _is_postgresql():
+        return
+
+    op.execute("DROP TABLE interactions_archive")
+    op.execute("ALTER TABLE interactions RENAME TO interactions_partitioned")
+    op.execute(
+        "ALTER TABLE interactions_partitioned RENAME CONSTRAINT interactions_pkey "
+        "TO interactions_partitioned_pkey"
+    )
+    op.execute("ALTER SEQUENCE interactions_id_seq OWNED BY NONE")
+    op.execute(
+        """
+        CREATE TABLE interactions (
+            id integer NOT NULL DEFAULT nextval('interactions_id_seq') PRIMARY KEY,
+            deal_id integer REFERENCES deals (id) ON DELETE CASCADE,
+            type varchar(50) NOT NULL,
+            ai_advice text,
+            manager_summary text NOT NULL,
+            created_at timestamptz
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE interactions_id_seq OWNED BY interactions.id")
+    op.execute(
+        "INSERT INTO interactions (id, deal_id, type, ai_advice, manager_summary, created_at) "
+        "SELECT id, deal_id, type, ai_advice, manager_summary, created_at "
+        "FROM interactions_partitioned"
+    )
+    op.execute("DROP TABLE interactions_partitioned")
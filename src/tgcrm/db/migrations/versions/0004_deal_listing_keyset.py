@@ -0,0 +1,102 @@
+"""Indexes for keyset pagination of a manager's deals.
+
+Revision ID: 0004_deal_listing_keyset
+Revises: 0003_partition_interactions
+Create Date: 2026-10-17
+
+``ix_deal_manager_status`` is replaced by ``ix_deal_manager_status_created``,
+which adds ``(created_at, id)`` so a page of deals in one status is a single
+index range scan. The new index is built before the old one is dropped, so
+status filters keep an index while the migration runs.
+``ix_deal_manager_created`` serves the unfiltered listing. ``deals.created_at``
+becomes ``NOT NULL`` because it is part of the cursor.
+
+Like ``0002_hot_path_indexes`` the upgrade is rerunnable after an interrupted
+concurrent build: INVALID leftovers are dropped first and the rest is created
+or dropped only if needed.
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0004_deal_listing_keyset"
+down_revision: Union[str, Sequence[str], None] = "0003_partition_interactions"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _drop_if_invalid(name: str) -> None:
+    """Drop ``name`` if a failed ``CREATE INDEX CONCURRENTLY`` left it INVALID."""
+
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    invalid = bind.execute(
+        sa.text(
+            "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid"
+        ),
+        {"name": name},
+    ).first()
+    if invalid is not None:
+        op.drop_index(name, postgresql_concurrently=True, if_exists=True)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("UPDATE deals SET created_at = now() WHERE created_at IS NULL")
+        op.execute("ALTER TABLE deals ALTER COLUMN created_at SET DEFAULT now()")
+        op.execute("ALTER TABLE deals ALTER COLUMN created_at SET NOT NULL")
+
+    with op.get_context().autocommit_block():
+        for name in ("ix_deal_manager_created", "ix_deal_manager_status_created"):
+            _drop_if_invalid(name)
+        op.create_index(
+            "ix_deal_manager_created",
+            "deals",
+            ["manager_id", "created_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_deal_manager_status_created",
+            "deals",
+            ["manager_id", "status", "created_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_deal_manager_status",
+            table_name="deals",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        _drop_if_invalid("ix_deal_manager_status")
+        op.create_index(
+            "ix_deal_manager_status",
+            "deals",
+            ["manager_id", "status"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_deal_manager_status_created",
+            table_name="deals",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_deal_manager_created",
+            table_name="deals",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE deals ALTER COLUMN created_at DROP NOT NULL")
+        op.execute("ALTER TABLE deals ALTER COLUMN created_at DROP DEFAULT")
@@ -0,0 +1,96 @@
+"""Trigram indexes for fuzzy client search.
+
+Revision ID: 0005_client_trigram_search
+Revises: 0004_deal_listing_keyset
+Create Date: 2026-10-17
+
+GIN ``gin_trgm_ops`` indexes on ``clients.name``, ``clients.city`` and
+``clients.phone_number`` serve the ``<%`` (word similarity) and ``LIKE
+'%digits%'`` predicates of :mod:`tgcrm.services.client_search`.
+``ix_deal_client_manager`` keeps the per-candidate "is this one of my
+clients" probe and the newest-deal lookup on the index.
+
+The ``pg_trgm`` extension must be installable by the migration role. Other
+dialects only get the deals index.
+
+Like ``0002_hot_path_indexes`` the upgrade is rerunnable after an interrupted
+concurrent build: INVALID leftovers are dropped first and the rest is created
+or dropped only if needed.
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0005_client_trigram_search"
+down_revision: Union[str, Sequence[str], None] = "0004_deal_listing_keyset"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_TRIGRAM_INDEXES = {
+    "ix_client_name_trgm": "name",
+    "ix_client_city_trgm": "city",
+    "ix_client_phone_trgm": "phone_number",
+}
+
+
+def _drop_if_invalid(name: str) -> None:
+    """Drop ``name`` if a failed ``CREATE INDEX CONCURRENTLY`` left it INVALID."""
+
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    invalid = bind.execute(
+        sa.text(
+            "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid"
+        ),
+        {"name": name},
+    ).first()
+    if invalid is not None:
+        op.drop_index(name, postgresql_concurrently=True, if_exists=True)
+
+
+def upgrade() -> None:
+    is_postgresql = op.get_bind().dialect.name == "postgresql"
+    if is_postgresql:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    with op.get_context().autocommit_block():
+        for name in ("ix_deal_client_manager", *_TRIGRAM_INDEXES):
+            _drop_if_invalid(name)
+        op.create_index(
+            "ix_deal_client_manager",
+            "deals",
+            ["client_id", "manager_id", "created_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        if is_postgresql:
+            for name, column in _TRIGRAM_INDEXES.items():
+                op.create_index(
+                    name,
+                    "clients",
+                    [column],
+                    postgresql_using="gin",
+                    postgresql_ops={column: "gin_trgm_ops"},
+                    postgresql_concurrently=True,
+                    if_not_exists=True,
+                )
+
+
+def downgrade() -> None:
+    is_postgresql = op.get_bind().dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        if is_postgresql:
+            for name in _TRIGRAM_INDEXES:
+                op.drop_index(
+                    name, table_name="clients", postgresql_concurrently=True, if_exists=True
+                )
+        op.drop_index(
+            "ix_deal_client_manager",
+            table_name="deals",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
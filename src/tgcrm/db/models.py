@@ -14,15 +14,21 @@ from sqlalchemy import (
     String,
     Text,
     UniqueConstraint,
+    column,
+    false,
 )
+from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
-from tgcrm.db.statuses import DealStatus
+from tgcrm.db.statuses import TERMINAL_STATUS_VALUES, DealStatus
 
-class Base(DeclarativeBase):
-    """Base declarative class for SQLAlchemy models."""
 
-    pass
+class Base(AsyncAttrs, DeclarativeBase):
+    """Base declarative class for SQLAlchemy models.
+
+    ``AsyncAttrs`` lets async code load relationships on demand through
+    ``await instance.awaitable_attrs.<name>``.
+    """
 
 
 class Manager(Base):
@@ -37,8 +43,16 @@ class Manager(Base):
 
 
 class Client(Base):
+    """Client identified by a normalized phone number.
+
+    On PostgreSQL ``name``, ``city`` and ``phone_number`` also carry ``pg_trgm``
+    GIN indexes for fuzzy search. They need the extension, so they are owned by
+    the migrations rather than declared here.
+    """
+
     __tablename__ = "clients"
-    __table_args__ = (Index("ix_client_phone_suffix", "phone_suffix"),)
+    # ``id`` is part of the key so suffix lookups are answered from the index alone.
+    __table_args__ = (Index("ix_client_phone_suffix_id", "phone_suffix", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     phone_number: Mapped[str] = mapped_column(String(20), unique=True, nullable=False, index=True)
@@ -51,14 +65,27 @@ class Client(Base):
 
 class Deal(Base):
     __tablename__ = "deals"
-    __table_args__ = (Index("ix_deal_manager_status", "manager_id", "status"),)
+    __table_args__ = (
+        # Keyset pagination of "my deals" walks these in (created_at, id) order.
+        Index("ix_deal_manager_status_created", "manager_id", "status", "created_at", "id"),
+        Index("ix_deal_manager_created", "manager_id", "created_at", "id"),
+        Index("ix_deal_client_manager", "client_id", "manager_id", "created_at"),
+        Index(
+            "ix_deal_followup_due",
+            "last_interaction_at",
+            postgresql_where=column("status").notin_(TERMINAL_STATUS_VALUES),
+            sqlite_where=column("status").notin_(TERMINAL_STATUS_VALUES),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id", ondelete="CASCADE"))
     manager_id: Mapped[int] = mapped_column(ForeignKey("managers.id", ondelete="CASCADE"))
     status: Mapped[str] = mapped_column(String(50), nullable=False, default=DealStatus.NEW.value)
     amount: Mapped[Optional[Numeric]] = mapped_column(Numeric(12, 2))
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=datetime.utcnow
+    )
     last_interaction_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
 
     client: Mapped["Client"] = relationship("Client", back_populates="deals")
@@ -75,6 +102,14 @@ class Deal(Base):
 
 
 class Interaction(Base):
+    """Manager interaction with a client.
+
+    On PostgreSQL the table is range-partitioned by month of ``created_at``
+    with a composite ``(id, created_at)`` primary key; it is owned by the
+    migrations (see :mod:`tgcrm.db.partitions`). Ids come from a single
+    sequence and stay unique, so the mapper identifies rows by ``id`` alone.
+    """
+
     __tablename__ = "interactions"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -82,7 +117,9 @@ class Interaction(Base):
     type: Mapped[str] = mapped_column(String(50), nullable=False)
     ai_advice: Mapped[Optional[str]] = mapped_column(Text)
     manager_summary: Mapped[str] = mapped_column(Text, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=datetime.utcnow
+    )
 
     deal: Mapped["Deal"] = relationship("Deal", back_populates="interactions")
 
@@ -115,6 +152,14 @@ class InvoiceItem(Base):
 
 class Reminder(Base):
     __tablename__ = "reminders"
+    __table_args__ = (
+        Index(
+            "ix_reminder_due",
+            "remind_at",
+            postgresql_where=column("is_sent") == false(),
+            sqlite_where=column("is_sent") == false(),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     deal_id: Mapped[int] = mapped_column(ForeignKey("deals.id", ondelete="CASCADE"))
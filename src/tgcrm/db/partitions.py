@@ -0,0 +1,248 @@
+"""Monthly range partitions for the ``interactions`` table.
+
+``interactions`` is partitioned by ``created_at`` (see migration
+``0003_partition_interactions``). Partitions are named ``interactions_yYYYYmMM``
+and cover one calendar month each. Upcoming partitions are created ahead of
+time by a periodic task. Rows that arrive while no month partition covers them
+land in ``interactions_default``; PostgreSQL then refuses to create the month
+until they are moved, which :func:`ensure_partitions` does. Cold partitions are
+moved out of the hot table either into ``interactions_archive``, a partitioned
+table with the same columns that the partition is re-attached to without
+copying rows, or into a gzip-compressed CSV file.
+"""
+from __future__ import annotations
+
+import gzip
+import logging
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "interactions"
+ARCHIVE_TABLE = "interactions_archive"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+_COLUMNS = "id, deal_id, type, ai_advice, manager_summary, created_at"
+_PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_y(?P<year>\d{{4}})m(?P<month>\d{{2}})$")
+
+
+@dataclass(frozen=True)
+class MonthPartition:
+    """A single month partition of ``interactions``."""
+
+    start: date
+
+    @property
+    def end(self) -> date:
+        return add_months(self.start, 1)
+
+    @property
+    def name(self) -> str:
+        return f"{PARENT_TABLE}_y{self.start.year:04d}m{self.start.month:02d}"
+
+    @classmethod
+    def from_name(cls, name: str) -> Optional["MonthPartition"]:
+        match = _PARTITION_NAME.match(name)
+        if not match:
+            return None
+        return cls(date(int(match.group("year")), int(match.group("month")), 1))
+
+
+def month_start(value: date | datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + (value.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partitions_between(first: date, last: date) -> List[MonthPartition]:
+    """Return partitions covering every month from ``first`` to ``last`` inclusive."""
+
+    current = month_start(first)
+    partitions = []
+    while current <= month_start(last):
+        partitions.append(MonthPartition(current))
+        current = add_months(current, 1)
+    return partitions
+
+
+def create_partition_sql(partition: MonthPartition, parent: str = PARENT_TABLE) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition.name} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{partition.start.isoformat()}') TO ('{partition.end.isoformat()}')"
+    )
+
+
+def archive_candidates(
+    partitions: List[MonthPartition], *, older_than_months: int, today: date
+) -> List[MonthPartition]:
+    """Partitions whose whole range is older than ``older_than_months`` months."""
+
+    cutoff = add_months(month_start(today), -older_than_months)
+    return [partition for partition in partitions if partition.end <= cutoff]
+
+
+async def ensure_partitions(
+    connection: AsyncConnection, *, months_ahead: int, today: Optional[date] = None
+) -> List[str]:
+    """Create partitions for the current month and ``months_ahead`` following months.
+
+    Returns the names of the partitions this call created.
+    """
+
+    current = month_start(today or datetime.now(timezone.utc).date())
+    wanted = partitions_between(current, add_months(current, months_ahead))
+    existing = set(await list_partitions(connection))
+    created = []
+    for partition in wanted:
+        if partition in existing:
+            continue
+        if await _default_has_rows(connection, partition):
+            await _split_default(connection, partition)
+        else:
+            await connection.execute(text(create_partition_sql(partition)))
+        created.append(partition.name)
+    return created
+
+
+def _range_condition(partition: MonthPartition) -> str:
+    return (
+        f"created_at >= '{partition.start.isoformat()}' "
+        f"AND created_at < '{partition.end.isoformat()}'"
+    )
+
+
+async def _default_has_rows(connection: AsyncConnection, partition: MonthPartition) -> bool:
+    result = await connection.execute(
+        text(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+            f"WHERE {_range_condition(partition)})"
+        )
+    )
+    return bool(result.scalar())
+
+
+async def _split_default(connection: AsyncConnection, partition: MonthPartition) -> None:
+    """Create ``partition`` and move its rows out of the default partition.
+
+    PostgreSQL refuses to create a partition while the default one holds rows
+    in its range, so the default partition is detached for the duration. The
+    statements run in the caller's transaction, which briefly holds an
+    exclusive lock on ``interactions``.
+    """
+
+    condition = _range_condition(partition)
+    await connection.execute(
+        text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+    )
+    await connection.execute(text(create_partition_sql(partition)))
+    moved = await connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {condition} "
+            f"RETURNING {_COLUMNS}) "
+            f"INSERT INTO {partition.name} ({_COLUMNS}) SELECT {_COLUMNS} FROM moved"
+        )
+    )
+    await connection.execute(
+        text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+    )
+    logger.info(
+        "Moved %s rows from %s to %s", moved.rowcount, DEFAULT_PARTITION, partition.name
+    )
+
+
+async def list_partitions(
+    connection: AsyncConnection, parent: str = PARENT_TABLE
+) -> List[MonthPartition]:
+    result = await connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :parent"
+        ),
+        {"parent": parent},
+    )
+    partitions = [MonthPartition.from_name(name) for (name,) in result]
+    return sorted((p for p in partitions if p is not None), key=lambda p: p.start)
+
+
+async def _export_to_file(
+    connection: AsyncConnection, partition: MonthPartition, directory: Path
+) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    target = directory / f"{partition.name}.csv.gz"
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+    assert driver_connection is not None, "the asyncpg connection is closed"
+    with gzip.open(target, "wb") as handle:
+        await driver_connection.copy_from_table(
+            partition.name, output=handle, format="csv", header=True
+        )
+    return target
+
+
+async def archive_partitions(
+    connection: AsyncConnection,
+    *,
+    older_than_months: int,
+    export_dir: Optional[Path] = None,
+    today: Optional[date] = None,
+) -> List[str]:
+    """Move cold partitions out of ``interactions``.
+
+    Without ``export_dir`` each partition is detached and attached to
+    ``interactions_archive``. With ``export_dir`` it is dumped to
+    ``<name>.csv.gz`` and dropped. Returns the names of processed partitions.
+    """
+
+    candidates = archive_candidates(
+        await list_partitions(connection),
+        older_than_months=older_than_months,
+        today=today or datetime.now(timezone.utc).date(),
+    )
+    processed = []
+    for partition in candidates:
+        await connection.execute(
+            text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {partition.name}")
+        )
+        if export_dir is None:
+            await connection.execute(
+                text(
+                    f"ALTER TABLE {ARCHIVE_TABLE} ATTACH PARTITION {partition.name} "
+                    f"FOR VALUES FROM ('{partition.start.isoformat()}') "
+                    f"TO ('{partition.end.isoformat()}')"
+                )
+            )
+            logger.info("Moved %s to %s", partition.name, ARCHIVE_TABLE)
+        else:
+            target = await _export_to_file(connection, partition, export_dir)
+            await connection.execute(text(f"DROP TABLE {partition.name}"))
+            logger.info("Exported %s to %s", partition.name, target)
+        await connection.commit()
+        processed.append(partition.name)
+    return processed
+
+
+__all__ = [
+    "ARCHIVE_TABLE",
+    "DEFAULT_PARTITION",
+    "MonthPartition",
+    "PARENT_TABLE",
+    "add_months",
+    "archive_candidates",
+    "archive_partitions",
+    "create_partition_sql",
+    "ensure_partitions",
+    "list_partitions",
+    "month_start",
+    "partitions_between",
+]
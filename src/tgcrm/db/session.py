@@ -1,52 +1,347 @@
-"""Database engine and session management."""
+"""Database engine and session management.
+
+The primary engine, :data:`AsyncSessionFactory` and the replica router are
+built on first use rather than at import, so a CLI command or a Celery worker
+that never touches the database does not pay for the driver and the pool.
+``from tgcrm.db.session import engine`` still works and builds the engine.
+"""
 from __future__ import annotations
 
 import logging
+import time
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+from uuid import uuid4
 
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
 
-from tgcrm.config import get_settings
+from tgcrm.config import DatabaseSettings, get_settings
 from tgcrm.db import models
+from tgcrm.db.instrumentation import instrument_engine
 
-_settings = get_settings()
 logger = logging.getLogger(__name__)
 
-engine: AsyncEngine = create_async_engine(
-    _settings.database.async_dsn,
-    echo=_settings.database.echo,
-    future=True,
-)
 
-AsyncSessionFactory = async_sessionmaker(
-    bind=engine,
-    expire_on_commit=False,
-    class_=AsyncSession,
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid4()}__"
+
+
+def engine_options(database: DatabaseSettings) -> Dict[str, Any]:
+    """Return keyword arguments for :func:`create_async_engine`.
+
+    In ``transaction`` pool mode PgBouncer owns the server connections, so the
+    client side keeps no pool of its own and never relies on named prepared
+    statements surviving between transactions.
+    """
+
+    options: Dict[str, Any] = {"echo": database.echo, "future": True}
+
+    if database.pool_mode == "transaction":
+        options["poolclass"] = NullPool
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": _unique_statement_name,
+        }
+        return options
+
+    options.update(
+        pool_size=database.pool_size,
+        max_overflow=database.max_overflow,
+        pool_timeout=database.pool_timeout,
+        pool_recycle=database.pool_recycle,
+        pool_pre_ping=database.pool_pre_ping,
+    )
+    options["connect_args"] = {
+        "statement_cache_size": database.statement_cache_size,
+        "prepared_statement_cache_size": database.statement_cache_size,
+    }
+    return options
+
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+
+
+def get_engine() -> AsyncEngine:
+    """Return the primary engine, creating it on first use."""
+
+    global _engine
+    if _engine is None:
+        database = get_settings().database
+        _engine = create_async_engine(database.async_dsn, **engine_options(database))
+        instrument_engine(_engine, slow_query_ms=database.slow_query_ms)
+    return _engine
+
+
+def get_session_factory() -> async_sessionmaker[AsyncSession]:
+    """Return the session factory bound to the primary engine."""
+
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = async_sessionmaker(
+            bind=get_engine(), expire_on_commit=False, class_=AsyncSession
+        )
+    return _session_factory
+
+# NULL when the replica is not streaming from the primary: a replica that lost its
+# upstream has replayed everything it received and would otherwise report no lag.
+# Without pg_read_all_stats the status column is hidden, so a running WAL receiver
+# counts as streaming. Zero when the replica has replayed everything it received,
+# otherwise the age of the last replayed transaction. Comparing LSNs first avoids
+# reporting lag on an idle primary where no new transactions arrive.
+_REPLICA_LAG_QUERY = text(
+    "SELECT CASE "
+    "WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver "
+    "WHERE COALESCE(status, 'streaming') = 'streaming') THEN NULL "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
 )
 
 
+class ReplicaRouter:
+    """Round-robin selection of read replicas with lag-based fallback.
+
+    Replica lag is measured at most once per ``check_interval`` seconds per
+    replica. A replica that lags more than ``max_lag`` seconds or cannot be
+    reached is skipped until its next check; when no replica qualifies the
+    caller falls back to the primary.
+    """
+
+    def __init__(
+        self,
+        engines: Sequence[AsyncEngine],
+        *,
+        max_lag: float,
+        check_interval: float,
+    ) -> None:
+        self._engines = list(engines)
+        self._factories = [
+            async_sessionmaker(bind=replica, expire_on_commit=False, class_=AsyncSession)
+            for replica in self._engines
+        ]
+        self._max_lag = max_lag
+        self._check_interval = check_interval
+        self._health: Dict[int, Tuple[float, bool]] = {}
+        self._next = 0
+
+    @classmethod
+    def from_settings(cls, database: DatabaseSettings) -> "ReplicaRouter":
+        engines = [
+            create_async_engine(dsn, **engine_options(database)) for dsn in database.replica_dsns
+        ]
+        for replica in engines:
+            instrument_engine(replica, slow_query_ms=database.slow_query_ms)
+        return cls(
+            engines,
+            max_lag=database.replica_max_lag,
+            check_interval=database.replica_lag_check_interval,
+        )
+
+    async def measure_lag(self, replica: AsyncEngine) -> float:
+        """Return the replica's lag in seconds, infinite if it is not streaming."""
+
+        async with replica.connect() as connection:
+            lag = await connection.scalar(_REPLICA_LAG_QUERY)
+        return float("inf") if lag is None else float(lag)
+
+    async def _is_healthy(self, index: int) -> bool:
+        now = time.monotonic()
+        checked_at, healthy = self._health.get(index, (float("-inf"), False))
+        if now - checked_at < self._check_interval:
+            return healthy
+
+        try:
+            lag = await self.measure_lag(self._engines[index])
+        except Exception as exc:
+            logger.warning("Replica #%s is unavailable: %s", index, exc)
+            healthy = False
+        else:
+            healthy = lag <= self._max_lag
+            if not healthy:
+                logger.warning("Replica #%s lags %.1fs behind the primary", index, lag)
+        self._health[index] = (now, healthy)
+        return healthy
+
+    async def session_factory(self) -> Optional[async_sessionmaker[AsyncSession]]:
+        """Return a factory bound to a healthy replica, or ``None`` to use the primary."""
+
+        for _ in range(len(self._factories)):
+            index = self._next
+            self._next = (self._next + 1) % len(self._factories)
+            if await self._is_healthy(index):
+                return self._factories[index]
+        return None
+
+
+_replicas: Optional[ReplicaRouter] = None
+
+
+def get_replicas() -> ReplicaRouter:
+    """Return the read replica router, creating it on first use."""
+
+    global _replicas
+    if _replicas is None:
+        _replicas = ReplicaRouter.from_settings(get_settings().database)
+    return _replicas
+
+
+_LAZY_ATTRIBUTES = {
+    "engine": get_engine,
+    "AsyncSessionFactory": get_session_factory,
+    "replicas": get_replicas,
+}
+
+
+def __getattr__(name: str) -> Any:
+    builder = _LAZY_ATTRIBUTES.get(name)
+    if builder is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return builder()
+
+
 async def init_models() -> None:
     """Create database tables based on the SQLAlchemy models."""
 
-    async with engine.begin() as connection:
+    async with get_engine().begin() as connection:
         await connection.run_sync(models.Base.metadata.create_all, checkfirst=True)
     logger.info("Database schema ensured.")
 
 
+_WROTE_FLAG = "tgcrm_wrote"
+
+
+def _mark_written(session: Session, flush_context: Any) -> None:
+    session.info[_WROTE_FLAG] = True
+
+
+class SessionScope:
+    """A primary session opened on first use and shared by one unit of work.
+
+    The session is bound to the engine, so it holds a pooled connection only
+    while a transaction is open: each :func:`get_session` block ends its own
+    transaction and returns the connection to the pool.
+    """
+
+    def __init__(self) -> None:
+        self._session: Optional[AsyncSession] = None
+        self._depth = 0
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    @property
+    def wrote(self) -> bool:
+        """Whether the scope has written anything a replica may not have yet."""
+
+        return self._session is not None and bool(self._session.info.get(_WROTE_FLAG))
+
+    async def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = get_session_factory()()
+            event.listen(self._session.sync_session, "after_flush", _mark_written)
+        return self._session
+
+    @asynccontextmanager
+    async def block(self) -> AsyncIterator[AsyncSession]:
+        """Yield the shared session; the outermost block commits or rolls back on exit."""
+
+        session = await self.session()
+        self._depth += 1
+        try:
+            yield session
+            if self._depth == 1:
+                await session.commit()
+        except Exception:
+            if self._depth == 1:
+                await session.rollback()
+            raise
+        finally:
+            self._depth -= 1
+
+    async def close(self, *, commit: bool) -> None:
+        if self._session is None:
+            return
+        try:
+            if commit:
+                await self._session.commit()
+            else:
+                await self._session.rollback()
+        finally:
+            await self._session.close()
+            self._session = None
+
+
+_current_scope: ContextVar[Optional[SessionScope]] = ContextVar(
+    "tgcrm_session_scope", default=None
+)
+
+
+def current_scope() -> Optional[SessionScope]:
+    return _current_scope.get()
+
+
 @asynccontextmanager
-async def get_session() -> AsyncIterator[AsyncSession]:
-    """Provide a transactional scope around a series of operations."""
+async def session_scope() -> AsyncIterator[SessionScope]:
+    """Share one session between every :func:`get_session` inside the block.
+
+    The session is opened by the first :func:`get_session` that needs it. Work
+    done on it outside a :func:`get_session` block is committed when the scope
+    exits, or rolled back if it raises.
+    """
+
+    scope = SessionScope()
+    token = _current_scope.set(scope)
+    committed = False
+    try:
+        yield scope
+        committed = True
+    finally:
+        _current_scope.reset(token)
+        await scope.close(commit=committed)
+
+
+@asynccontextmanager
+async def get_session(*, readonly: bool = False) -> AsyncIterator[AsyncSession]:
+    """Provide a transactional scope around a series of operations.
+
+    ``readonly=True`` routes the session to a read replica when one is
+    configured and fresh enough, and never commits.
+
+    Inside :func:`session_scope` the scope's session is reused.
+    The block still commits when it exits and rolls back only its own work if
+    it raises, so nothing stays uncommitted across the replies a handler sends.
+    Nested blocks join the outermost one. Reads go to the scope's session too,
+    unless a replica is available and the scope has not written anything the
+    replica could miss.
+    """
+
+    scope = _current_scope.get()
+    primary = get_session_factory()
+    factory = primary
+    if readonly and not (scope is not None and scope.wrote):
+        factory = await get_replicas().session_factory() or primary
+
+    if scope is not None and factory is primary:
+        async with scope.block() as shared:
+            yield shared
+        return
 
-    session = AsyncSessionFactory()
+    session = factory()
     try:
         yield session
-        await session.commit()
+        if not readonly:
+            await session.commit()
     except Exception:
         await session.rollback()
         raise
@@ -54,4 +349,15 @@ async def get_session() -> AsyncIterator[AsyncSession]:
         await session.close()
 
 
-__all__ = ["engine", "AsyncSessionFactory", "get_session", "init_models"]
+__all__ = [
+    "ReplicaRouter",
+    "SessionScope",
+    "current_scope",
+    "engine_options",
+    "get_engine",
+    "get_replicas",
+    "get_session",
+    "get_session_factory",
+    "init_models",
+    "session_scope",
+]
@@ -21,6 +21,12 @@ TERMINAL_STATUSES = {
     DealStatus.LONG_TERM,
 }
 
+# Sorted so that SQL predicates built from it render identically to the
+# partial index definition and the planner can match them.
+TERMINAL_STATUS_VALUES: tuple[str, ...] = tuple(
+    sorted(status.value for status in TERMINAL_STATUSES)
+)
+
 
 VALID_TRANSITIONS: dict[DealStatus, set[DealStatus]] = {
     DealStatus.NEW: {
@@ -74,4 +80,11 @@ def normalize_status(value: str) -> str:
         raise ValueError(f"Unsupported deal status: {value}") from exc
 
 
-__all__ = ["DealStatus", "normalize_status", "validate_status_transition", "VALID_TRANSITIONS"]
+__all__ = [
+    "DealStatus",
+    "TERMINAL_STATUSES",
+    "TERMINAL_STATUS_VALUES",
+    "VALID_TRANSITIONS",
+    "normalize_status",
+    "validate_status_transition",
+]
@@ -1,4 +1,15 @@
-"""Service layer modules."""
-from tgcrm.services import ai, deals, pdf_processing
+"""Service layer modules.
+
+Submodules are imported on first access, so importing one service does not
+load the dependencies of all the others.
+"""
+from importlib import import_module
+from typing import Any
 
 __all__ = ["ai", "deals", "pdf_processing"]
+
+
+def __getattr__(name: str) -> Any:
+    if name in __all__:
+        return import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
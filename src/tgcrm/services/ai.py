@@ -1,10 +1,14 @@
 """Compatibility layer that proxies to the new AI assistant helpers."""
 from __future__ import annotations
 
+from tgcrm.db.instrumentation import tag_queries
 from tgcrm.db.models import Deal, InvoiceItem
 
 from .ai_assistant import get_ai_advice
 
+# Most recent interactions included in an advice prompt.
+ADVICE_HISTORY_SIZE = 5
+
 
 async def get_advice(prompt: str) -> str:
     """Backward compatible helper that forwards to :func:`get_ai_advice`."""
@@ -35,39 +39,49 @@ async def build_product_consultation_prompt(item_description: str, question: str
     return await get_ai_advice(prompt)
 
 
-async def build_advice_for_interaction(deal: Deal, interaction_type: str) -> str:
-    """Return a suggestion for the next interaction based on history."""
+@tag_queries(budget=1)
+async def interaction_advice_prompt(deal: Deal, interaction_type: str) -> str:
+    """Return the prompt asking for a next-step tip based on the deal's history."""
 
     history_parts = []
-    sorted_history = sorted(deal.interactions, key=lambda item: item.created_at or 0)
-    for interaction in sorted_history[-5:]:
+    interactions = await deal.awaitable_attrs.interactions
+    sorted_history = sorted(interactions, key=lambda item: item.created_at or 0)
+    for interaction in sorted_history[-ADVICE_HISTORY_SIZE:]:
         fragment = (
             f"[{interaction.created_at:%Y-%m-%d %H:%M}] {interaction.type}: {interaction.manager_summary}"
         )
         history_parts.append(fragment)
 
     history = "\n".join(history_parts) or "No previous interactions."
-    prompt = (
+    return (
         "Act as an experienced sales supervisor.\n"
         "Given the following interaction history and the requested channel, suggest a short tip.\n"
         f"Channel: {interaction_type}\n"
         f"History:\n{history}\n"
     )
-    return await get_ai_advice(prompt)
 
 
+@tag_queries(budget=1)
+async def build_advice_for_interaction(deal: Deal, interaction_type: str) -> str:
+    """Return a suggestion for the next interaction based on history."""
+
+    return await get_ai_advice(await interaction_advice_prompt(deal, interaction_type))
+
+
+@tag_queries(budget=2)
 async def answer_item_question(deal: Deal, line_no: int, question: str) -> str:
     """Return an AI generated answer about a specific invoice line."""
 
     latest_invoice = None
-    if deal.invoices:
-        latest_invoice = sorted(deal.invoices, key=lambda inv: inv.id)[-1]
+    invoices = await deal.awaitable_attrs.invoices
+    if invoices:
+        latest_invoice = sorted(invoices, key=lambda inv: inv.id)[-1]
 
     if not latest_invoice:
         raise ValueError("У сделки нет связанных счетов")
 
     matching_item: InvoiceItem | None = None
-    for item in latest_invoice.items:
+    for item in await latest_invoice.awaitable_attrs.items:
         if item.line_number == line_no:
             matching_item = item
             break
@@ -79,9 +93,11 @@ async def answer_item_question(deal: Deal, line_no: int, question: str) -> str:
 
 
 __all__ = [
+    "ADVICE_HISTORY_SIZE",
     "answer_item_question",
     "build_advice_for_interaction",
     "build_product_consultation_prompt",
     "get_advice",
+    "interaction_advice_prompt",
     "summarize_interaction",
 ]
@@ -1,16 +1,27 @@
-"""Unified interface for communicating with the OpenAI ChatGPT API."""
+"""Unified interface for communicating with the OpenAI ChatGPT API.
+
+The ``openai`` package is imported when the first completion is requested.
+
+With ``OPENAI_STREAM=true`` (the default) :meth:`AIAssistant.stream_ai_advice`
+yields the answer as it is generated, so the bot can show the first words
+after the time to first token instead of the whole completion.
+:data:`completion_latency` records both.
+"""
 from __future__ import annotations
 
 import json
-from typing import Any, Iterable
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterable
 
-from aiogram import Dispatcher
-from openai import AsyncOpenAI
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from tgcrm.config import Settings, get_settings
-from tgcrm.db.session import AsyncSessionFactory
-from tgcrm.services.settings import get_setting
+from tgcrm.db.instrumentation import LatencyHistogram
+from tgcrm.services.settings import settings_cache
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, AsyncStream
+    from openai.types.chat import ChatCompletionChunk, ChatCompletionMessageParam
 
 AI_PROMPTS = {
     "client_summary": (
@@ -56,6 +67,10 @@ ROLE_SYSTEM_MESSAGES = {
 
 DEFAULT_MAX_TOKENS = 800
 
+AI_LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 15_000, 30_000)
+# "first_token" for streamed answers and "completion" for every answer.
+completion_latency = LatencyHistogram(AI_LATENCY_BUCKETS_MS)
+
 
 @retry(wait=wait_exponential(multiplier=1, min=1, max=8), stop=stop_after_attempt(3))
 async def _create_completion(
@@ -63,7 +78,7 @@ async def _create_completion(
     model: str,
     temperature: float,
     max_tokens: int,
-    messages: list[dict[str, str]],
+    messages: list[ChatCompletionMessageParam],
 ) -> str:
     response = await client.chat.completions.create(
         model=model,
@@ -74,11 +89,40 @@ async def _create_completion(
     return (response.choices[0].message.content or "").strip()
 
 
+@retry(wait=wait_exponential(multiplier=1, min=1, max=8), stop=stop_after_attempt(3))
+async def _open_stream(
+    client: AsyncOpenAI,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    messages: list[ChatCompletionMessageParam],
+) -> AsyncStream[ChatCompletionChunk]:
+    # Only opening the stream is retried: once tokens were shown they cannot be taken back.
+    return await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+    )
+
+
+def reminder_tip_context(reminder_text: str) -> str:
+    return f"{AI_PROMPTS['reminder_tip']}\n\nЗапрос: {reminder_text.strip()}"
+
+
+def supervisor_summary_context(deals: Iterable[Any] | dict[str, Any]) -> str:
+    if isinstance(deals, dict):
+        payload = json.dumps(deals, ensure_ascii=False)
+    else:
+        payload = json.dumps(list(deals), ensure_ascii=False)
+    return f"{AI_PROMPTS['supervisor_report']}\n\nДанные:\n{payload}"
+
+
 async def _resolve_api_key(settings: Settings) -> str:
     override: str | None = None
     try:  # pragma: no cover - DB overrides are optional
-        async with AsyncSessionFactory() as session:
-            override = await get_setting(session, "openai_api_key")
+        override = await settings_cache.get("openai_api_key")
     except Exception:
         override = None
     return override or settings.openai.api_key
@@ -87,28 +131,96 @@ async def _resolve_api_key(settings: Settings) -> str:
 class AIAssistant:
     """High level helper around the OpenAI chat completions API."""
 
-    def __init__(self, client: AsyncOpenAI, model: str, temperature: float, max_tokens: int):
+    def __init__(
+        self,
+        client: AsyncOpenAI | None,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        *,
+        stream: bool = True,
+    ):
         self._client = client
         self._model = model
         self._temperature = temperature
         self._max_tokens = max_tokens
-
-    async def _complete(self, messages: list[dict[str, str]]) -> str:
-        return await _create_completion(
-            self._client,
+        self._stream = stream
+
+    async def _refresh_client(self) -> AsyncOpenAI:
+        # The key override is served from the settings cache, so this is a dict lookup
+        # unless the override changed since the last call.
+        api_key = await _resolve_api_key(get_settings())
+        client = self._client
+        if client is None or (api_key and api_key != client.api_key):
+            from openai import AsyncOpenAI
+
+            client = self._client = AsyncOpenAI(api_key=api_key)
+        return client
+
+    async def _complete(self, messages: list[ChatCompletionMessageParam]) -> str:
+        client = await self._refresh_client()
+        started = time.perf_counter()
+        text = await _create_completion(
+            client,
             model=self._model,
             temperature=self._temperature,
             max_tokens=self._max_tokens,
             messages=messages,
         )
-
-    async def get_ai_advice(self, context: str, role: str = "sales_assistant") -> str:
+        completion_latency.observe("completion", (time.perf_counter() - started) * 1000)
+        return text
+
+    async def _complete_streaming(
+        self, messages: list[ChatCompletionMessageParam]
+    ) -> AsyncIterator[str]:
+        if not self._stream:
+            yield await self._complete(messages)
+            return
+
+        client = await self._refresh_client()
+        started = time.perf_counter()
+        stream = await _open_stream(
+            client,
+            model=self._model,
+            temperature=self._temperature,
+            max_tokens=self._max_tokens,
+            messages=messages,
+        )
+        first_token = True
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if first_token:
+                    first_token = False
+                    completion_latency.observe(
+                        "first_token", (time.perf_counter() - started) * 1000
+                    )
+                yield delta
+        finally:
+            await stream.close()
+        completion_latency.observe("completion", (time.perf_counter() - started) * 1000)
+
+    @staticmethod
+    def _messages(context: str, role: str) -> list[ChatCompletionMessageParam]:
         system_message = ROLE_SYSTEM_MESSAGES.get(role, ROLE_SYSTEM_MESSAGES["sales_assistant"])
-        messages = [
+        return [
             {"role": "system", "content": system_message},
             {"role": "user", "content": context.strip()},
         ]
-        return await self._complete(messages)
+
+    async def get_ai_advice(self, context: str, role: str = "sales_assistant") -> str:
+        return await self._complete(self._messages(context, role))
+
+    def stream_ai_advice(self, context: str, role: str = "sales_assistant") -> AsyncIterator[str]:
+        """Yield the answer :meth:`get_ai_advice` would give, piece by piece.
+
+        The pieces are unstripped deltas; ``"".join(pieces).strip()`` equals the
+        non-streamed answer.
+        """
+
+        return self._complete_streaming(self._messages(context, role))
 
     async def summarize_invoice(self, text: str) -> str:
         context = f"{AI_PROMPTS['invoice_summary']}\n\n{text.strip()}"
@@ -137,12 +249,7 @@ class AIAssistant:
         return await self.get_ai_advice(context)
 
     async def generate_supervisor_summary(self, deals: Iterable[Any] | dict[str, Any]) -> str:
-        if isinstance(deals, dict):
-            payload = json.dumps(deals, ensure_ascii=False)
-        else:
-            payload = json.dumps(list(deals), ensure_ascii=False)
-        context = f"{AI_PROMPTS['supervisor_report']}\n\nДанные:\n{payload}"
-        return await self.get_ai_advice(context, role="supervisor")
+        return await self.get_ai_advice(supervisor_summary_context(deals), role="supervisor")
 
     async def summarize_client_profile(self, client_data: dict[str, Any]) -> str:
         formatted = json.dumps(client_data, ensure_ascii=False)
@@ -150,28 +257,35 @@ class AIAssistant:
         return await self.get_ai_advice(context)
 
     async def build_reminder_tip(self, reminder_text: str) -> str:
-        context = f"{AI_PROMPTS['reminder_tip']}\n\nЗапрос: {reminder_text.strip()}"
-        return await self.get_ai_advice(context)
+        return await self.get_ai_advice(reminder_tip_context(reminder_text))
 
 
 async def create_ai_assistant(settings: Settings | None = None) -> AIAssistant:
     resolved_settings = settings or get_settings()
-    api_key = await _resolve_api_key(resolved_settings)
-    client = AsyncOpenAI(api_key=api_key)
+    # The client, and with it the openai package, is created by the first completion.
     return AIAssistant(
-        client=client,
+        client=None,
         model=resolved_settings.openai.model,
         temperature=resolved_settings.openai.temperature,
         max_tokens=DEFAULT_MAX_TOKENS,
+        stream=resolved_settings.openai.stream,
     )
 
 
+_current_assistant: AIAssistant | None = None
+
+
+def set_ai_assistant(assistant: AIAssistant | None) -> None:
+    """Register the process-wide assistant used by the module level helpers."""
+
+    global _current_assistant
+    _current_assistant = assistant
+
+
 def get_ai_assistant() -> AIAssistant:
-    dispatcher = Dispatcher.get_current()
-    assistant = dispatcher.workflow_data.get("ai_assistant")
-    if not isinstance(assistant, AIAssistant):  # pragma: no cover - runtime guard
-        raise RuntimeError("AI assistant is not initialised in dispatcher context")
-    return assistant
+    if not isinstance(_current_assistant, AIAssistant):  # pragma: no cover - runtime guard
+        raise RuntimeError("AI assistant is not initialised; call set_ai_assistant() on startup")
+    return _current_assistant
 
 
 async def get_ai_advice(context: str, role: str = "sales_assistant") -> str:
@@ -179,6 +293,10 @@ async def get_ai_advice(context: str, role: str = "sales_assistant") -> str:
     return await assistant.get_ai_advice(context, role=role)
 
 
+def stream_ai_advice(context: str, role: str = "sales_assistant") -> AsyncIterator[str]:
+    return get_ai_assistant().stream_ai_advice(context, role=role)
+
+
 async def summarize_invoice(text: str) -> str:
     assistant = get_ai_assistant()
     return await assistant.summarize_invoice(text)
@@ -207,13 +325,18 @@ async def build_reminder_tip(reminder_text: str) -> str:
 __all__ = [
     "AI_PROMPTS",
     "AIAssistant",
+    "completion_latency",
     "create_ai_assistant",
     "generate_followup_message",
     "generate_supervisor_summary",
     "get_ai_advice",
     "get_ai_assistant",
     "build_reminder_tip",
+    "reminder_tip_context",
+    "set_ai_assistant",
+    "stream_ai_advice",
     "summarize_client_profile",
     "summarize_invoice",
+    "supervisor_summary_context",
 ]
 
@@ -0,0 +1,239 @@
+"""Bulk import of clients (and optionally their deals) from CSV/XLSX files.
+
+Rows are streamed from the source file, normalized in batches and loaded with
+PostgreSQL ``COPY`` into a temporary staging table. Each batch is merged into
+``clients`` with ``ON CONFLICT (phone_number) DO NOTHING`` inside its own
+transaction, so an interrupted import can simply be re-run.
+"""
+from __future__ import annotations
+
+import csv
+import logging
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from tgcrm.db.statuses import DealStatus
+from tgcrm.services.phones import PhoneValidationError, extract_suffix, normalize_kz_phone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+_MAX_TEXT_LENGTH = 255
+
+PHONE_COLUMNS = ("phone", "phone_number", "телефон", "номер")
+NAME_COLUMNS = ("name", "имя", "клиент")
+CITY_COLUMNS = ("city", "город")
+
+_STAGING_TABLE = "client_import_staging"
+_STAGING_COLUMNS = ("phone_number", "phone_suffix", "name", "city")
+
+_CREATE_STAGING_SQL = f"""
+CREATE TEMP TABLE {_STAGING_TABLE} (
+    phone_number varchar(20) NOT NULL,
+    phone_suffix varchar(4) NOT NULL,
+    name varchar(255),
+    city varchar(255)
+) ON COMMIT DROP
+"""
+
+_MERGE_SQL = f"""
+WITH inserted AS (
+    INSERT INTO clients (phone_number, phone_suffix, name, city)
+    SELECT DISTINCT ON (phone_number) phone_number, phone_suffix, name, city
+    FROM {_STAGING_TABLE}
+    ORDER BY phone_number
+    ON CONFLICT (phone_number) DO NOTHING
+    RETURNING id
+)
+SELECT (SELECT count(*) FROM inserted) AS inserted, 0 AS deals
+"""
+
+_MERGE_WITH_DEALS_SQL = f"""
+WITH inserted AS (
+    INSERT INTO clients (phone_number, phone_suffix, name, city)
+    SELECT DISTINCT ON (phone_number) phone_number, phone_suffix, name, city
+    FROM {_STAGING_TABLE}
+    ORDER BY phone_number
+    ON CONFLICT (phone_number) DO NOTHING
+    RETURNING id
+), created_deals AS (
+    INSERT INTO deals (client_id, manager_id, status, created_at)
+    SELECT id, $1, $2, now() FROM inserted
+    RETURNING id
+)
+SELECT (SELECT count(*) FROM inserted) AS inserted, (SELECT count(*) FROM created_deals) AS deals
+"""
+
+
+@dataclass
+class ImportReport:
+    """Counters describing the outcome of an import run."""
+
+    inserted: int = 0
+    skipped: int = 0
+    rejected: int = 0
+    deals_created: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.skipped + self.rejected
+
+
+ClientRecord = Tuple[str, str, Optional[str], Optional[str]]
+
+
+def _pick(row: Mapping[str, Any], columns: Iterable[str]) -> Optional[str]:
+    for column in columns:
+        value = row.get(column)
+        if value is not None and str(value).strip():
+            return str(value).strip()[:_MAX_TEXT_LENGTH]
+    return None
+
+
+def _normalise_header(header: Iterable[Any]) -> List[str]:
+    return [str(column or "").strip().lower() for column in header]
+
+
+def iter_csv_rows(path: Path) -> Iterator[Dict[str, Any]]:
+    with path.open(newline="", encoding="utf-8-sig") as handle:
+        sample = handle.read(4096)
+        handle.seek(0)
+        try:
+            dialect: Any = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(handle, dialect)
+        header = _normalise_header(next(reader, []))
+        for values in reader:
+            yield dict(zip(header, values))
+
+
+def iter_xlsx_rows(path: Path) -> Iterator[Dict[str, Any]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError("XLSX import requires openpyxl: pip install 'tgcrm[import]'") from exc
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _normalise_header(next(rows, ()))
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_source_rows(path: Path) -> Iterator[Dict[str, Any]]:
+    """Stream rows from a CSV or XLSX file as dictionaries keyed by lowercase header."""
+
+    if path.suffix.lower() in {".xlsx", ".xlsm"}:
+        return iter_xlsx_rows(path)
+    return iter_csv_rows(path)
+
+
+def normalize_batch(rows: Iterable[Mapping[str, Any]]) -> Tuple[List[ClientRecord], int]:
+    """Return staging records for valid rows together with the number of rejected rows."""
+
+    records: List[ClientRecord] = []
+    rejected = 0
+    for row in rows:
+        raw_phone = _pick(row, PHONE_COLUMNS)
+        if raw_phone is None:
+            rejected += 1
+            continue
+        try:
+            phone_number = normalize_kz_phone(raw_phone)
+        except PhoneValidationError:
+            rejected += 1
+            continue
+        records.append(
+            (
+                phone_number,
+                extract_suffix(phone_number),
+                _pick(row, NAME_COLUMNS),
+                _pick(row, CITY_COLUMNS),
+            )
+        )
+    return records, rejected
+
+
+def _batched(rows: Iterable[Mapping[str, Any]], size: int) -> Iterator[List[Mapping[str, Any]]]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+async def _resolve_manager_id(connection: Any, telegram_id: int) -> int:
+    manager_id = await connection.fetchval(
+        "SELECT id FROM managers WHERE telegram_id = $1", telegram_id
+    )
+    if manager_id is None:
+        raise ValueError(f"Manager with telegram_id={telegram_id} does not exist")
+    return int(manager_id)
+
+
+async def import_clients(
+    engine: AsyncEngine,
+    rows: Iterable[Mapping[str, Any]],
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    manager_telegram_id: Optional[int] = None,
+) -> ImportReport:
+    """Load ``rows`` into ``clients`` and return the import counters.
+
+    When ``manager_telegram_id`` is given, a new deal assigned to that manager
+    is created for every client inserted by this run.
+    """
+
+    report = ImportReport()
+    async with engine.connect() as sa_connection:
+        raw_connection = await sa_connection.get_raw_connection()
+        connection = raw_connection.driver_connection
+        assert connection is not None, "the asyncpg connection is closed"
+
+        manager_id = None
+        if manager_telegram_id is not None:
+            manager_id = await _resolve_manager_id(connection, manager_telegram_id)
+
+        for batch in _batched(rows, batch_size):
+            records, rejected = normalize_batch(batch)
+            report.rejected += rejected
+            if not records:
+                continue
+
+            async with connection.transaction():
+                await connection.execute(_CREATE_STAGING_SQL)
+                await connection.copy_records_to_table(
+                    _STAGING_TABLE, records=records, columns=_STAGING_COLUMNS
+                )
+                if manager_id is None:
+                    merged = await connection.fetchrow(_MERGE_SQL)
+                else:
+                    merged = await connection.fetchrow(
+                        _MERGE_WITH_DEALS_SQL, manager_id, DealStatus.NEW.value
+                    )
+
+            report.inserted += merged["inserted"]
+            report.deals_created += merged["deals"]
+            report.skipped += len(records) - merged["inserted"]
+            logger.info(
+                "Imported batch: inserted=%s skipped=%s rejected=%s",
+                merged["inserted"],
+                len(records) - merged["inserted"],
+                rejected,
+            )
+    return report
+
+
+__all__ = [
+    "DEFAULT_BATCH_SIZE",
+    "ImportReport",
+    "import_clients",
+    "iter_source_rows",
+    "normalize_batch",
+]
@@ -0,0 +1,149 @@
+"""Fuzzy search over a manager's clients by name, city and phone fragments.
+
+On PostgreSQL candidates come from the ``pg_trgm`` GIN indexes created by
+migration ``0005_client_trigram_search``:
+
+* the query text is matched against ``name`` and ``city`` with the word
+  similarity operator ``<%``, which finds partial words such as "Иван" in
+  "Иванов Иван";
+* three or more digits in the query are matched as a ``LIKE '%digits%'``
+  fragment of ``phone_number``.
+
+Candidates are restricted to clients the manager has deals with, ranked by the
+best of the three signals and capped at ``limit``. Only then is the manager's
+newest deal looked up for each of them (``ix_deal_client_manager``). Other
+dialects (SQLite in tests) fall back to ``LIKE`` matching with the same result
+shape.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy import ColumnElement, case, func, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from tgcrm.db.instrumentation import tag_queries
+from tgcrm.db.models import Client, Deal
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 25
+MIN_PHONE_FRAGMENT = 3
+# Weight of a city match relative to a name match of the same similarity.
+CITY_WEIGHT = 0.8
+
+
+@dataclass(frozen=True)
+class ClientMatch:
+    """A ranked search hit with the manager's newest deal for that client."""
+
+    client_id: int
+    name: Optional[str]
+    phone_number: str
+    city: Optional[str]
+    deal_id: int
+    score: float
+
+
+def _phone_fragment(query: str) -> Optional[str]:
+    digits = re.sub(r"\D", "", query)
+    return digits if len(digits) >= MIN_PHONE_FRAGMENT else None
+
+
+def _text_part(query: str) -> Optional[str]:
+    text = re.sub(r"[\d+()\-]", " ", query)
+    text = " ".join(text.split())
+    return text or None
+
+
+def _postgresql_signals(text: Optional[str], phone: Optional[str]) -> tuple[list, list]:
+    conditions: List[ColumnElement[bool]] = []
+    scores: list = []
+    if text:
+        needle = literal(text)
+        conditions.append(needle.op("<%")(Client.name))
+        conditions.append(needle.op("<%")(Client.city))
+        scores.append(func.coalesce(func.word_similarity(needle, Client.name), 0))
+        scores.append(func.coalesce(func.word_similarity(needle, Client.city), 0) * CITY_WEIGHT)
+    if phone:
+        matches_phone = Client.phone_number.like(f"%{phone}%")
+        conditions.append(matches_phone)
+        scores.append(case((matches_phone, 1.0), else_=0.0))
+    return conditions, scores
+
+
+def _generic_signals(text: Optional[str], phone: Optional[str]) -> tuple[list, list]:
+    conditions: List[ColumnElement[bool]] = []
+    scores: list = []
+    if text:
+        pattern = f"%{text}%"
+        matches_name = Client.name.ilike(pattern)
+        matches_city = Client.city.ilike(pattern)
+        conditions.extend([matches_name, matches_city])
+        scores.append(case((matches_name, 1.0), else_=0.0))
+        scores.append(case((matches_city, CITY_WEIGHT), else_=0.0))
+    if phone:
+        matches_phone = Client.phone_number.like(f"%{phone}%")
+        conditions.append(matches_phone)
+        scores.append(case((matches_phone, 1.0), else_=0.0))
+    return conditions, scores
+
+
+@tag_queries(budget=1)
+async def search_clients(
+    session: AsyncSession, *, manager_id: int, query: str, limit: int = DEFAULT_LIMIT
+) -> List[ClientMatch]:
+    """Return the manager's clients best matching ``query``, best first."""
+
+    text, phone = _text_part(query), _phone_fragment(query)
+    if not text and not phone:
+        return []
+
+    is_postgresql = session.bind is not None and session.bind.dialect.name == "postgresql"
+    conditions, scores = (_postgresql_signals if is_postgresql else _generic_signals)(text, phone)
+    if len(scores) == 1:
+        score = scores[0]
+    elif is_postgresql:
+        score = func.greatest(*scores)
+    else:
+        # SQLite spells the scalar maximum as a multi-argument max().
+        score = func.max(*scores)
+
+    my_clients = select(Deal.client_id).where(Deal.manager_id == manager_id)
+    top = (
+        select(
+            Client.id.label("client_id"),
+            Client.name,
+            Client.phone_number,
+            Client.city,
+            score.label("score"),
+        )
+        .where(or_(*conditions), Client.id.in_(my_clients))
+        .order_by(score.desc(), Client.id.desc())
+        .limit(max(1, min(limit, MAX_LIMIT)))
+        .subquery()
+    )
+    # The newest deal is resolved only for the capped result set.
+    newest_deal = (
+        select(Deal.id)
+        .where(Deal.client_id == top.c.client_id, Deal.manager_id == manager_id)
+        .order_by(Deal.created_at.desc(), Deal.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    statement = select(
+        top.c.client_id,
+        top.c.name,
+        top.c.phone_number,
+        top.c.city,
+        newest_deal.label("deal_id"),
+        top.c.score,
+    ).order_by(top.c.score.desc(), top.c.client_id.desc())
+    rows = (await session.execute(statement)).all()
+    return [
+        ClientMatch(**{**row._mapping, "score": float(row._mapping["score"])}) for row in rows
+    ]
+
+
+__all__ = ["ClientMatch", "DEFAULT_LIMIT", "MAX_LIMIT", "search_clients"]
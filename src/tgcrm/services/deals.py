@@ -1,20 +1,119 @@
 """Domain services for client and deal workflows."""
 from __future__ import annotations
 
+import math
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Optional
+from decimal import Decimal
+from itertools import islice
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-from sqlalchemy import select
+from sqlalchemy import Select, insert, literal, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 
-from sqlalchemy.orm import joinedload
-
+from tgcrm.db.instrumentation import BudgetedCall, tag_queries
 from tgcrm.db.models import Client, Deal, Interaction, Invoice, InvoiceItem, Manager, Reminder
-from tgcrm.db.statuses import DealStatus, normalize_status, validate_status_transition
+from tgcrm.db.statuses import (
+    TERMINAL_STATUS_VALUES,
+    DealStatus,
+    normalize_status,
+    validate_status_transition,
+)
+from tgcrm.services.manager_cache import ManagerIdentity, manager_cache
 from tgcrm.services.pdf_processing import InvoiceData
 from tgcrm.services.phones import extract_suffix, normalize_kz_phone
 
+RECENT_INTERACTIONS_LIMIT = 20
+DEALS_PAGE_SIZE = 10
+# Rows per multi-row INSERT of invoice line items.
+INVOICE_ITEMS_CHUNK_SIZE = 500
+
+# Listing filters: ``None`` means every status. Single-status filters map onto
+# ``ix_deal_manager_status_created``.
+DEAL_FILTERS: Dict[str, Optional[Tuple[str, ...]]] = {
+    "all": None,
+    "active": tuple(
+        status.value for status in DealStatus if status.value not in TERMINAL_STATUS_VALUES
+    ),
+    **{status.name.lower(): (status.value,) for status in DealStatus},
+}
+
+
+@dataclass(frozen=True)
+class DealSummary:
+    """Columns needed to show a deal card without loading the object graph."""
+
+    id: int
+    status: str
+    amount: Optional[Decimal]
+    created_at: datetime
+    last_interaction_at: Optional[datetime]
+    client_id: int
+    client_name: Optional[str]
+    client_phone: str
+    client_city: Optional[str]
+
+
+@dataclass(frozen=True)
+class DealCursor:
+    """Position of a deal in the ``(created_at, id)`` listing order."""
+
+    created_at: datetime
+    id: int
+
+    def to_state(self) -> List[Any]:
+        return [self.created_at.isoformat(), self.id]
+
+    @classmethod
+    def from_state(cls, value: Sequence[Any]) -> "DealCursor":
+        return cls(created_at=datetime.fromisoformat(value[0]), id=int(value[1]))
+
 
+@dataclass(frozen=True)
+class DealPage:
+    """A page of the deal listing together with its boundary cursors."""
+
+    items: List[DealSummary]
+    has_next: bool
+    has_prev: bool
+
+    @property
+    def first(self) -> Optional[DealCursor]:
+        return DealCursor(self.items[0].created_at, self.items[0].id) if self.items else None
+
+    @property
+    def last(self) -> Optional[DealCursor]:
+        return DealCursor(self.items[-1].created_at, self.items[-1].id) if self.items else None
+
+
+def _deal_summary_query() -> Select:
+    return select(
+        Deal.id,
+        Deal.status,
+        Deal.amount,
+        Deal.created_at,
+        Deal.last_interaction_at,
+        Client.id.label("client_id"),
+        Client.name.label("client_name"),
+        Client.phone_number.label("client_phone"),
+        Client.city.label("client_city"),
+    ).join(Deal.client)
+
+
+@tag_queries(budget=2)
 async def get_or_create_client(
     session: AsyncSession,
     phone_number: str,
@@ -41,6 +140,7 @@ async def get_or_create_client(
     return client
 
 
+@tag_queries(budget=1)
 async def create_deal_for_manager(
     session: AsyncSession, client: Client, manager: Manager, status: str = "Новый"
 ) -> Deal:
@@ -50,44 +150,247 @@ async def create_deal_for_manager(
     return deal
 
 
-async def attach_invoice(
-    session: AsyncSession, deal: Deal, invoice_data: InvoiceData, file_path: str
-) -> Invoice:
-    invoice = Invoice(deal=deal, file_path=file_path, total_amount=invoice_data.total_amount)
-    session.add(invoice)
-    await session.flush()
+LineItem = Tuple[int, str]
+
+
+def _invoice_items_budget(call: BudgetedCall) -> int:
+    """One INSERT per chunk of line items."""
+
+    return math.ceil(len(call.result) / call.arguments["chunk_size"])
+
+
+def _attach_invoice_stream_budget(call: BudgetedCall) -> int:
+    _, count = call.result
+    return 2 + math.ceil(count / call.arguments["chunk_size"])
+
+
+def _attach_invoice_budget(call: BudgetedCall) -> int:
+    count = len(call.arguments["invoice_data"].line_items)
+    return 2 + math.ceil(count / INVOICE_ITEMS_CHUNK_SIZE)
+
+
+async def _chunks(
+    line_items: Union[Iterable[LineItem], AsyncIterable[LineItem]], size: int
+) -> AsyncIterator[List[LineItem]]:
+    if not isinstance(line_items, AsyncIterable):
+        iterator = iter(line_items)
+        while batch := list(islice(iterator, size)):
+            yield batch
+        return
+
+    chunk: List[LineItem] = []
+    async for item in line_items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@tag_queries(budget=_invoice_items_budget)
+async def insert_invoice_items(
+    session: AsyncSession,
+    invoice_id: int,
+    line_items: Union[Iterable[LineItem], AsyncIterable[LineItem]],
+    *,
+    chunk_size: int = INVOICE_ITEMS_CHUNK_SIZE,
+) -> List[int]:
+    """Insert ``(line_number, description)`` pairs and return the new ids in input order.
+
+    Each chunk is one ``INSERT ... VALUES (...), (...) RETURNING id`` statement,
+    so only ``chunk_size`` items are held in memory at a time and the items are
+    not added to the session's identity map.
+    """
+
+    # RETURNING row order is not guaranteed for multi-row VALUES on every backend; line
+    # numbers are unique per invoice (uq_invoice_line), so ids are matched through them.
+    statement = insert(InvoiceItem).returning(InvoiceItem.line_number, InvoiceItem.id)
+    ids: List[int] = []
+    async for chunk in _chunks(line_items, chunk_size):
+        result = await session.execute(
+            statement,
+            [
+                {
+                    "invoice_id": invoice_id,
+                    "line_number": line_number,
+                    "item_description": description,
+                }
+                for line_number, description in chunk
+            ],
+        )
+        id_by_line = dict(result.tuples().all())
+        ids.extend(id_by_line[line_number] for line_number, _ in chunk)
+    return ids
+
+
+@tag_queries(budget=_attach_invoice_stream_budget)
+async def attach_invoice_stream(
+    session: AsyncSession,
+    deal: Deal,
+    *,
+    total_amount: Union[Decimal, float],
+    file_path: str,
+    line_items: Union[Iterable[LineItem], AsyncIterable[LineItem]],
+    chunk_size: int = INVOICE_ITEMS_CHUNK_SIZE,
+) -> Tuple[Invoice, int]:
+    """Attach an invoice whose line items are consumed lazily from an iterator.
+
+    Returns the invoice and the number of inserted line items.
+    """
 
-    deal.amount = invoice_data.total_amount
     validate_status_transition(deal.status, DealStatus.INVOICE_SENT.value)
+    invoice = Invoice(deal=deal, file_path=file_path, total_amount=total_amount)
+    session.add(invoice)
+    deal.amount = total_amount
     deal.status = DealStatus.INVOICE_SENT.value
+    await session.flush()
 
-    for line_number, description in invoice_data.line_items:
-        item = InvoiceItem(invoice=invoice, line_number=line_number, item_description=description)
-        session.add(item)
+    ids = await insert_invoice_items(session, invoice.id, line_items, chunk_size=chunk_size)
+    return invoice, len(ids)
 
-    await session.flush()
+
+@tag_queries(budget=_attach_invoice_budget)
+async def attach_invoice(
+    session: AsyncSession, deal: Deal, invoice_data: InvoiceData, file_path: str
+) -> Invoice:
+    invoice, _ = await attach_invoice_stream(
+        session,
+        deal,
+        total_amount=invoice_data.total_amount,
+        file_path=file_path,
+        line_items=invoice_data.line_items,
+    )
     return invoice
 
 
+@tag_queries(budget=1)
+async def find_deal_summary_by_phone_suffix(
+    session: AsyncSession, *, phone_suffix: str, manager_id: int
+) -> Optional[DealSummary]:
+    """Return the newest deal of the manager whose client phone ends with ``phone_suffix``."""
+
+    query = (
+        _deal_summary_query()
+        .where(Client.phone_suffix == phone_suffix[-4:], Deal.manager_id == manager_id)
+        .order_by(Deal.created_at.desc(), Deal.id.desc())
+        .limit(1)
+    )
+    row = (await session.execute(query)).one_or_none()
+    return DealSummary(**row._mapping) if row else None
+
+
+@tag_queries(budget=1)
+async def get_deal_summary(
+    session: AsyncSession, *, deal_id: int, manager_id: int
+) -> Optional[DealSummary]:
+    query = _deal_summary_query().where(Deal.id == deal_id, Deal.manager_id == manager_id)
+    row = (await session.execute(query)).one_or_none()
+    return DealSummary(**row._mapping) if row else None
+
+
+@tag_queries(budget=1)
+async def list_deals_page(
+    session: AsyncSession,
+    *,
+    manager_id: int,
+    status_filter: str = "all",
+    cursor: Optional[DealCursor] = None,
+    backwards: bool = False,
+    limit: int = DEALS_PAGE_SIZE,
+) -> DealPage:
+    """Return one page of the manager's deals, newest first.
+
+    Pages are addressed by a keyset cursor on ``(created_at, id)``: ``cursor``
+    is the last row of the current page when moving forward and its first row
+    when ``backwards`` is set. Every page is a bounded range scan of
+    ``ix_deal_manager_created`` or, for a single status,
+    ``ix_deal_manager_status_created``, so its cost does not depend on how deep
+    the manager has scrolled.
+    """
+
+    if status_filter not in DEAL_FILTERS:
+        raise ValueError(f"Unknown deal filter: {status_filter}")
+
+    query = _deal_summary_query().where(Deal.manager_id == manager_id)
+    statuses = DEAL_FILTERS[status_filter]
+    if statuses is not None:
+        query = query.where(
+            Deal.status == statuses[0] if len(statuses) == 1 else Deal.status.in_(statuses)
+        )
+
+    key = tuple_(Deal.created_at, Deal.id)
+    if cursor is not None:
+        bound = tuple_(literal(cursor.created_at, Deal.created_at.type), literal(cursor.id))
+        query = query.where(key > bound if backwards else key < bound)
+    if backwards:
+        query = query.order_by(Deal.created_at.asc(), Deal.id.asc())
+    else:
+        query = query.order_by(Deal.created_at.desc(), Deal.id.desc())
+
+    # One extra row tells whether another page exists in the walking direction.
+    rows = (await session.execute(query.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    items = [DealSummary(**row._mapping) for row in rows[:limit]]
+    if backwards:
+        items.reverse()
+        return DealPage(items=items, has_next=cursor is not None, has_prev=has_more)
+    return DealPage(items=items, has_next=has_more, has_prev=cursor is not None)
+
+
+@tag_queries(budget=1)
+async def load_recent_interactions(
+    session: AsyncSession, deal: Deal, *, limit: int = RECENT_INTERACTIONS_LIMIT
+) -> List[Interaction]:
+    """Populate ``deal.interactions`` with only the newest ``limit`` interactions.
+
+    The collection is set as already loaded, so code iterating it (for example
+    the AI history prompt) sees the recent slice without a lazy load of the
+    whole history.
+    """
+
+    query = (
+        select(Interaction)
+        .where(Interaction.deal_id == deal.id)
+        .order_by(Interaction.created_at.desc(), Interaction.id.desc())
+        .limit(limit)
+    )
+    recent = list(reversed((await session.execute(query)).scalars().all()))
+    set_committed_value(deal, "interactions", recent)
+    return recent
+
+
+@tag_queries(budget=2)
 async def get_active_deal_by_phone_suffix(
-    session: AsyncSession, *, phone_suffix: str, manager: Manager
+    session: AsyncSession,
+    *,
+    phone_suffix: str,
+    manager: Manager,
+    interactions_limit: int = RECENT_INTERACTIONS_LIMIT,
 ) -> Optional[Deal]:
+    """Load the newest matching deal with its client and the last interactions.
+
+    Invoices are not loaded here; callers that need them await
+    ``deal.awaitable_attrs.invoices``.
+    """
+
     suffix = phone_suffix[-4:]
     query = (
         select(Deal)
-        .options(
-            joinedload(Deal.client),
-            joinedload(Deal.interactions),
-            joinedload(Deal.invoices).joinedload(Invoice.items),
-        )
+        .options(joinedload(Deal.client))
         .join(Deal.client)
         .where(Client.phone_suffix == suffix, Deal.manager_id == manager.id)
-        .order_by(Deal.created_at.desc())
+        .order_by(Deal.created_at.desc(), Deal.id.desc())
+        .limit(1)
     )
     result = await session.execute(query)
-    return result.scalars().first()
+    deal = result.scalars().first()
+    if deal is not None:
+        await load_recent_interactions(session, deal, limit=interactions_limit)
+    return deal
 
 
+@tag_queries(budget=2)
 async def log_interaction(
     session: AsyncSession,
     deal: Deal,
@@ -95,19 +398,23 @@ async def log_interaction(
     interaction_type: str,
     ai_advice: Optional[str],
     manager_summary: str,
+    created_at: Optional[datetime] = None,
 ) -> Interaction:
-    deal.last_interaction_at = datetime.now(timezone.utc)
+    created_at = created_at or datetime.now(timezone.utc)
+    deal.last_interaction_at = created_at
     interaction = Interaction(
         deal=deal,
         type=interaction_type,
         ai_advice=ai_advice,
         manager_summary=manager_summary,
+        created_at=created_at,
     )
     session.add(interaction)
     await session.flush()
     return interaction
 
 
+@tag_queries(budget=1)
 async def create_reminder(
     session: AsyncSession,
     deal: Deal,
@@ -120,6 +427,7 @@ async def create_reminder(
     return reminder
 
 
+@tag_queries(budget=1)
 async def change_deal_status(session: AsyncSession, deal: Deal, new_status: str) -> Deal:
     normalized = normalize_status(new_status)
     validate_status_transition(deal.status, normalized)
@@ -128,13 +436,31 @@ async def change_deal_status(session: AsyncSession, deal: Deal, new_status: str)
     return deal
 
 
-async def ensure_manager(session: AsyncSession, telegram_id: int, *, name: Optional[str] = None) -> Manager:
+@tag_queries(budget=2)
+async def ensure_manager(
+    session: AsyncSession, telegram_id: int, *, name: Optional[str] = None
+) -> Manager:
+    """Return the manager for ``telegram_id``, creating it on first contact.
+
+    Known managers are served from :data:`manager_cache` and attached to the
+    session without a SELECT.
+    """
+
+    identity = manager_cache.get(telegram_id)
+    if identity is not None and not (name and not identity.name):
+        manager = Manager(
+            id=identity.id, telegram_id=identity.telegram_id, name=identity.name, role=identity.role
+        )
+        make_transient_to_detached(manager)
+        return await session.merge(manager, load=False)
+
     result = await session.execute(select(Manager).where(Manager.telegram_id == telegram_id))
     manager = result.scalar_one_or_none()
     if manager:
         if name and not manager.name:
             manager.name = name
             await session.flush()
+        manager_cache.put(ManagerIdentity.from_model(manager))
         return manager
 
     manager = Manager(telegram_id=telegram_id, name=name, role="manager")
@@ -144,12 +470,25 @@ async def ensure_manager(session: AsyncSession, telegram_id: int, *, name: Optio
 
 
 __all__ = [
+    "DEAL_FILTERS",
+    "DEALS_PAGE_SIZE",
+    "DealCursor",
+    "DealPage",
+    "DealSummary",
+    "INVOICE_ITEMS_CHUNK_SIZE",
+    "RECENT_INTERACTIONS_LIMIT",
     "attach_invoice",
+    "attach_invoice_stream",
     "change_deal_status",
     "create_deal_for_manager",
     "create_reminder",
     "ensure_manager",
+    "find_deal_summary_by_phone_suffix",
     "get_active_deal_by_phone_suffix",
+    "get_deal_summary",
     "get_or_create_client",
+    "insert_invoice_items",
+    "list_deals_page",
+    "load_recent_interactions",
     "log_interaction",
 ]
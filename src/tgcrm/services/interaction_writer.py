@@ -0,0 +1,495 @@
+"""Write-behind buffer for manager interactions.
+
+With ``INTERACTIONS_WRITE_BEHIND=true`` the bot acknowledges a logged
+interaction as soon as it is queued in memory. A background task writes the
+queue in batches, either every ``INTERACTIONS_FLUSH_INTERVAL_MS`` or as soon as
+``INTERACTIONS_FLUSH_MAX_ROWS`` rows are waiting, whichever comes first. Each
+batch is one transaction with one multi-row INSERT into ``interactions`` and
+one ``last_interaction_at`` UPDATE per deal.
+
+Durability:
+
+* when the in-memory queue holds ``INTERACTIONS_BUFFER_LIMIT`` rows, new rows
+  are spilled to a Redis list and drained by the flusher, including the
+  flusher of the next process if this one dies;
+* if neither the queue nor Redis has room, the row is written synchronously;
+* a batch that fails because the database is unreachable goes back to the
+  head of the queue and is retried until it is written;
+* a batch that fails ``INTERACTIONS_FLUSH_MAX_ATTEMPTS`` times in a row for
+  any other reason is bisected. The halves that can be written are written.
+  Single rows that still fail are logged with the error and pushed to the Redis
+  list :data:`DEAD_LETTER_KEY`, so one bad row cannot block the queue;
+* :meth:`InteractionWriter.stop` flushes everything. Rows that still cannot
+  be written are spilled to Redis.
+
+AI advice usually arrives after its interaction was acknowledged.
+:meth:`InteractionWriter.attach_advice` updates a row still queued in memory;
+for a row being written or spilled to Redis it keeps the advice until the
+row is written, and stores it with an UPDATE once the queue and the spill
+are flushed.
+
+Only rows acknowledged within the last flush interval of a process that is
+killed without running ``stop`` can be lost.
+"""
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import json
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, cast
+
+from sqlalchemy import CursorResult, bindparam, insert, or_, update
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from tgcrm.db.instrumentation import tag_queries
+from tgcrm.db.models import Deal, Interaction
+
+logger = logging.getLogger(__name__)
+
+SPILL_KEY = "tgcrm:interactions:spill"
+DEAD_LETTER_KEY = "tgcrm:interactions:dead"
+
+_deals = Deal.__table__
+_interactions = Interaction.__table__
+_ATTACH_ADVICE = (
+    update(_interactions)
+    .where(
+        _interactions.c.deal_id == bindparam("b_deal_id"),
+        _interactions.c.created_at == bindparam("b_created_at"),
+        _interactions.c.ai_advice.is_(None),
+    )
+    .values(ai_advice=bindparam("b_advice"))
+)
+_UPDATE_LAST_INTERACTION = (
+    update(_deals)
+    .where(
+        _deals.c.id == bindparam("b_deal_id"),
+        or_(
+            _deals.c.last_interaction_at.is_(None),
+            _deals.c.last_interaction_at < bindparam("b_at"),
+        ),
+    )
+    .values(last_interaction_at=bindparam("b_at"))
+)
+
+
+@dataclass(frozen=True)
+class PendingInteraction:
+    """An acknowledged interaction that has not been written yet."""
+
+    deal_id: int
+    type: str
+    manager_summary: str
+    ai_advice: Optional[str]
+    created_at: datetime
+
+    @classmethod
+    def create(
+        cls, deal_id: int, *, interaction_type: str, manager_summary: str, ai_advice: Optional[str]
+    ) -> "PendingInteraction":
+        return cls(
+            deal_id=deal_id,
+            type=interaction_type,
+            manager_summary=manager_summary,
+            ai_advice=ai_advice,
+            created_at=datetime.now(timezone.utc),
+        )
+
+    @property
+    def key(self) -> Tuple[int, datetime]:
+        return self.deal_id, self.created_at
+
+    def as_row(self) -> Dict[str, Any]:
+        return {
+            "deal_id": self.deal_id,
+            "type": self.type,
+            "manager_summary": self.manager_summary,
+            "ai_advice": self.ai_advice,
+            "created_at": self.created_at,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps({**self.as_row(), "created_at": self.created_at.isoformat()})
+
+    @classmethod
+    def from_json(cls, raw: str | bytes) -> "PendingInteraction":
+        data = json.loads(raw)
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return cls(**data)
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Whether ``exc`` says the database could not be reached rather than the rows are bad."""
+
+    if isinstance(exc, DBAPIError):
+        return exc.connection_invalidated or isinstance(exc, (OperationalError, InterfaceError))
+    return isinstance(exc, (OSError, asyncio.TimeoutError))
+
+
+class InteractionWriter:
+    """Buffered, batched writer for :class:`~tgcrm.db.models.Interaction` rows."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        *,
+        flush_interval: float,
+        max_rows: int,
+        buffer_limit: int,
+        max_attempts: int = 3,
+        redis: Any = None,
+        spill_key: str = SPILL_KEY,
+        dead_letter_key: str = DEAD_LETTER_KEY,
+    ) -> None:
+        self._session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.buffer_limit = buffer_limit
+        self.max_attempts = max_attempts
+        self._redis = redis
+        self._spill_key = spill_key
+        self._dead_letter_key = dead_letter_key
+        self._failures = 0
+        self._buffer: Deque[PendingInteraction] = deque()
+        # Advice for rows that were in flight or spilled when it arrived.
+        self._advice: Dict[Tuple[int, datetime], str] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self._stopping = False
+        self.written = 0
+        self.spilled = 0
+        self.batches = 0
+        self.dead_lettered = 0
+
+    @classmethod
+    def from_settings(cls) -> "InteractionWriter":
+        from redis.asyncio import Redis
+
+        from tgcrm.config import get_settings
+        from tgcrm.db.session import AsyncSessionFactory
+
+        settings = get_settings()
+        database = settings.database
+        return cls(
+            AsyncSessionFactory,
+            flush_interval=database.interactions_flush_interval_ms / 1000,
+            max_rows=database.interactions_flush_max_rows,
+            buffer_limit=database.interactions_buffer_limit,
+            max_attempts=database.interactions_flush_max_attempts,
+            redis=Redis.from_url(settings.redis.dsn),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="interaction-writer")
+
+    async def stop(self) -> None:
+        """Stop the flusher and write (or spill) everything still queued."""
+
+        if self._task is None:
+            return
+        self._stopping = True
+        assert self._wakeup is not None
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+        await self._flush_available()
+        if self._buffer:
+            leftover = list(self._buffer)
+            self._buffer.clear()
+            if not await self._spill(leftover):
+                logger.error("Dropping %s unwritten interactions on shutdown", len(leftover))
+        if self._advice:
+            logger.warning("Dropping AI advice for %s unwritten interactions", len(self._advice))
+            self._advice.clear()
+
+    async def submit(self, item: PendingInteraction) -> None:
+        """Queue ``item``; returns as soon as it is durable enough to acknowledge."""
+
+        if not self.running:
+            raise RuntimeError("InteractionWriter is not running")
+        assert self._wakeup is not None
+        if len(self._buffer) < self.buffer_limit:
+            self._buffer.append(item)
+            if len(self._buffer) >= self.max_rows:
+                self._wakeup.set()
+            return
+        if await self._spill([item]):
+            self._wakeup.set()
+            return
+        # Neither memory nor Redis has room: fall back to a direct write.
+        await self._write([item])
+
+    def attach_advice(self, item: PendingInteraction, advice: str) -> None:
+        """Store ``advice`` with ``item``, wherever the row is on its way to the database."""
+
+        for index, queued in enumerate(self._buffer):
+            if queued is item:
+                self._buffer[index] = dataclasses.replace(item, ai_advice=advice)
+                return
+        # Being written, spilled or already written: applied by the next flush.
+        self._advice[item.key] = advice
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                await self._flush_available()
+            except Exception:  # pragma: no cover - keep the flusher alive
+                logger.exception("Interaction flush failed")
+
+    async def _flush_available(self) -> None:
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.max_rows, len(self._buffer)))]
+            leftover = await self._write_batch(batch)
+            if leftover:
+                self._buffer.extendleft(reversed(leftover))
+                return
+        if await self._drain_spill() and self._advice:
+            await self._write_advice()
+
+    async def _drain_spill(self) -> bool:
+        """Write the spilled rows; returns whether the spill list is empty."""
+
+        if self._redis is None:
+            return True
+        while True:
+            try:
+                raw = await self._redis.lpop(self._spill_key, self.max_rows)
+            except Exception:
+                logger.warning("Could not read spilled interactions", exc_info=True)
+                return False
+            if not raw:
+                return True
+            batch = [PendingInteraction.from_json(item) for item in raw]
+            leftover = await self._write_batch(batch)
+            if leftover:
+                raw_leftover = [item.to_json() for item in reversed(leftover)]
+                await self._redis.lpush(self._spill_key, *raw_leftover)
+                return False
+
+    @tag_queries("interaction_writer.advice")
+    async def _write_advice(self) -> None:
+        """Store the advice that arrived while its row was in flight.
+
+        Runs once the queue and the spill are flushed, so every row the advice
+        belongs to has been written by now, here or by another process.
+        """
+
+        advice = dict(self._advice)
+        try:
+            async with self._session_factory() as session:
+                async with session.begin():
+                    await session.execute(
+                        _ATTACH_ADVICE,
+                        [
+                            {"b_deal_id": deal_id, "b_created_at": created_at, "b_advice": text}
+                            for (deal_id, created_at), text in advice.items()
+                        ],
+                    )
+        except Exception:
+            logger.warning("Could not store AI advice, will retry", exc_info=True)
+            return
+        for key, text in advice.items():
+            if self._advice.get(key) == text:
+                del self._advice[key]
+
+    async def _write_batch(self, batch: List[PendingInteraction]) -> List[PendingInteraction]:
+        """Write ``batch``; returns the rows to put back and retry later."""
+
+        try:
+            await self._write(batch)
+        except Exception as exc:
+            if _is_transient(exc):
+                logger.warning("Database unavailable, %s interactions wait: %s", len(batch), exc)
+                return batch
+            self._failures += 1
+            if self._failures < self.max_attempts:
+                logger.exception(
+                    "Failed to write %s interactions (attempt %s of %s), will retry",
+                    len(batch),
+                    self._failures,
+                    self.max_attempts,
+                )
+                return batch
+            logger.exception(
+                "Failed to write %s interactions %s times, isolating the failing rows",
+                len(batch),
+                self._failures,
+            )
+            self._failures = 0
+            return await self._isolate(batch, exc)
+        self._failures = 0
+        return []
+
+    async def _isolate(
+        self, batch: List[PendingInteraction], error: BaseException
+    ) -> List[PendingInteraction]:
+        """Bisect a failing batch, writing what can be written and dead-lettering the rest."""
+
+        if len(batch) == 1:
+            await self._dead_letter(batch[0], error)
+            return []
+        middle = len(batch) // 2
+        leftover: List[PendingInteraction] = []
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                await self._write(half)
+            except Exception as exc:
+                if _is_transient(exc):
+                    leftover.extend(half)
+                else:
+                    leftover.extend(await self._isolate(half, exc))
+        return leftover
+
+    async def _dead_letter(self, item: PendingInteraction, error: BaseException) -> None:
+        self.dead_lettered += 1
+        logger.error("Dropping interaction that cannot be written: %s (%s)", item.to_json(), error)
+        if self._redis is None:
+            return
+        entry = json.dumps({"interaction": item.to_json(), "error": str(error)})
+        try:
+            await self._redis.rpush(self._dead_letter_key, entry)
+        except Exception:
+            logger.warning("Could not dead-letter the interaction", exc_info=True)
+
+    async def _spill(self, items: List[PendingInteraction]) -> bool:
+        if self._redis is None:
+            return False
+        items = [self._with_advice(item) for item in items]
+        try:
+            await self._redis.rpush(self._spill_key, *(item.to_json() for item in items))
+        except Exception:
+            logger.warning("Could not spill %s interactions to Redis", len(items), exc_info=True)
+            return False
+        self.spilled += len(items)
+        return True
+
+    def _with_advice(self, item: PendingInteraction) -> PendingInteraction:
+        advice = self._advice.get(item.key)
+        if advice is None or item.ai_advice is not None:
+            return item
+        return dataclasses.replace(item, ai_advice=advice)
+
+    @tag_queries("interaction_writer.flush")
+    async def _write(self, batch: List[PendingInteraction]) -> None:
+        batch = [self._with_advice(item) for item in batch]
+        latest: Dict[int, datetime] = {}
+        for item in batch:
+            if item.deal_id not in latest or latest[item.deal_id] < item.created_at:
+                latest[item.deal_id] = item.created_at
+
+        async with self._session_factory() as session:
+            async with session.begin():
+                await session.execute(insert(Interaction), [item.as_row() for item in batch])
+                await session.execute(
+                    _UPDATE_LAST_INTERACTION,
+                    [{"b_deal_id": deal_id, "b_at": at} for deal_id, at in latest.items()],
+                )
+        self.written += len(batch)
+        self.batches += 1
+
+
+_writer: Optional[InteractionWriter] = None
+
+
+async def record_interaction(
+    session: AsyncSession,
+    deal: Deal,
+    *,
+    interaction_type: str,
+    ai_advice: Optional[str],
+    manager_summary: str,
+) -> PendingInteraction:
+    """Queue the interaction when write-behind is running, otherwise insert it in ``session``.
+
+    The returned item identifies the interaction for :func:`attach_ai_advice`.
+    """
+
+    item = PendingInteraction.create(
+        deal.id,
+        interaction_type=interaction_type,
+        manager_summary=manager_summary,
+        ai_advice=ai_advice,
+    )
+    if _writer is not None and _writer.running:
+        await _writer.submit(item)
+        return item
+
+    from tgcrm.services.deals import log_interaction
+
+    await log_interaction(
+        session,
+        deal,
+        interaction_type=interaction_type,
+        ai_advice=ai_advice,
+        manager_summary=manager_summary,
+        created_at=item.created_at,
+    )
+    return item
+
+
+@tag_queries(budget=1)
+async def attach_ai_advice(session: AsyncSession, item: PendingInteraction, advice: str) -> bool:
+    """Store ``advice`` on an interaction recorded earlier by :func:`record_interaction`.
+
+    While write-behind is running the writer owns the row and stores the
+    advice with it (see :meth:`InteractionWriter.attach_advice`). Otherwise the
+    row is updated in ``session``. Returns ``False`` if the row was not found.
+    """
+
+    if _writer is not None and _writer.running:
+        _writer.attach_advice(item, advice)
+        return True
+    result = await session.execute(
+        _ATTACH_ADVICE,
+        {"b_deal_id": item.deal_id, "b_created_at": item.created_at, "b_advice": advice},
+    )
+    if cast(CursorResult, result).rowcount == 0:
+        logger.info("AI advice for an interaction of deal %s was not stored", item.deal_id)
+        return False
+    return True
+
+
+def get_interaction_writer() -> InteractionWriter:
+    """Return the process-wide writer, creating it from settings on first use."""
+
+    global _writer
+    if _writer is None:
+        _writer = InteractionWriter.from_settings()
+    return _writer
+
+
+__all__ = [
+    "DEAD_LETTER_KEY",
+    "InteractionWriter",
+    "PendingInteraction",
+    "SPILL_KEY",
+    "attach_ai_advice",
+    "get_interaction_writer",
+    "record_interaction",
+]
@@ -0,0 +1,128 @@
+"""Per-process cache of manager identities keyed by Telegram id.
+
+Nearly every update resolves the sending manager through
+:func:`tgcrm.services.deals.ensure_manager`. The identity (primary key, role
+and name) changes rarely, so it is kept in a bounded LRU cache with a TTL.
+Entries are dropped whenever a ``Manager`` row is updated or deleted through
+the ORM in this process. The TTL bounds how long changes made elsewhere
+(another worker, manual SQL) can stay unnoticed.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import event, inspect
+
+from tgcrm.config import get_settings
+from tgcrm.db.models import Manager
+
+
+@dataclass(frozen=True)
+class ManagerIdentity:
+    """Immutable snapshot of the manager columns handlers rely on."""
+
+    id: int
+    telegram_id: int
+    name: Optional[str]
+    role: str
+
+    @classmethod
+    def from_model(cls, manager: Manager) -> "ManagerIdentity":
+        return cls(
+            id=manager.id,
+            telegram_id=manager.telegram_id,
+            name=manager.name,
+            role=manager.role,
+        )
+
+
+class ManagerIdentityCache:
+    """Bounded LRU cache with per-entry expiry.
+
+    ``maxsize`` and ``ttl`` left as ``None`` are read from
+    ``MANAGER_CACHE_SIZE`` and ``MANAGER_CACHE_TTL`` on first use, not when
+    the module is imported.
+    """
+
+    def __init__(
+        self,
+        *,
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[int, tuple[float, ManagerIdentity]]" = OrderedDict()
+        # Mapper events may fire from Celery worker threads.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _configure(self) -> Tuple[int, float]:
+        """Return ``(maxsize, ttl)``, filling the unset ones from settings."""
+
+        if self.maxsize is None or self.ttl is None:
+            behaviour = get_settings().behaviour
+            if self.maxsize is None:
+                self.maxsize = behaviour.manager_cache_size
+            if self.ttl is None:
+                self.ttl = behaviour.manager_cache_ttl
+        return self.maxsize, self.ttl
+
+    def get(self, telegram_id: int) -> Optional[ManagerIdentity]:
+        with self._lock:
+            self._configure()
+            entry = self._entries.get(telegram_id)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[telegram_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(telegram_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, identity: ManagerIdentity) -> None:
+        with self._lock:
+            maxsize, ttl = self._configure()
+            if maxsize <= 0:
+                return
+            self._entries[identity.telegram_id] = (self._clock() + ttl, identity)
+            self._entries.move_to_end(identity.telegram_id)
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: int) -> None:
+        with self._lock:
+            self._entries.pop(telegram_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+manager_cache = ManagerIdentityCache()
+
+
+@event.listens_for(Manager, "after_update")
+@event.listens_for(Manager, "after_delete")
+def _invalidate_manager(mapper, connection, target: Manager) -> None:  # noqa: ARG001
+    manager_cache.invalidate(target.telegram_id)
+    # A changed telegram_id must also evict the entry stored under the old value.
+    for previous in inspect(target).attrs.telegram_id.history.deleted or ():
+        manager_cache.invalidate(previous)
+
+
+__all__ = ["ManagerIdentity", "ManagerIdentityCache", "manager_cache"]
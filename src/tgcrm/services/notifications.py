@@ -2,24 +2,72 @@
 from __future__ import annotations
 
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, AsyncIterator, Optional
 
-from aiogram import Bot
+if TYPE_CHECKING:
+    from aiogram import Bot
 
-from tgcrm.bot.bot_factory import create_bot
+
+class _SharedBot:
+    """The bot of a :func:`notification_bot` block, created by its first send."""
+
+    def __init__(self) -> None:
+        self.bot: Optional[Bot] = None
+
+    def get(self) -> Bot:
+        if self.bot is None:
+            self.bot = _create_bot()
+        return self.bot
+
+
+_shared_bot: ContextVar[Optional[_SharedBot]] = ContextVar("tgcrm_notification_bot", default=None)
+
+
+def _create_bot() -> Bot:
+    # aiogram is only needed once a task actually sends something.
+    from tgcrm.bot.bot_factory import create_bot
+
+    return create_bot()
 
 
 @asynccontextmanager
-async def _bot_context() -> Bot:
-    bot = create_bot()
+async def _bot_context() -> AsyncIterator[Bot]:
+    bot = _create_bot()
     try:
         yield bot
     finally:
         await bot.session.close()
 
 
+@asynccontextmanager
+async def notification_bot() -> AsyncIterator[None]:
+    """Send every :func:`send_notification` inside the block through one bot.
+
+    The bot and its HTTP session are created by the first send and closed when
+    the block exits, so a task run reuses one connection pool for all its sends.
+    """
+
+    if _shared_bot.get() is not None:
+        yield
+        return
+    shared = _SharedBot()
+    token = _shared_bot.set(shared)
+    try:
+        yield
+    finally:
+        _shared_bot.reset(token)
+        if shared.bot is not None:
+            await shared.bot.session.close()
+
+
 async def send_notification(telegram_id: int, text: str) -> None:
+    shared = _shared_bot.get()
+    if shared is not None:
+        await shared.get().send_message(telegram_id, text)
+        return
     async with _bot_context() as bot:
         await bot.send_message(telegram_id, text)
 
 
-__all__ = ["send_notification"]
+__all__ = ["notification_bot", "send_notification"]
@@ -1,13 +1,13 @@
-"""Utilities for extracting data from PDF invoices."""
+"""Utilities for extracting data from PDF invoices.
+
+PyMuPDF, Tesseract and Pillow are imported by the first PDF being parsed,
+not with this module, which the deal services import for :class:`InvoiceData`.
+"""
 from __future__ import annotations
 
 from pathlib import Path
 from typing import List, Tuple
 
-import fitz  # PyMuPDF
-import pytesseract
-from PIL import Image
-
 
 class InvoiceData:
     """Structured invoice information."""
@@ -20,6 +20,10 @@ class InvoiceData:
 def extract_text_from_pdf(pdf_path: Path) -> str:
     """Return the full text content of a PDF file using PyMuPDF and Tesseract for images."""
 
+    import fitz  # PyMuPDF
+    import pytesseract
+    from PIL import Image
+
     document = fitz.open(pdf_path)
     texts: List[str] = []
     for page in document:
@@ -1,13 +1,36 @@
-"""Persistence helpers for runtime bot settings."""
+"""Persistence helpers for runtime bot settings.
+
+Overrides stored in ``bot_settings`` change a few times a month but are read on
+hot paths (AI key, supervisor password, working hours), so every process keeps
+them in :data:`settings_cache`. Committing a change made with
+:func:`set_setting` or :func:`delete_setting` increments a version counter in
+Redis and publishes it on :data:`INVALIDATION_CHANNEL`, from a task started
+once the commit has returned. Processes running
+:func:`start_invalidation_listener` reload on the next read. Processes that are
+not subscribed notice the change through ``max_age``.
+"""
 from __future__ import annotations
 
-from typing import Dict
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, event, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
+from tgcrm.config import get_settings
 from tgcrm.db.models import BotSetting
 
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "tgcrm:bot_settings:invalidate"
+VERSION_KEY = "tgcrm:bot_settings:version"
+DEFAULT_MAX_AGE = 60.0
+_DIRTY_FLAG = "bot_settings_changed"
+
 
 async def set_setting(session: AsyncSession, key: str, value: str) -> None:
     existing = await session.execute(select(BotSetting).where(BotSetting.key == key))
@@ -17,6 +40,7 @@ async def set_setting(session: AsyncSession, key: str, value: str) -> None:
     else:
         session.add(BotSetting(key=key, value=value))
     await session.flush()
+    session.info[_DIRTY_FLAG] = True
 
 
 async def get_setting(session: AsyncSession, key: str) -> str | None:
@@ -28,6 +52,7 @@ async def get_setting(session: AsyncSession, key: str) -> str | None:
 async def delete_setting(session: AsyncSession, key: str) -> None:
     await session.execute(delete(BotSetting).where(BotSetting.key == key))
     await session.flush()
+    session.info[_DIRTY_FLAG] = True
 
 
 async def load_behaviour_overrides(session: AsyncSession) -> Dict[str, str]:
@@ -36,4 +61,211 @@ async def load_behaviour_overrides(session: AsyncSession) -> Dict[str, str]:
     return settings
 
 
-__all__ = ["delete_setting", "get_setting", "load_behaviour_overrides", "set_setting"]
+_client: Any = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_pending_publishes: Set["asyncio.Task[Optional[int]]"] = set()
+
+
+def _redis_client() -> Any:
+    """Return the shared ``redis.asyncio`` client of the running event loop.
+
+    Celery tasks run each in a fresh loop, and pooled connections cannot be
+    reused across loops, so the client is replaced when the loop changes. Code
+    that runs its own loop calls :func:`close_redis_client` before the loop
+    ends, so the replaced client leaves no connections behind.
+    """
+
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        from redis import asyncio as aioredis
+
+        _client = aioredis.Redis.from_url(
+            get_settings().redis.dsn, socket_timeout=1.0, socket_connect_timeout=1.0
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_redis_client() -> None:
+    """Close the shared client if it belongs to the running event loop."""
+
+    global _client, _client_loop
+    client, loop = _client, _client_loop
+    _client = _client_loop = None
+    if client is not None and loop is asyncio.get_running_loop():
+        await client.aclose()
+
+
+async def _publish_in_own_loop() -> None:
+    try:
+        await publish_invalidation()
+    finally:
+        await close_redis_client()
+
+
+async def read_version() -> Optional[int]:
+    """Return the published settings version, or ``None`` when Redis is unreachable."""
+
+    try:
+        raw = await _redis_client().get(VERSION_KEY)
+    except Exception:  # pragma: no cover - Redis is optional for reads
+        logger.debug("Could not read the bot settings version", exc_info=True)
+        return None
+    return int(raw) if raw is not None else 0
+
+
+async def publish_invalidation() -> Optional[int]:
+    """Bump the settings version and notify subscribed processes."""
+
+    try:
+        client = _redis_client()
+        version = int(await client.incr(VERSION_KEY))
+        await client.publish(INVALIDATION_CHANNEL, version)
+    except Exception:  # pragma: no cover - peers fall back to max_age
+        logger.warning("Could not publish bot settings invalidation", exc_info=True)
+        return None
+    return version
+
+
+async def wait_for_publishes() -> None:
+    """Wait until the invalidations scheduled by committed sessions are published."""
+
+    if _pending_publishes:
+        await asyncio.gather(*_pending_publishes, return_exceptions=True)
+
+
+async def _load_from_database() -> Dict[str, str]:
+    from tgcrm.db.session import AsyncSessionFactory
+
+    async with AsyncSessionFactory() as session:
+        return await load_behaviour_overrides(session)
+
+
+class SettingsCache:
+    """Process-wide snapshot of ``bot_settings`` guarded by a version counter.
+
+    ``loaded_version`` is the Redis version read just before the snapshot was
+    loaded, ``latest_version`` the newest version announced to this process.
+    A snapshot is stale when it is older than ``max_age`` or when a newer
+    version was announced.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Awaitable[Dict[str, str]]] = _load_from_database,
+        *,
+        version_reader: Callable[[], Awaitable[Optional[int]]] = read_version,
+        max_age: float = DEFAULT_MAX_AGE,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._loader = loader
+        self._version_reader = version_reader
+        self.max_age = max_age
+        self._clock = clock
+        self._values: Optional[Dict[str, str]] = None
+        self._loaded_at = 0.0
+        self.loaded_version = -1
+        self.latest_version = -1
+        self.loads = 0
+
+    def is_stale(self) -> bool:
+        return (
+            self._values is None
+            or self.latest_version > self.loaded_version
+            or self._clock() - self._loaded_at >= self.max_age
+        )
+
+    def mark_stale(self, version: Optional[int] = None) -> None:
+        """Record an announced version; without one the snapshot is simply dropped."""
+
+        if version is None:
+            self._values = None
+        else:
+            self.latest_version = max(self.latest_version, version)
+
+    async def get_all(self) -> Dict[str, str]:
+        if self.is_stale():
+            version = await self._version_reader()
+            values = await self._loader()
+            self._values = values
+            self._loaded_at = self._clock()
+            if version is not None:
+                self.loaded_version = version
+                self.latest_version = max(self.latest_version, version)
+            self.loads += 1
+        return dict(self._values or {})
+
+    async def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return (await self.get_all()).get(key, default)
+
+
+settings_cache = SettingsCache()
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session) -> None:
+    # No I/O in the ORM hook: the publish runs once the awaited commit returns.
+    if not session.info.pop(_DIRTY_FLAG, False):
+        return
+    settings_cache.mark_stale()
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:  # pragma: no cover - sync sessions outside the bot and workers
+        asyncio.run(_publish_in_own_loop())
+        return
+    task = loop.create_task(publish_invalidation())
+    _pending_publishes.add(task)
+    task.add_done_callback(_pending_publishes.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY_FLAG, None)
+
+
+def start_invalidation_listener(
+    cache: SettingsCache = settings_cache,
+) -> Optional[threading.Thread]:
+    """Subscribe to invalidations in a daemon thread; returns ``None`` without Redis."""
+
+    def _on_message(message: Dict[str, Any]) -> None:
+        try:
+            cache.mark_stale(int(message["data"]))
+        except (TypeError, ValueError):
+            cache.mark_stale()
+
+    def _on_error(exc: BaseException, pubsub: Any, thread: Any) -> None:  # noqa: ARG001
+        # Invalidations may have been missed while disconnected.
+        logger.warning("Bot settings invalidation listener error: %s", exc)
+        cache.mark_stale()
+        time.sleep(1.0)
+
+    try:
+        import redis
+
+        # The subscriber blocks, so it gets its own synchronous client in its own thread.
+        client = redis.Redis.from_url(get_settings().redis.dsn, socket_connect_timeout=1.0)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATION_CHANNEL: _on_message})
+    except Exception:  # pragma: no cover - depends on Redis availability
+        logger.warning("Bot settings invalidation listener is disabled", exc_info=True)
+        return None
+    return pubsub.run_in_thread(sleep_time=0.5, daemon=True, exception_handler=_on_error)
+
+
+__all__ = [
+    "INVALIDATION_CHANNEL",
+    "SettingsCache",
+    "VERSION_KEY",
+    "close_redis_client",
+    "delete_setting",
+    "get_setting",
+    "load_behaviour_overrides",
+    "publish_invalidation",
+    "read_version",
+    "set_setting",
+    "settings_cache",
+    "start_invalidation_listener",
+    "wait_for_publishes",
+]
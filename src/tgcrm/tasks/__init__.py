@@ -1,5 +1,11 @@
 """Background task interfaces."""
 from tgcrm.tasks.celery_app import celery_app
+from tgcrm.tasks.maintenance import ensure_interaction_partitions
 from tgcrm.tasks.reminders import proactive_follow_up, send_due_reminders
 
-__all__ = ["celery_app", "proactive_follow_up", "send_due_reminders"]
+__all__ = [
+    "celery_app",
+    "ensure_interaction_partitions",
+    "proactive_follow_up",
+    "send_due_reminders",
+]
@@ -2,10 +2,11 @@
 from __future__ import annotations
 
 import logging
+from importlib import import_module
 
 from celery import Celery
 from celery.schedules import crontab
-from importlib import import_module
+from celery.signals import worker_process_init
 
 from tgcrm.config import get_settings
 from tgcrm.logging import configure_logging
@@ -32,18 +33,31 @@ celery_app.conf.CELERY_BEAT_SCHEDULE = {
         "task": "tgcrm.tasks.reminders.proactive_follow_up",
         "schedule": crontab(minute=0, hour="10-17"),
     },
+    "ensure-interaction-partitions": {
+        "task": "tgcrm.tasks.maintenance.ensure_interaction_partitions",
+        "schedule": crontab(minute=30, hour=3),
+    },
 }
 
 logger.info("Celery configured with broker %s", settings.redis.dsn)
 
+
+@worker_process_init.connect
+def _subscribe_to_settings_changes(**_: object) -> None:
+    from tgcrm.services.settings import start_invalidation_listener
+
+    start_invalidation_listener()
+
+
 celery_app.autodiscover_tasks(["tgcrm.tasks"])
 
-for module_name in ("tgcrm.tasks.reminders",):
+for module_name in ("tgcrm.tasks.reminders", "tgcrm.tasks.maintenance"):
     import_module(module_name)
 
 REQUIRED_TASKS = {
     "tgcrm.tasks.reminders.send_due_reminders",
     "tgcrm.tasks.reminders.proactive_follow_up",
+    "tgcrm.tasks.maintenance.ensure_interaction_partitions",
 }
 
 missing_tasks = sorted(REQUIRED_TASKS.difference(celery_app.tasks.keys()))
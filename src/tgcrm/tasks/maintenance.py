@@ -0,0 +1,30 @@
+"""Celery tasks for database maintenance."""
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from tgcrm.config import get_settings
+from tgcrm.db.partitions import ensure_partitions
+from tgcrm.db.session import get_engine
+from tgcrm.tasks.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+async def _ensure_interaction_partitions() -> None:
+    months_ahead = get_settings().database.interactions_partitions_ahead
+    async with get_engine().connect() as connection:
+        if connection.dialect.name != "postgresql":
+            return
+        created = await ensure_partitions(connection, months_ahead=months_ahead)
+        await connection.commit()
+    logger.info("Created interaction partitions: %s", ", ".join(created) or "none")
+
+
+@celery_app.task
+def ensure_interaction_partitions() -> None:
+    asyncio.run(_ensure_interaction_partitions())
+
+
+__all__ = ["ensure_interaction_partitions"]
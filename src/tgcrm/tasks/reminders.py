@@ -2,21 +2,29 @@
 from __future__ import annotations
 
 import asyncio
-from datetime import datetime, timedelta, time
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Sequence
 
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import bindparam, false, func, literal, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from tgcrm.config import get_settings
-from tgcrm.db.models import Deal, Reminder
-from tgcrm.db.session import AsyncSessionFactory
-from tgcrm.services.ai import build_advice_for_interaction
-from tgcrm.services.notifications import send_notification
-from tgcrm.services.settings import load_behaviour_overrides
+from tgcrm.db.instrumentation import BudgetedCall, count_queries, tag_queries
+from tgcrm.db.models import Deal, Interaction, Reminder
+from tgcrm.db.session import get_session
+from tgcrm.db.statuses import TERMINAL_STATUS_VALUES
+from tgcrm.services.ai import ADVICE_HISTORY_SIZE, build_advice_for_interaction
+from tgcrm.services.notifications import notification_bot, send_notification
+from tgcrm.services.settings import close_redis_client, settings_cache
 from tgcrm.tasks.celery_app import celery_app
 
 _env_settings = get_settings()
 
+FOLLOW_UP_AFTER = timedelta(hours=12)
+
 
 def _resolve_setting(overrides: dict[str, str], key: str, default: str) -> str:
     return overrides.get(key, default)
@@ -44,77 +52,188 @@ def _is_within_working_hours(timestamp: datetime, overrides: dict[str, str]) ->
     return within_hours and not in_lunch
 
 
+# The claiming UPDATE, reminders, deals, managers, clients, interactions and the release.
+@tag_queries(budget=7)
 async def _send_due_reminders() -> None:
-    async with AsyncSessionFactory() as session:
-        overrides = await load_behaviour_overrides(session)
-        query = (
-            select(Reminder)
-            .options(selectinload(Reminder.deal).selectinload(Deal.manager))
-            .where(Reminder.is_sent.is_(False), Reminder.remind_at <= datetime.utcnow())
+    # Due reminders are claimed on the primary before anything is sent: the
+    # UPDATE marks them as sent and commits, so a concurrent or overlapping run
+    # cannot claim them again. Reminders that were not delivered are released.
+    async with get_session() as session:
+        claimed = await session.scalars(
+            update(Reminder)
+            .where(Reminder.is_sent == false(), Reminder.remind_at <= datetime.utcnow())
+            .values(is_sent=True)
+            .returning(Reminder.id)
         )
-        result = await session.execute(query)
-        reminders = result.scalars().all()
-        for reminder in reminders:
-            deal = reminder.deal
-            manager = deal.manager
-            if manager.telegram_id is None:
-                continue
-            advice = "Попробуйте связаться с клиентом и уточнить статус переговоров."
-            if deal.interactions:
-                advice = await build_advice_for_interaction(deal, "reminder")
-            await send_notification(
-                manager.telegram_id,
-                (
-                    f"🔔 Напоминание по сделке #{deal.id} клиента {deal.client.name or deal.client.phone_number}.\n"
-                    f"Совет: {advice}"
-                ),
+        claimed_ids = list(claimed)
+    if not claimed_ids:
+        return
+
+    sent_ids: set[int] = set()
+    try:
+        async with get_session() as session, notification_bot():
+            query = (
+                select(Reminder)
+                .options(
+                    selectinload(Reminder.deal).options(
+                        selectinload(Deal.manager),
+                        selectinload(Deal.client),
+                        selectinload(Deal.interactions),
+                    )
+                )
+                .where(Reminder.id.in_(claimed_ids))
             )
-            reminder.is_sent = True
-        await session.commit()
-
-
-async def _proactive_follow_up() -> None:
-    async with AsyncSessionFactory() as session:
-        overrides = await load_behaviour_overrides(session)
-        now = datetime.utcnow()
-        query = (
-            select(Deal)
-            .options(selectinload(Deal.manager), selectinload(Deal.client), selectinload(Deal.interactions))
-            .where(Deal.last_interaction_at.isnot(None))
+            result = await session.execute(query)
+            reminders = result.scalars().all()
+            for reminder in reminders:
+                deal = reminder.deal
+                manager = deal.manager
+                if manager.telegram_id is None:
+                    continue
+                advice = "Попробуйте связаться с клиентом и уточнить статус переговоров."
+                if deal.interactions:
+                    advice = await build_advice_for_interaction(deal, "reminder")
+                client_name = deal.client.name or deal.client.phone_number
+                await send_notification(
+                    manager.telegram_id,
+                    (
+                        f"🔔 Напоминание по сделке #{deal.id} клиента {client_name}.\n"
+                        f"Совет: {advice}"
+                    ),
+                )
+                sent_ids.add(reminder.id)
+    finally:
+        unsent_ids = [reminder_id for reminder_id in claimed_ids if reminder_id not in sent_ids]
+        if unsent_ids:
+            async with get_session() as session:
+                await session.execute(
+                    update(Reminder).where(Reminder.id.in_(unsent_ids)).values(is_sent=False)
+                )
+
+
+# Deals per page of the follow-up scan, which is also the most ids selectinload
+# puts in one IN list, so each relationship costs one statement per page.
+FOLLOW_UP_PAGE_SIZE = 500
+# Deals, managers, clients and recent interactions.
+_FOLLOW_UP_PAGE_QUERIES = 4
+
+
+def _follow_up_budget(call: BudgetedCall) -> int:
+    """Settings overrides, then one page per ``FOLLOW_UP_PAGE_SIZE`` deals plus the last one."""
+
+    return 1 + _FOLLOW_UP_PAGE_QUERIES * (call.result // FOLLOW_UP_PAGE_SIZE + 1)
+
+
+async def _load_recent_interactions(session: AsyncSession, deals: Sequence[Deal]) -> None:
+    """Set each deal's ``interactions`` to the ones its advice prompt uses, in one query."""
+
+    recency = (
+        func.row_number()
+        .over(partition_by=Interaction.deal_id, order_by=Interaction.created_at.desc())
+        .label("recency")
+    )
+    ranked = (
+        select(Interaction, recency)
+        .where(Interaction.deal_id.in_([deal.id for deal in deals]))
+        .subquery()
+    )
+    recent = aliased(Interaction, ranked)
+    history: Dict[int, List[Interaction]] = defaultdict(list)
+    for interaction in await session.scalars(
+        select(recent).where(ranked.c.recency <= ADVICE_HISTORY_SIZE)
+    ):
+        history[interaction.deal_id].append(interaction)
+    for deal in deals:
+        set_committed_value(deal, "interactions", history[deal.id])
+
+
+@tag_queries(budget=_follow_up_budget)
+async def _proactive_follow_up() -> int:
+    """Nudge managers about stale deals; returns how many deals were scanned."""
+
+    overrides = await settings_cache.get_all()
+    now = datetime.utcnow()
+    if not _is_within_working_hours(now, overrides):
+        return 0
+
+    # The status and staleness filters mirror ``ix_deal_followup_due`` so the scan is
+    # served by the partial index; statuses are rendered inline to keep the predicate
+    # provable for the planner. Pages are walked in ``(last_interaction_at, id)`` order.
+    cutoff = datetime.now(timezone.utc) - FOLLOW_UP_AFTER
+    query = (
+        select(Deal)
+        .options(selectinload(Deal.manager), selectinload(Deal.client))
+        .where(
+            Deal.status.notin_(
+                bindparam(
+                    "terminal_statuses",
+                    TERMINAL_STATUS_VALUES,
+                    expanding=True,
+                    literal_execute=True,
+                )
+            ),
+            Deal.last_interaction_at <= cutoff,
         )
-        result = await session.execute(query)
-        deals = result.scalars().all()
-        for deal in deals:
-            if deal.status in _env_settings.behaviour.proactive_excluded_statuses:
-                continue
-            if (now - deal.last_interaction_at).total_seconds() < 12 * 3600:
-                continue
-            if not _is_within_working_hours(now, overrides):
-                continue
-            manager = deal.manager
-            if manager.telegram_id is None:
-                continue
-            advice = await build_advice_for_interaction(deal, "proactive")
-            await send_notification(
-                manager.telegram_id,
-                (
-                    "⚠️ Давно не было контакта с клиентом\n"
-                    f"Клиент: {deal.client.name or deal.client.phone_number}\n"
-                    f"Последняя связь: {deal.last_interaction_at:%Y-%m-%d %H:%M}\n"
-                    f"Совет: {advice}"
-                ),
-            )
-        await session.commit()
+        .order_by(Deal.last_interaction_at, Deal.id)
+        .limit(FOLLOW_UP_PAGE_SIZE)
+    )
+    key = tuple_(Deal.last_interaction_at, Deal.id)
+    page = query
+    scanned = 0
+    async with notification_bot():
+        while True:
+            # Each replica session ends before the AI calls and paced sends of its page.
+            async with get_session(readonly=True) as session:
+                deals = (await session.scalars(page)).all()
+                if deals:
+                    await _load_recent_interactions(session, deals)
+
+            for deal in deals:
+                if deal.status in _env_settings.behaviour.proactive_excluded_statuses:
+                    continue
+                manager = deal.manager
+                if manager.telegram_id is None:
+                    continue
+                advice = await build_advice_for_interaction(deal, "proactive")
+                await send_notification(
+                    manager.telegram_id,
+                    (
+                        "⚠️ Давно не было контакта с клиентом\n"
+                        f"Клиент: {deal.client.name or deal.client.phone_number}\n"
+                        f"Последняя связь: {deal.last_interaction_at:%Y-%m-%d %H:%M}\n"
+                        f"Совет: {advice}"
+                    ),
+                )
+
+            scanned += len(deals)
+            if len(deals) < FOLLOW_UP_PAGE_SIZE:
+                return scanned
+            last = deals[-1]
+            after = literal(last.last_interaction_at, Deal.last_interaction_at.type)
+            page = query.where(key > tuple_(after, literal(last.id)))
+
+async def _run_task(job: Callable[[], Awaitable[object]]) -> None:
+    # Redis clients are bound to this task's event loop: close them before it ends.
+    try:
+        await job()
+    finally:
+        await close_redis_client()
 
 
 @celery_app.task
 def send_due_reminders() -> None:
-    asyncio.run(_send_due_reminders())
+    from tgcrm.bot.rate_limit import SendPriority, send_priority
+
+    with count_queries("send_due_reminders"), send_priority(SendPriority.REMINDER):
+        asyncio.run(_run_task(_send_due_reminders))
 
 
 @celery_app.task
 def proactive_follow_up() -> None:
-    asyncio.run(_proactive_follow_up())
+    from tgcrm.bot.rate_limit import SendPriority, send_priority
+
+    with count_queries("proactive_follow_up"), send_priority(SendPriority.PROACTIVE):
+        asyncio.run(_run_task(_proactive_follow_up))
 
 
 __all__ = ["send_due_reminders", "proactive_follow_up"]
@@ -4,6 +4,8 @@ from __future__ import annotations
 import os
 import sys
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, List
 
 root = Path(__file__).resolve().parents[1]
 src_path = str(root / "src")
@@ -20,9 +22,16 @@ os.environ.setdefault("POSTGRES_DB", "tgcrm")
 os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:6379/0")
 
 import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import EditMessageText
 
 from tgcrm.config import get_settings
 
+CHAT_ID = 42
+
 
 @pytest.fixture(autouse=True)
 def _ensure_test_settings(monkeypatch: pytest.MonkeyPatch) -> None:
@@ -40,3 +49,90 @@ def _ensure_test_settings(monkeypatch: pytest.MonkeyPatch) -> None:
     get_settings.cache_clear()
     yield
     get_settings.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def _reset_manager_cache() -> None:
+    """Each test builds its own database, so cached manager ids must not leak between them."""
+
+    from tgcrm.services.manager_cache import manager_cache
+
+    manager_cache.clear()
+    yield
+    manager_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def _reset_history_store() -> None:
+    """Message ids remembered by one test must not show up in another's history."""
+
+    from tgcrm.bot.utils.history import MemoryHistoryStore, get_history_store, set_history_store
+
+    previous = get_history_store()
+    set_history_store(MemoryHistoryStore())
+    yield
+    set_history_store(previous)
+
+
+@pytest.fixture(autouse=True)
+def _strict_query_budgets() -> None:
+    """Service functions that exceed their declared query budget fail the test."""
+
+    from tgcrm.db.instrumentation import strict_query_budgets
+
+    with strict_query_budgets():
+        yield
+
+
+class FakeSentMessage:
+    """A message the bot sent, recording edits and deletion."""
+
+    def __init__(self, message_id: int, text: str, *, reject_edits: int = 0) -> None:
+        self.message_id = message_id
+        self.text = text
+        self.edits: List[str] = []
+        self.deleted = False
+        self.reject_edits = reject_edits
+
+    async def edit_text(self, text: str) -> None:
+        if self.reject_edits:
+            self.reject_edits -= 1
+            raise TelegramBadRequest(EditMessageText(text=text), "can't parse entities")
+        self.edits.append(text)
+        self.text = text
+
+    async def delete(self) -> None:
+        self.deleted = True
+
+
+class FakeMessage:
+    """An incoming message whose ``answer`` calls are kept in ``sent``."""
+
+    def __init__(self, bot: Any = None, chat_id: int = CHAT_ID, *, reject_edits: int = 0) -> None:
+        self.bot = bot
+        self.chat = SimpleNamespace(id=chat_id)
+        self.sent: List[FakeSentMessage] = []
+        self._reject_edits = reject_edits
+
+    async def answer(self, text: str) -> FakeSentMessage:
+        sent = FakeSentMessage(100 + len(self.sent), text, reject_edits=self._reject_edits)
+        self.sent.append(sent)
+        return sent
+
+
+@pytest.fixture
+def make_message() -> Callable[..., FakeMessage]:
+    """Build fake incoming messages: ``make_message(bot=None, chat_id=42, reject_edits=0)``."""
+
+    return FakeMessage
+
+
+@pytest.fixture
+def make_state() -> Callable[..., FSMContext]:
+    """Build an FSM context in a fresh memory storage for ``chat_id`` of ``bot_id``."""
+
+    def make(chat_id: int = CHAT_ID, bot_id: int = 1) -> FSMContext:
+        key = StorageKey(bot_id=bot_id, chat_id=chat_id, user_id=chat_id)
+        return FSMContext(storage=MemoryStorage(), key=key)
+
+    return make
@@ -0,0 +1,133 @@
+"""Tests for AI replies delivered in the background."""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, List, Tuple
+
+import pytest
+
+from tgcrm.bot.middlewares import AIJobsMiddleware
+from tgcrm.bot.utils import ai_jobs
+from tgcrm.bot.utils.ai_jobs import AIJobPool, answer_in_background
+from tgcrm.bot.utils.history import get_history_store
+
+BOT_ID = 7
+CHAT_ID = 42
+
+
+class FakeBot:
+    id = BOT_ID
+
+    def __init__(self) -> None:
+        self.actions: List[Tuple[int, str]] = []
+
+    async def send_chat_action(self, chat_id: int, action: str, **kwargs: Any) -> bool:
+        self.actions.append((chat_id, action))
+        return True
+
+
+async def _answer(
+    release: asyncio.Event, text: str = "Позвоните завтра утром."
+) -> AsyncIterator[str]:
+    await release.wait()
+    for word in text.split(" "):
+        yield word + " "
+
+
+def test_reply_arrives_after_the_handler_with_typing_shown(
+    monkeypatch: pytest.MonkeyPatch,
+    make_message: Callable[..., Any],
+    make_state: Callable[..., Any],
+) -> None:
+    async def runner() -> Tuple[FakeBot, Any, List[int], List[str]]:
+        monkeypatch.setattr(ai_jobs, "_pool", AIJobPool(2))
+        bot = FakeBot()
+        message = make_message(bot)
+        state = make_state(CHAT_ID, BOT_ID)
+        release = asyncio.Event()
+
+        task = answer_in_background(message, state, _answer(release), prefix="💡 Совет: ")
+        await asyncio.sleep(0.01)
+        # The handler has returned; the job is waiting for the model, showing "typing".
+        texts_before = [sent.text for sent in message.sent]
+        release.set()
+        await task
+        remembered = await get_history_store().pop_all(state.key)
+        return bot, message, remembered, texts_before
+
+    bot, message, remembered, texts_before = asyncio.run(runner())
+
+    assert (CHAT_ID, "typing") in bot.actions
+    assert texts_before == ["💡 Совет: …"]
+    (sent,) = message.sent
+    assert sent.text == "💡 Совет: Позвоните завтра утром."
+    assert remembered == [sent.message_id]
+    assert ai_jobs.get_ai_jobs().completed == 1
+
+
+def test_pool_runs_at_most_concurrency_jobs() -> None:
+    async def runner() -> Tuple[int, AIJobPool]:
+        pool = AIJobPool(2)
+        bot = FakeBot()
+        running = 0
+        peak = 0
+
+        async def job() -> None:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        tasks = [pool.submit(bot, chat_id, job) for chat_id in range(6)]
+        await asyncio.gather(*tasks)
+        return peak, pool
+
+    peak, pool = asyncio.run(runner())
+
+    assert peak == 2
+    assert (pool.completed, len(pool)) == (6, 0)
+
+
+def test_next_update_cancels_the_pending_reply(
+    monkeypatch: pytest.MonkeyPatch,
+    make_message: Callable[..., Any],
+    make_state: Callable[..., Any],
+) -> None:
+    async def runner() -> Tuple[Any, List[int], AIJobPool, bool]:
+        pool = AIJobPool(2)
+        monkeypatch.setattr(ai_jobs, "_pool", pool)
+        bot = FakeBot()
+        message = make_message(bot)
+        state = make_state(CHAT_ID, BOT_ID)
+
+        task = answer_in_background(message, state, _answer(asyncio.Event()))
+        await asyncio.sleep(0.01)
+
+        async def handler(event: Any, data: Any) -> None:
+            return None
+
+        await AIJobsMiddleware()(handler, object(), {"bot": bot, "event_chat": message.chat})
+        await asyncio.gather(task, return_exceptions=True)
+        remembered = await get_history_store().pop_all(state.key)
+        return message, remembered, pool, task.cancelled()
+
+    message, remembered, pool, cancelled = asyncio.run(runner())
+
+    assert cancelled
+    # The placeholder is removed and never enters the chat history.
+    assert message.sent[0].deleted
+    assert remembered == []
+    assert (pool.cancelled, len(pool)) == (1, 0)
+
+
+def test_new_job_for_a_chat_replaces_the_old_one() -> None:
+    async def runner() -> Tuple[bool, bool]:
+        pool = AIJobPool(2)
+        bot = FakeBot()
+        first = pool.submit(bot, CHAT_ID, lambda: asyncio.sleep(10))
+        second = pool.submit(bot, CHAT_ID, lambda: asyncio.sleep(0))
+        await asyncio.gather(first, second, return_exceptions=True)
+        return first.cancelled(), second.cancelled()
+
+    assert asyncio.run(runner()) == (True, False)
@@ -0,0 +1,233 @@
+"""Tests for streaming AI answers into a progressively edited message."""
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, List
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from tgcrm.bot.utils import streaming
+from tgcrm.bot.utils.streaming import answer_streaming
+from tgcrm.services import ai_assistant
+from tgcrm.services.ai_assistant import AIAssistant
+
+DELTAS = ["  Позвоните ", "клиенту ", "завтра ", "утром ", "и ", "уточните ", "бюджет", ".\n"]
+ANSWER = "".join(DELTAS).strip()
+# Seconds of fake time each delta takes to arrive.
+DELTA_SECONDS = 0.4
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeStream:
+    def __init__(self, clock: FakeClock, fail_after: int | None = None) -> None:
+        self.clock = clock
+        self.fail_after = fail_after
+        self.closed = False
+
+    async def __aiter__(self):
+        role = SimpleNamespace(role="assistant", content=None)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=role)])
+        for index, delta in enumerate(DELTAS):
+            if index == self.fail_after:
+                raise ConnectionError("stream interrupted")
+            self.clock.now += DELTA_SECONDS
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+        yield SimpleNamespace(choices=[])
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeCompletions:
+    def __init__(self, clock: FakeClock, fail_after: int | None = None) -> None:
+        self.clock = clock
+        self.fail_after = fail_after
+        self.streams: List[FakeStream] = []
+
+    async def create(self, *, stream: bool = False, **kwargs: Any) -> Any:
+        if not stream:
+            message = SimpleNamespace(content="".join(DELTAS))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        self.streams.append(FakeStream(self.clock, self.fail_after))
+        return self.streams[-1]
+
+
+def _assistant(
+    monkeypatch: pytest.MonkeyPatch, *, stream: bool = True, fail_after: int | None = None
+) -> tuple[AIAssistant, FakeCompletions]:
+    clock = FakeClock()
+    monkeypatch.setattr(streaming.time, "monotonic", clock)
+
+    async def resolve_api_key(settings: Any) -> str:
+        return "sk-test"
+
+    monkeypatch.setattr(ai_assistant, "_resolve_api_key", resolve_api_key)
+    completions = FakeCompletions(clock, fail_after)
+    client = SimpleNamespace(api_key="sk-test", chat=SimpleNamespace(completions=completions))
+    return AIAssistant(client, "gpt-test", 0.2, 100, stream=stream), completions
+
+
+def test_streamed_answer_ends_with_the_non_streamed_text(
+    monkeypatch: pytest.MonkeyPatch, make_message: Callable[..., Any]
+) -> None:
+    assistant, completions = _assistant(monkeypatch)
+    before = ai_assistant.completion_latency.snapshot().get("first_token", {}).get("count", 0)
+
+    async def runner() -> tuple[Any, str, str]:
+        message = make_message()
+        _, advice = await answer_streaming(
+            message,
+            assistant.stream_ai_advice("Клиент просил перезвонить"),
+            prefix="Совет: ",
+            suffix="\n\nМеню",
+            edit_interval=1.0,
+        )
+        expected = await assistant.get_ai_advice("Клиент просил перезвонить")
+        return message, advice, expected
+
+    message, advice, expected = asyncio.run(runner())
+
+    assert advice == expected == ANSWER
+    (sent,) = message.sent
+    assert sent.text == f"Совет: {ANSWER}\n\nМеню"
+    # 3.2 s of deltas at one edit per second: previews at 1.2 s and 2.4 s, then the final text.
+    assert len(sent.edits) == 3
+    assert all(edit.endswith("…") for edit in sent.edits[:-1])
+    assert completions.streams[0].closed
+    snapshot = ai_assistant.completion_latency.snapshot()
+    assert snapshot["first_token"]["count"] == before + 1
+
+
+def test_rejected_preview_is_skipped_and_the_final_edit_still_lands(
+    monkeypatch: pytest.MonkeyPatch, make_message: Callable[..., Any]
+) -> None:
+    assistant, _ = _assistant(monkeypatch)
+
+    async def runner() -> Any:
+        message = make_message(reject_edits=1)
+        chunks = assistant.stream_ai_advice("x")
+        sent, _ = await answer_streaming(message, chunks, edit_interval=1.0)
+        return sent
+
+    sent = asyncio.run(runner())
+
+    assert sent.text == ANSWER
+    assert len(sent.edits) == 2
+
+
+def test_failed_stream_removes_the_placeholder(
+    monkeypatch: pytest.MonkeyPatch, make_message: Callable[..., Any]
+) -> None:
+    assistant, completions = _assistant(monkeypatch, fail_after=3)
+
+    async def runner() -> Any:
+        message = make_message()
+        with pytest.raises(ConnectionError):
+            await answer_streaming(message, assistant.stream_ai_advice("x"), edit_interval=1.0)
+        return message
+
+    message = asyncio.run(runner())
+
+    assert message.sent[0].deleted
+    assert completions.streams[0].closed
+
+
+def test_streaming_disabled_sends_one_edit(
+    monkeypatch: pytest.MonkeyPatch, make_message: Callable[..., Any]
+) -> None:
+    assistant, completions = _assistant(monkeypatch, stream=False)
+
+    async def runner() -> Any:
+        message = make_message()
+        chunks = assistant.stream_ai_advice("x")
+        sent, _ = await answer_streaming(message, chunks, edit_interval=1.0)
+        return sent
+
+    sent = asyncio.run(runner())
+
+    assert completions.streams == []
+    assert sent.edits == [ANSWER]
+
+
+def test_rejected_final_edit_is_sent_as_a_new_message(
+    monkeypatch: pytest.MonkeyPatch, make_message: Callable[..., Any]
+) -> None:
+    assistant, _ = _assistant(monkeypatch, stream=False)
+
+    async def runner() -> tuple[Any, Any]:
+        message = make_message(reject_edits=1)
+        chunks = assistant.stream_ai_advice("x")
+        sent, _ = await answer_streaming(message, chunks, edit_interval=1.0)
+        return message, sent
+
+    message, sent = asyncio.run(runner())
+
+    placeholder, replacement = message.sent
+    assert placeholder.deleted
+    assert sent is replacement
+    assert replacement.text == ANSWER
+
+
+def test_final_edit_waits_out_flood_control(
+    monkeypatch: pytest.MonkeyPatch, make_message: Callable[..., Any]
+) -> None:
+    assistant, _ = _assistant(monkeypatch, stream=False)
+
+    async def runner() -> tuple[Any, Any]:
+        message = make_message()
+        original_answer = message.answer
+
+        async def answer(text: str) -> Any:
+            sent = await original_answer(text)
+            edit_text = sent.edit_text
+
+            async def flooded_once(new_text: str) -> None:
+                sent.edit_text = edit_text
+                raise TelegramRetryAfter(EditMessageText(text=new_text), "Flood control", 0)
+
+            sent.edit_text = flooded_once
+            return sent
+
+        message.answer = answer
+        chunks = assistant.stream_ai_advice("x")
+        sent, _ = await answer_streaming(message, chunks, edit_interval=1.0)
+        return message, sent
+
+    message, sent = asyncio.run(runner())
+
+    # Retried in place rather than sent again.
+    assert message.sent == [sent]
+    assert sent.text == ANSWER
+
+
+def test_final_answer_over_the_message_limit_is_split(make_message: Callable[..., Any]) -> None:
+    lines = [f"{index:04d} " + "x" * 95 for index in range(60)]
+
+    async def chunks() -> AsyncIterator[str]:
+        for line in lines:
+            yield line + "\n"
+
+    async def runner() -> tuple[Any, Any, str]:
+        message = make_message()
+        sent, answer = await answer_streaming(message, chunks(), edit_interval=3600.0)
+        return message, sent, answer
+
+    message, sent, answer = asyncio.run(runner())
+
+    placeholder, continuation = message.sent
+    assert not placeholder.deleted
+    assert sent is continuation
+    assert all(len(part.text) <= streaming.MESSAGE_LIMIT for part in message.sent)
+    # Split at a line break, so no line is cut in two.
+    assert placeholder.text.split("\n") + continuation.text.split("\n") == lines
+    assert answer == "\n".join(lines)
@@ -23,7 +23,9 @@ def test_bot_can_start_polling(monkeypatch: pytest.MonkeyPatch) -> None:
 
     bot_main = _load_bot_main_module()
 
-    dispatcher = SimpleNamespace(start_polling=AsyncMock())
+    dispatcher = SimpleNamespace(
+        start_polling=AsyncMock(), storage=SimpleNamespace(close=AsyncMock())
+    )
     bot = SimpleNamespace(session=SimpleNamespace(close=AsyncMock()))
 
     monkeypatch.setattr(bot_main, "create_bot", Mock(return_value=bot))
@@ -35,3 +37,4 @@ def test_bot_can_start_polling(monkeypatch: pytest.MonkeyPatch) -> None:
     bot_main.on_startup.assert_awaited_once_with(dispatcher)
     dispatcher.start_polling.assert_awaited_once_with(bot)
     bot.session.close.assert_awaited_once()
+    dispatcher.storage.close.assert_awaited_once()
@@ -0,0 +1,112 @@
+"""Tests for the streaming/normalization side of the bulk client import."""
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from uuid import uuid4
+
+import asyncpg
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from tgcrm.config import get_settings
+from tgcrm.db.models import Base, Client, Deal, Manager
+from tgcrm.services.client_import import (
+    ImportReport,
+    import_clients,
+    iter_source_rows,
+    normalize_batch,
+)
+
+
+def test_csv_rows_are_normalized_and_invalid_phones_rejected(tmp_path: Path) -> None:
+    source = tmp_path / "clients.csv"
+    source.write_text(
+        "Телефон;Имя;Город\n"
+        "8 (777) 123-45-67;Иван;Алматы\n"
+        "+7 701 000 11 22;;Астана\n"
+        "12345;Ошибка;Шымкент\n"
+        ";Без номера;Алматы\n",
+        encoding="utf-8",
+    )
+
+    records, rejected = normalize_batch(iter_source_rows(source))
+
+    assert rejected == 2
+    assert records == [
+        ("+77771234567", "4567", "Иван", "Алматы"),
+        ("+77010001122", "1122", None, "Астана"),
+    ]
+
+
+def test_copy_merge_skips_existing_and_duplicate_phones() -> None:
+    settings = get_settings()
+    dsn = settings.database.async_dsn
+
+    async def _connect() -> None:
+        connection = await asyncpg.connect(
+            dsn.replace("postgresql+asyncpg", "postgresql"), timeout=3
+        )
+        await connection.close()
+
+    try:
+        asyncio.run(_connect())
+    except Exception as exc:  # pragma: no cover - exercised in integration environments
+        pytest.skip(f"PostgreSQL is unavailable: {exc}")
+
+    # A throwaway schema keeps the test away from whatever the database already holds.
+    schema = f"test_client_import_{uuid4().hex[:8]}"
+    rows = [
+        {"phone": "8 777 123 45 67", "name": "Уже есть"},
+        {"phone": "+7 701 000 11 22", "name": "Новый", "city": "Астана"},
+        {"phone": "87010001122", "name": "Повтор"},
+        {"phone": "12345", "name": "Ошибка"},
+    ]
+
+    async def runner() -> tuple:
+        admin = create_async_engine(dsn)
+        async with admin.begin() as connection:
+            await connection.execute(text(f'CREATE SCHEMA "{schema}"'))
+        engine = create_async_engine(
+            dsn, connect_args={"server_settings": {"search_path": schema}}
+        )
+        try:
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+                await connection.execute(
+                    Manager.__table__.insert().values(telegram_id=1, name="Manager")
+                )
+                await connection.execute(
+                    Client.__table__.insert().values(
+                        phone_number="+77771234567", phone_suffix="4567", name="Уже есть"
+                    )
+                )
+
+            report = await import_clients(engine, rows, batch_size=2, manager_telegram_id=1)
+            # A second run inserts nothing: every phone is already there.
+            rerun = await import_clients(engine, rows, batch_size=2)
+
+            async with engine.connect() as connection:
+                clients = (
+                    await connection.execute(
+                        select(Client.phone_number, Client.name).order_by(Client.phone_number)
+                    )
+                ).all()
+                deals = await connection.scalar(select(func.count()).select_from(Deal))
+        finally:
+            await engine.dispose()
+            async with admin.begin() as connection:
+                await connection.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+            await admin.dispose()
+        return report, rerun, clients, deals
+
+    report, rerun, clients, deals = asyncio.run(runner())
+
+    assert report == ImportReport(inserted=1, skipped=2, rejected=1, deals_created=1)
+    assert rerun == ImportReport(inserted=0, skipped=3, rejected=1, deals_created=0)
+    assert [tuple(row) for row in clients] == [
+        ("+77010001122", "Новый"),
+        ("+77771234567", "Уже есть"),
+    ]
+    assert deals == 1
@@ -0,0 +1,54 @@
+"""Tests for the manager-scoped client search."""
+from __future__ import annotations
+
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from tgcrm.db.models import Base
+from tgcrm.services.client_search import search_clients
+from tgcrm.services.deals import create_deal_for_manager, ensure_manager, get_or_create_client
+
+
+def test_search_is_scoped_ranked_and_capped() -> None:
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        async with session_factory() as session:
+            manager = await ensure_manager(session, telegram_id=1)
+            other = await ensure_manager(session, telegram_id=2)
+            ivanov = await get_or_create_client(
+                session, "+77011234567", name="Иванов Иван", city="Алматы"
+            )
+            almaty = await get_or_create_client(session, "+77017654321", name="Пётр", city="Алматы")
+            foreign = await get_or_create_client(session, "+77019991122", name="Иванова Анна")
+            await create_deal_for_manager(session, ivanov, manager)
+            newest = await create_deal_for_manager(session, ivanov, manager)
+            await create_deal_for_manager(session, almaty, manager)
+            await create_deal_for_manager(session, foreign, other)
+            await session.commit()
+            manager_id, newest_id = manager.id, newest.id
+
+        async with session_factory() as session:
+            by_name = await search_clients(session, manager_id=manager_id, query="Иван")
+            assert [match.name for match in by_name] == ["Иванов Иван"]
+            assert by_name[0].deal_id == newest_id
+
+            by_city = await search_clients(session, manager_id=manager_id, query="Алматы")
+            assert {match.name for match in by_city} == {"Иванов Иван", "Пётр"}
+
+            by_phone = await search_clients(session, manager_id=manager_id, query="765 43")
+            assert [match.phone_number for match in by_phone] == ["+77017654321"]
+
+            capped = await search_clients(session, manager_id=manager_id, query="Алматы", limit=1)
+            assert len(capped) == 1
+            assert await search_clients(session, manager_id=manager_id, query="  ") == []
+
+        await engine.dispose()
+
+    asyncio.run(runner())
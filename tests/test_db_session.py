@@ -0,0 +1,82 @@
+"""Tests for engine configuration derived from settings."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from tgcrm.config import get_settings
+from tgcrm.db.session import ReplicaRouter, engine_options
+
+
+def test_session_pool_mode_uses_configured_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "5")
+    monkeypatch.setenv("DB_STATEMENT_CACHE_SIZE", "50")
+    get_settings.cache_clear()
+
+    options = engine_options(get_settings().database)
+
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 5
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"]["statement_cache_size"] == 50
+    assert "poolclass" not in options
+
+
+def test_transaction_pool_mode_is_pgbouncer_safe(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DB_POOL_MODE", "transaction")
+    get_settings.cache_clear()
+
+    options = engine_options(get_settings().database)
+    connect_args = options["connect_args"]
+
+    assert options["poolclass"] is NullPool
+    assert "pool_size" not in options
+    assert connect_args["statement_cache_size"] == 0
+    assert connect_args["prepared_statement_cache_size"] == 0
+    first = connect_args["prepared_statement_name_func"]()
+    second = connect_args["prepared_statement_name_func"]()
+    assert first != second
+
+
+def test_replica_router_skips_lagging_replicas() -> None:
+    lagging = create_async_engine("sqlite+aiosqlite:///:memory:")
+    fresh = create_async_engine("sqlite+aiosqlite:///:memory:")
+    lags = {lagging: 30.0, fresh: 0.5}
+    router = ReplicaRouter([lagging, fresh], max_lag=5.0, check_interval=60.0)
+
+    async def fake_measure_lag(replica: AsyncEngine) -> float:
+        return lags[replica]
+
+    router.measure_lag = fake_measure_lag  # type: ignore[method-assign]
+
+    async def runner() -> None:
+        for _ in range(3):
+            factory = await router.session_factory()
+            assert factory is not None
+            assert factory.kw["bind"] is fresh
+
+        lags[fresh] = 60.0
+        router._health.clear()
+        assert await router.session_factory() is None
+
+    asyncio.run(runner())
+
+
+def test_replica_router_falls_back_when_replica_unreachable() -> None:
+    broken = create_async_engine("sqlite+aiosqlite:///:memory:")
+    router = ReplicaRouter([broken], max_lag=5.0, check_interval=60.0)
+
+    async def runner() -> None:
+        # SQLite has no replication functions, so the lag probe fails like an unreachable host.
+        assert await router.session_factory() is None
+
+    asyncio.run(runner())
+
+
+def test_router_without_replicas_uses_primary() -> None:
+    router = ReplicaRouter([], max_lag=5.0, check_interval=60.0)
+    assert asyncio.run(router.session_factory()) is None
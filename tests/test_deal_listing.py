@@ -0,0 +1,91 @@
+"""Tests for keyset pagination of the manager deal listing."""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from tgcrm.bot.handlers.deal import _empty_listing_text
+from tgcrm.db.models import Base, Client, Deal
+from tgcrm.db.statuses import DealStatus
+from tgcrm.services.deals import DealCursor, ensure_manager, list_deals_page
+
+
+def test_pages_walk_forward_and_back_without_gaps() -> None:
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        base = datetime(2026, 1, 1, 12, 0)
+        async with session_factory() as session:
+            manager = await ensure_manager(session, telegram_id=1)
+            other = await ensure_manager(session, telegram_id=2)
+            client = Client(phone_number="+77770000001", phone_suffix="0001")
+            session.add(client)
+            for index in range(23):
+                session.add(
+                    Deal(
+                        client=client,
+                        manager=manager,
+                        status=DealStatus.PAID.value if index % 3 == 0 else DealStatus.NEW.value,
+                        # Pairs of deals share a timestamp, so the id tie-breaker matters.
+                        created_at=base + timedelta(minutes=index // 2),
+                    )
+                )
+            session.add(Deal(client=client, manager=other, created_at=base))
+            await session.commit()
+            manager_id = manager.id
+
+        async with session_factory() as session:
+            seen = []
+            pages = []
+            page = await list_deals_page(session, manager_id=manager_id, limit=10)
+            assert not page.has_prev
+            while True:
+                pages.append(page)
+                seen.extend(item.id for item in page.items)
+                if not page.has_next:
+                    break
+                page = await list_deals_page(
+                    session, manager_id=manager_id, cursor=page.last, limit=10
+                )
+
+            assert [len(p.items) for p in pages] == [10, 10, 3]
+            assert len(set(seen)) == 23
+            keys = [(item.created_at, item.id) for p in pages for item in p.items]
+            assert keys == sorted(keys, reverse=True)
+
+            back = await list_deals_page(
+                session, manager_id=manager_id, cursor=pages[2].first, backwards=True, limit=10
+            )
+            assert [item.id for item in back.items] == [item.id for item in pages[1].items]
+            assert back.has_prev and back.has_next
+
+            paid = await list_deals_page(
+                session, manager_id=manager_id, status_filter="paid", limit=100
+            )
+            assert len(paid.items) == 8
+            assert {item.status for item in paid.items} == {DealStatus.PAID.value}
+            active = await list_deals_page(
+                session, manager_id=manager_id, status_filter="active", limit=100
+            )
+            assert len(active.items) == 15
+
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+
+def test_cursor_round_trips_through_fsm_state() -> None:
+    cursor = DealCursor(created_at=datetime(2026, 3, 4, 5, 6, 7), id=42)
+    assert DealCursor.from_state(cursor.to_state()) == cursor
+
+
+def test_empty_listing_text_depends_on_the_filter() -> None:
+    assert _empty_listing_text("all") == "У вас пока нет сделок."
+    assert _empty_listing_text("paid") == "В разделе «Оплачены» сделок нет."
@@ -3,19 +3,20 @@ from __future__ import annotations
 
 import asyncio
 
-import pytest
+from sqlalchemy import event, select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-from sqlalchemy import select
-
 from tgcrm.db.models import Base, InvoiceItem
 from tgcrm.db.statuses import DealStatus
 from tgcrm.services.deals import (
     attach_invoice,
+    attach_invoice_stream,
     change_deal_status,
     create_deal_for_manager,
     create_reminder,
     ensure_manager,
+    find_deal_summary_by_phone_suffix,
+    get_active_deal_by_phone_suffix,
     get_or_create_client,
     log_interaction,
 )
@@ -28,7 +29,9 @@ def test_full_workflow() -> None:
         async with engine.begin() as connection:
             await connection.run_sync(Base.metadata.create_all)
 
-        session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
 
         async with session_factory() as session:
             manager = await ensure_manager(session, telegram_id=1, name="Менеджер")
@@ -69,3 +72,111 @@ def test_full_workflow() -> None:
         await engine.dispose()
 
     asyncio.run(runner())
+
+
+def test_suffix_search_loads_projection_and_recent_interactions() -> None:
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        async with session_factory() as session:
+            manager = await ensure_manager(session, telegram_id=1, name="Менеджер")
+            other = await ensure_manager(session, telegram_id=2, name="Коллега")
+            client = await get_or_create_client(session, phone_number="+77771234567", name="Иван")
+            deal = await create_deal_for_manager(session, client, manager)
+            await create_deal_for_manager(session, client, other)
+            for index in range(5):
+                await log_interaction(
+                    session,
+                    deal,
+                    interaction_type="звонок",
+                    ai_advice=None,
+                    manager_summary=f"Контакт {index}",
+                )
+            await session.commit()
+            deal_id, manager_id = deal.id, manager.id
+
+        async with session_factory() as session:
+            summary = await find_deal_summary_by_phone_suffix(
+                session, phone_suffix="4567", manager_id=manager_id
+            )
+            assert summary is not None
+            assert summary.id == deal_id
+            assert summary.client_name == "Иван"
+            assert summary.client_phone == "+77771234567"
+            assert await find_deal_summary_by_phone_suffix(
+                session, phone_suffix="0000", manager_id=manager_id
+            ) is None
+
+            manager = await ensure_manager(session, telegram_id=1)
+            loaded = await get_active_deal_by_phone_suffix(
+                session, phone_suffix="4567", manager=manager, interactions_limit=3
+            )
+            assert loaded is not None and loaded.id == deal_id
+            assert loaded.client.name == "Иван"
+            assert [item.manager_summary for item in loaded.interactions] == [
+                "Контакт 2",
+                "Контакт 3",
+                "Контакт 4",
+            ]
+            assert await loaded.awaitable_attrs.invoices == []
+
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+
+def test_invoice_items_are_bulk_inserted_from_a_stream() -> None:
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        statements = []
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def _record(conn, cursor, statement, parameters, context, executemany):  # noqa: ARG001
+            if statement.startswith("INSERT INTO invoice_items"):
+                statements.append(statement)
+
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        async def line_items():
+            for line_number in range(1, 302):
+                yield line_number, f"Позиция {line_number}"
+
+        async with session_factory() as session:
+            manager = await ensure_manager(session, telegram_id=1)
+            client = await get_or_create_client(session, phone_number="+77771234567")
+            deal = await create_deal_for_manager(session, client, manager)
+
+            invoice, inserted = await attach_invoice_stream(
+                session,
+                deal,
+                total_amount=1500,
+                file_path="big.pdf",
+                line_items=line_items(),
+                chunk_size=100,
+            )
+            assert inserted == 301
+            assert len(statements) == 4
+            items = (
+                await session.execute(
+                    select(InvoiceItem.line_number)
+                    .where(InvoiceItem.invoice_id == invoice.id)
+                    .order_by(InvoiceItem.id)
+                )
+            ).scalars().all()
+            assert items == list(range(1, 302))
+            assert deal.status == DealStatus.INVOICE_SENT.value
+
+        await engine.dispose()
+
+    asyncio.run(runner())
@@ -0,0 +1,174 @@
+"""Tests for the msgpack Redis FSM storage."""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import pytest
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisEventIsolation
+
+from tgcrm.bot.bot_factory import create_dispatcher, create_storage
+from tgcrm.bot.storage import MsgpackRedisStorage
+from tgcrm.config import get_settings
+
+
+class _HashRedis:
+    """The string and hash commands the storage uses, kept in memory.
+
+    ``round_trips`` counts calls that would reach the server: direct commands
+    and pipeline executions.
+    """
+
+    def __init__(self) -> None:
+        self.values: Dict[str, Any] = {}
+        self.expiry: Dict[str, int] = {}
+        self.round_trips = 0
+
+    # Direct commands.
+    async def get(self, key: str) -> Optional[bytes]:
+        self.round_trips += 1
+        return self._get(key)
+
+    async def set(self, key: str, value: str, px: Optional[int] = None) -> None:
+        self.round_trips += 1
+        self.values[key] = value.encode()
+        if px:
+            self.expiry[key] = px
+
+    async def delete(self, key: str) -> None:
+        self.round_trips += 1
+        self._delete(key)
+
+    async def hgetall(self, key: str) -> Dict[bytes, bytes]:
+        self.round_trips += 1
+        return self._hgetall(key)
+
+    async def hget(self, key: str, field: str) -> Optional[bytes]:
+        self.round_trips += 1
+        return self.values.get(key, {}).get(field.encode())
+
+    def pipeline(self, transaction: bool = True) -> "_Pipeline":
+        return _Pipeline(self)
+
+    # Shared implementations.
+    def _get(self, key: str) -> Optional[bytes]:
+        return self.values.get(key)
+
+    def _delete(self, key: str) -> None:
+        self.values.pop(key, None)
+        self.expiry.pop(key, None)
+
+    def _hgetall(self, key: str) -> Dict[bytes, bytes]:
+        return dict(self.values.get(key, {}))
+
+
+class _Pipeline:
+    def __init__(self, redis: _HashRedis) -> None:
+        self.redis = redis
+        self.commands: List[Any] = []
+
+    def delete(self, key: str) -> None:
+        self.commands.append(lambda: self.redis._delete(key))
+
+    def set(self, key: str, value: str) -> None:
+        self.commands.append(lambda: self.redis.values.__setitem__(key, value.encode()))
+
+    def hset(self, key: str, mapping: Dict[str, bytes]) -> None:
+        def run() -> int:
+            target = self.redis.values.setdefault(key, {})
+            target.update({name.encode(): value for name, value in mapping.items()})
+            return len(mapping)
+
+        self.commands.append(run)
+
+    def pexpire(self, key: str, ttl: int) -> None:
+        def run() -> bool:
+            if key not in self.redis.values:
+                return False
+            self.redis.expiry[key] = ttl
+            return True
+
+        self.commands.append(run)
+
+    def hgetall(self, key: str) -> None:
+        self.commands.append(lambda: self.redis._hgetall(key))
+
+    async def execute(self) -> List[Any]:
+        self.redis.round_trips += 1
+        return [command() for command in self.commands]
+
+
+class _Form(StatesGroup):
+    waiting = State()
+
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=20)
+
+
+def test_state_and_data_round_trip_with_ttl() -> None:
+    async def runner() -> None:
+        redis = _HashRedis()
+        storage = MsgpackRedisStorage(redis, ttl=60)  # type: ignore[arg-type]
+
+        await storage.set_state(KEY, _Form.waiting)
+        assert await storage.get_state(KEY) == _Form.waiting.state
+
+        await storage.set_data(KEY, {"active_deal_id": 7, "history": [1, 2]})
+        redis.round_trips = 0
+        merged = await storage.update_data(KEY, {"history": [1, 2, 3], "cursor": None})
+        assert redis.round_trips == 1
+        assert merged == {"active_deal_id": 7, "history": [1, 2, 3], "cursor": None}
+        assert await storage.get_value(KEY, "history") == [1, 2, 3]
+        assert await storage.get_value(KEY, "missing", "default") == "default"
+
+        data_key = storage.key_builder.build(KEY, "data")
+        state_key = storage.key_builder.build(KEY, "state")
+        assert redis.expiry == {data_key: 60_000, state_key: 60_000}
+
+        # Writing either key keeps the other one alive in the same round-trip.
+        redis.expiry.clear()
+        redis.round_trips = 0
+        await storage.update_data(KEY, {"cursor": 5})
+        assert redis.expiry == {data_key: 60_000, state_key: 60_000}
+        redis.expiry.clear()
+        await storage.set_state(KEY, _Form.waiting)
+        assert redis.expiry == {data_key: 60_000, state_key: 60_000}
+        assert redis.round_trips == 2
+
+        # An unnamed State() resets the state like None does.
+        await storage.set_state(KEY, State())
+        assert await storage.get_state(KEY) is None
+
+        await storage.set_state(KEY, _Form.waiting)
+        await storage.set_data(KEY, {})
+        await storage.set_state(KEY, None)
+        assert await storage.get_data(KEY) == {}
+        assert await storage.get_state(KEY) is None
+
+    asyncio.run(runner())
+
+
+def test_storage_is_selected_from_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert isinstance(create_storage(), MemoryStorage)
+
+    monkeypatch.setenv("FSM_STORAGE", "redis")
+    monkeypatch.setenv("FSM_TTL", "3600")
+    get_settings.cache_clear()
+    storage = create_storage()
+    assert isinstance(storage, MsgpackRedisStorage)
+    assert storage.ttl_ms == 3_600_000
+
+
+def test_webhook_replicas_lock_chats_in_redis(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("FSM_STORAGE", "redis")
+    get_settings.cache_clear()
+
+    dispatcher = create_dispatcher()
+    isolation = dispatcher.fsm.events_isolation
+    assert isinstance(isolation, RedisEventIsolation)
+    # The locks live next to the FSM keys and share the storage's connection pool.
+    assert isolation.redis is dispatcher.storage.redis
+    assert isolation.key_builder is dispatcher.storage.key_builder
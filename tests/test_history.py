@@ -0,0 +1,139 @@
+"""Tests for purging the bot's message history."""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, Dict, List, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.methods import DeleteMessage, DeleteMessages
+
+from tgcrm.bot.utils.history import (
+    RedisHistoryStore,
+    delete_messages,
+    get_history_store,
+    purge_history,
+    remember_message,
+    wait_for_deletes,
+)
+
+CHAT_ID = 42
+
+
+class FakeBot:
+    def __init__(self, *, bulk_supported: bool = True) -> None:
+        self.bulk_supported = bulk_supported
+        self.bulk_calls: List[List[int]] = []
+        self.single_calls: List[Tuple[int, int]] = []
+        self.release = asyncio.Event()
+
+    async def delete_messages(self, chat_id: int, message_ids: List[int]) -> bool:
+        await self.release.wait()
+        if not self.bulk_supported:
+            method = DeleteMessages(chat_id=chat_id, message_ids=message_ids)
+            raise TelegramBadRequest(method, "method not found")
+        self.bulk_calls.append(message_ids)
+        return True
+
+    async def delete_message(self, chat_id: int, message_id: int) -> bool:
+        if message_id == 3:
+            method = DeleteMessage(chat_id=chat_id, message_id=message_id)
+            raise TelegramBadRequest(method, "message to delete not found")
+        self.single_calls.append((chat_id, message_id))
+        return True
+
+
+def test_purge_returns_before_telegram_and_deletes_in_one_call(
+    make_state: Callable[..., FSMContext],
+) -> None:
+    async def runner() -> None:
+        bot = FakeBot()
+        state = make_state(CHAT_ID)
+        for message_id in (10, 11, 12):
+            await remember_message(state, message_id)
+
+        await purge_history(bot, CHAT_ID, state, also=(13,))  # type: ignore[arg-type]
+        # The history is cleared at once; Telegram has not answered yet.
+        assert await get_history_store().pop_all(state.key) == []
+        assert await state.get_data() == {}
+        assert bot.bulk_calls == []
+
+        bot.release.set()
+        await wait_for_deletes()
+        assert bot.bulk_calls == [[10, 11, 12, 13]]
+        assert bot.single_calls == []
+
+    asyncio.run(runner())
+
+
+def test_delete_messages_batches_and_falls_back_to_single_deletes() -> None:
+    async def runner() -> None:
+        bot = FakeBot()
+        bot.release.set()
+        await delete_messages(bot, CHAT_ID, list(range(1, 251)))  # type: ignore[arg-type]
+        assert [len(batch) for batch in bot.bulk_calls] == [100, 100, 50]
+
+        legacy = FakeBot(bulk_supported=False)
+        legacy.release.set()
+        await delete_messages(legacy, CHAT_ID, [1, 2, 3, 4])  # type: ignore[arg-type]
+        # Message 3 is gone already and is skipped.
+        assert sorted(legacy.single_calls) == [(CHAT_ID, 1), (CHAT_ID, 2), (CHAT_ID, 4)]
+
+    asyncio.run(runner())
+
+
+class _ListRedis:
+    """The list commands of the Redis history store, kept in memory."""
+
+    def __init__(self) -> None:
+        self.lists: Dict[str, List[bytes]] = {}
+        self.expiry: Dict[str, int] = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction: bool = True) -> "_ListPipeline":
+        return _ListPipeline(self)
+
+
+class _ListPipeline:
+    def __init__(self, redis: _ListRedis) -> None:
+        self.redis = redis
+        self.commands: List[Callable[[], Any]] = []
+
+    def lpush(self, key: str, value: int) -> None:
+        self.commands.append(lambda: self.redis.lists.setdefault(key, []).insert(0, b"%d" % value))
+
+    def ltrim(self, key: str, start: int, stop: int) -> None:
+        def run() -> None:
+            self.redis.lists[key] = self.redis.lists.get(key, [])[start : stop + 1]
+
+        self.commands.append(run)
+
+    def expire(self, key: str, seconds: int) -> None:
+        self.commands.append(lambda: self.redis.expiry.__setitem__(key, seconds))
+
+    def lrange(self, key: str, start: int, stop: int) -> None:
+        self.commands.append(lambda: list(self.redis.lists.get(key, [])))
+
+    def delete(self, key: str) -> None:
+        self.commands.append(lambda: self.redis.lists.pop(key, None))
+
+    async def execute(self) -> List[Any]:
+        self.redis.round_trips += 1
+        return [command() for command in self.commands]
+
+
+def test_redis_history_is_a_bounded_ring_buffer() -> None:
+    redis = _ListRedis()
+    store = RedisHistoryStore(redis, limit=3, ttl=60)  # type: ignore[arg-type]
+    key = StorageKey(bot_id=1, chat_id=CHAT_ID, user_id=CHAT_ID)
+
+    async def runner() -> List[int]:
+        await asyncio.gather(*(store.push(key, message_id) for message_id in range(1, 6)))
+        return await store.pop_all(key)
+
+    # Only the newest ids survive, oldest first; one round-trip per call.
+    assert asyncio.run(runner()) == [3, 4, 5]
+    assert redis.round_trips == 6
+    assert redis.expiry == {f"tgcrm:history:1:{CHAT_ID}": 60}
+    assert redis.lists == {}
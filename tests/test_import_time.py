@@ -0,0 +1,64 @@
+"""Cold-start import budgets for the bot, the Celery app and the database CLI."""
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+# Milliseconds, measured with ``python -X importtime`` in a fresh interpreter.
+IMPORT_BUDGETS_MS = {
+    "tgcrm.bot.main": 2500,
+    "tgcrm.tasks.celery_app": 2000,
+    "tgcrm.db.manage": 1000,
+}
+# The bot cannot start without aiogram; its own import cost is not ours to budget.
+EXEMPT_PACKAGES = {"tgcrm.bot.main": ("aiogram",)}
+# Loaded on the first PDF or AI call, never at startup.
+LAZY_PACKAGES = ("fitz", "pymupdf", "pytesseract", "PIL", "openai")
+NOT_IMPORTED = {
+    "tgcrm.bot.main": LAZY_PACKAGES + ("asyncpg",),
+    "tgcrm.tasks.celery_app": LAZY_PACKAGES + ("aiogram", "asyncpg"),
+    "tgcrm.db.manage": LAZY_PACKAGES + ("aiogram", "asyncpg", "celery"),
+}
+
+
+def _import_profile(module: str) -> Tuple[Dict[str, int], List[str]]:
+    """Import ``module`` in a fresh interpreter; return cumulative µs per module and sys.modules."""
+
+    env = dict(os.environ, PYTHONPATH=str(SRC))
+    script = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    cumulative: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, total_us, name = (part.strip() for part in line[len("import time:") :].split("|"))
+        cumulative.setdefault(name, int(total_us))
+    return cumulative, result.stdout.split()
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGETS_MS))
+def test_entry_point_imports_within_budget(module: str) -> None:
+    cumulative, loaded = _import_profile(module)
+
+    eager = [name for name in NOT_IMPORTED[module] if name in loaded]
+    assert eager == [], f"{module} imports {eager} at startup"
+
+    exempt_us = sum(cumulative.get(name, 0) for name in EXEMPT_PACKAGES.get(module, ()))
+    elapsed_ms = (cumulative[module] - exempt_us) / 1000
+    budget_ms = IMPORT_BUDGETS_MS[module]
+    assert (
+        elapsed_ms <= budget_ms
+    ), f"importing {module} took {elapsed_ms:.0f} ms (budget {budget_ms})"
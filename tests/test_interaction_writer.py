@@ -0,0 +1,237 @@
+"""Tests for the write-behind interaction writer."""
+from __future__ import annotations
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from tgcrm.db.models import Base, Deal, Interaction
+from tgcrm.services import interaction_writer
+from tgcrm.services.deals import create_deal_for_manager, ensure_manager, get_or_create_client
+from tgcrm.services.interaction_writer import (
+    DEAD_LETTER_KEY,
+    InteractionWriter,
+    PendingInteraction,
+)
+
+
+class _ListRedis:
+    """The three list commands the writer uses, kept in memory."""
+
+    def __init__(self) -> None:
+        self.lists: Dict[str, List[str]] = {}
+
+    async def rpush(self, key: str, *values: str) -> int:
+        self.lists.setdefault(key, []).extend(values)
+        return len(self.lists[key])
+
+    async def lpush(self, key: str, *values: str) -> int:
+        for value in values:
+            self.lists.setdefault(key, []).insert(0, value)
+        return len(self.lists[key])
+
+    async def lpop(self, key: str, count: int) -> List[str] | None:
+        items = self.lists.get(key, [])
+        popped, self.lists[key] = items[:count], items[count:]
+        return popped or None
+
+
+async def _setup() -> tuple:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as session:
+        manager = await ensure_manager(session, telegram_id=1)
+        client = await get_or_create_client(session, "+77770001122")
+        first = await create_deal_for_manager(session, client, manager)
+        second = await create_deal_for_manager(session, client, manager)
+        await session.commit()
+    return engine, session_factory, first.id, second.id
+
+
+def test_rows_are_batched_and_flushed_on_stop() -> None:
+    async def runner() -> None:
+        engine, session_factory, first_id, second_id = await _setup()
+        writer = InteractionWriter(
+            session_factory, flush_interval=60, max_rows=50, buffer_limit=100
+        )
+        await writer.start()
+
+        base = datetime(2026, 10, 1, 9, 0, tzinfo=timezone.utc)
+        for index in range(7):
+            deal_id = first_id if index % 2 else second_id
+            created_at = base + timedelta(minutes=index)
+            await writer.submit(
+                PendingInteraction(deal_id, "звонок", f"Звонок {index}", None, created_at)
+            )
+        assert writer.pending == 7
+
+        await writer.stop()
+        assert writer.pending == 0
+        assert writer.batches == 1
+
+        async with session_factory() as session:
+            count = await session.scalar(select(func.count()).select_from(Interaction))
+            last = dict((await session.execute(select(Deal.id, Deal.last_interaction_at))).all())
+        assert count == 7
+        assert last[first_id].replace(tzinfo=timezone.utc) == base + timedelta(minutes=5)
+        assert last[second_id].replace(tzinfo=timezone.utc) == base + timedelta(minutes=6)
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+
+def test_overflow_spills_to_redis_and_is_drained() -> None:
+    async def runner() -> None:
+        engine, session_factory, first_id, _ = await _setup()
+        redis = _ListRedis()
+        writer = InteractionWriter(
+            session_factory, flush_interval=60, max_rows=10, buffer_limit=2, redis=redis
+        )
+        await writer.start()
+        for index in range(5):
+            await writer.submit(
+                PendingInteraction.create(
+                    first_id, interaction_type="письмо", manager_summary=f"#{index}", ai_advice=None
+                )
+            )
+        assert writer.spilled == 3
+
+        await writer.stop()
+        assert redis.lists["tgcrm:interactions:spill"] == []
+        async with session_factory() as session:
+            summaries = (await session.execute(select(Interaction.manager_summary))).scalars().all()
+        assert sorted(summaries) == ["#0", "#1", "#2", "#3", "#4"]
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+
+def test_advice_is_attached_to_queued_and_written_interactions(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async def runner() -> None:
+        engine, session_factory, first_id, _ = await _setup()
+        async with session_factory() as session:
+            deal = await session.get(Deal, first_id)
+            written = await interaction_writer.record_interaction(
+                session, deal, interaction_type="message", ai_advice=None, manager_summary="Звонок"
+            )
+            await session.commit()
+
+        writer = InteractionWriter(
+            session_factory, flush_interval=60, max_rows=50, buffer_limit=100
+        )
+        monkeypatch.setattr(interaction_writer, "_writer", writer)
+        await writer.start()
+        async with session_factory() as session:
+            queued = await interaction_writer.record_interaction(
+                session, deal, interaction_type="message", ai_advice=None, manager_summary="Письмо"
+            )
+            assert await interaction_writer.attach_ai_advice(session, queued, "Отправьте КП")
+            assert await interaction_writer.attach_ai_advice(session, written, "Перезвоните")
+            await session.commit()
+        await writer.stop()
+
+        async with session_factory() as session:
+            result = await session.execute(
+                select(Interaction.manager_summary, Interaction.ai_advice)
+            )
+            rows = dict(result.all())
+        assert rows == {"Звонок": "Перезвоните", "Письмо": "Отправьте КП"}
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+
+def test_advice_reaches_rows_that_are_being_written_or_spilled(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async def runner() -> None:
+        engine, session_factory, first_id, _ = await _setup()
+        database_reachable = asyncio.Event()
+
+        @asynccontextmanager
+        async def slow_session() -> AsyncIterator[AsyncSession]:
+            await database_reachable.wait()
+            async with session_factory() as session:
+                yield session
+
+        redis = _ListRedis()
+        writer = InteractionWriter(
+            slow_session, flush_interval=60, max_rows=50, buffer_limit=1, redis=redis
+        )
+        monkeypatch.setattr(interaction_writer, "_writer", writer)
+        await writer.start()
+        async with session_factory() as session:
+            deal = await session.get(Deal, first_id)
+            in_flight = await interaction_writer.record_interaction(
+                session, deal, interaction_type="message", ai_advice=None, manager_summary="Звонок"
+            )
+            spilled = await interaction_writer.record_interaction(
+                session, deal, interaction_type="message", ai_advice=None, manager_summary="Письмо"
+            )
+            assert writer.spilled == 1
+            # The flusher takes the queued row and waits for the database.
+            await asyncio.sleep(0.01)
+            assert writer.pending == 0
+
+            assert await interaction_writer.attach_ai_advice(session, in_flight, "Отправьте КП")
+            assert await interaction_writer.attach_ai_advice(session, spilled, "Перезвоните")
+        database_reachable.set()
+        await writer.stop()
+
+        async with session_factory() as session:
+            result = await session.execute(
+                select(Interaction.manager_summary, Interaction.ai_advice)
+            )
+            rows = dict(result.all())
+        assert rows == {"Звонок": "Отправьте КП", "Письмо": "Перезвоните"}
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+
+def test_a_row_that_keeps_failing_is_dead_lettered_and_the_rest_written() -> None:
+    async def runner() -> None:
+        engine, session_factory, first_id, _ = await _setup()
+        redis = _ListRedis()
+        writer = InteractionWriter(
+            session_factory,
+            flush_interval=0.01,
+            max_rows=10,
+            buffer_limit=100,
+            max_attempts=2,
+            redis=redis,
+        )
+        await writer.start()
+        for index in range(5):
+            # The third row violates NOT NULL and fails every batch it is in.
+            summary = None if index == 2 else f"#{index}"
+            await writer.submit(
+                PendingInteraction.create(
+                    first_id, interaction_type="звонок", manager_summary=summary, ai_advice=None
+                )
+            )
+        for _ in range(200):
+            if writer.dead_lettered:
+                break
+            await asyncio.sleep(0.01)
+        await writer.stop()
+
+        assert writer.dead_lettered == 1
+        (dead,) = redis.lists[DEAD_LETTER_KEY]
+        assert PendingInteraction.from_json(json.loads(dead)["interaction"]).manager_summary is None
+        async with session_factory() as session:
+            summaries = (await session.execute(select(Interaction.manager_summary))).scalars().all()
+        assert sorted(summaries) == ["#0", "#1", "#3", "#4"]
+        await engine.dispose()
+
+    asyncio.run(runner())
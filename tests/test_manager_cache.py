@@ -0,0 +1,93 @@
+"""Tests for the manager identity cache in front of ensure_manager."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from tgcrm.config import get_settings
+from tgcrm.db.models import Base
+from tgcrm.services.deals import create_deal_for_manager, ensure_manager, get_or_create_client
+from tgcrm.services.manager_cache import ManagerIdentity, ManagerIdentityCache, manager_cache
+
+
+def test_cache_evicts_least_recently_used_and_expired_entries() -> None:
+    now = [0.0]
+    cache = ManagerIdentityCache(maxsize=2, ttl=10.0, clock=lambda: now[0])
+    for telegram_id in (1, 2):
+        cache.put(
+            ManagerIdentity(id=telegram_id, telegram_id=telegram_id, name=None, role="manager")
+        )
+
+    assert cache.get(1) is not None
+    cache.put(ManagerIdentity(id=3, telegram_id=3, name=None, role="manager"))
+    assert cache.get(2) is None
+
+    now[0] = 11.0
+    assert cache.get(1) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "size": 1}
+
+
+def test_ensure_manager_skips_select_on_hit_and_invalidates_on_update() -> None:
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        selects = []
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def _count(conn, cursor, statement, parameters, context, executemany):  # noqa: ARG001
+            if statement.lstrip().upper().startswith("SELECT") and "managers" in statement:
+                selects.append(statement)
+
+        async with session_factory() as session:
+            await ensure_manager(session, 42, name="Анна")
+            await session.commit()
+
+        async with session_factory() as session:
+            manager = await ensure_manager(session, 42)
+            assert manager_cache.get(42) is not None
+            await session.commit()
+        selects_before = len(selects)
+
+        async with session_factory() as session:
+            manager = await ensure_manager(session, 42, name="Анна")
+            assert len(selects) == selects_before
+            assert manager.name == "Анна"
+            client = await get_or_create_client(session, "+77770001122")
+            deal = await create_deal_for_manager(session, client, manager)
+            assert deal.manager_id == manager.id
+
+            manager.role = "supervisor"
+            await session.commit()
+
+        assert manager_cache.get(42) is None
+        async with session_factory() as session:
+            manager = await ensure_manager(session, 42)
+            assert manager.role == "supervisor"
+
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+
+def test_cache_is_sized_from_settings_on_first_use(monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = ManagerIdentityCache()
+    # Settings changed after the cache was created are still picked up.
+    monkeypatch.setenv("MANAGER_CACHE_SIZE", "1")
+    get_settings.cache_clear()
+
+    for telegram_id in (1, 2):
+        cache.put(
+            ManagerIdentity(id=telegram_id, telegram_id=telegram_id, name=None, role="manager")
+        )
+
+    assert (cache.maxsize, cache.ttl) == (1, 300.0)
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
@@ -0,0 +1,35 @@
+"""Tests for the bundled Alembic migrations."""
+from __future__ import annotations
+
+import asyncio
+
+from alembic import command
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from tgcrm.db.migrations import _run_with_connection
+
+
+def test_upgrade_creates_hot_path_indexes() -> None:
+    async def runner() -> dict[str, list[str]]:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        async with engine.connect() as connection:
+            await connection.run_sync(_run_with_connection, command.upgrade, "head")
+            indexes = await connection.run_sync(
+                lambda sync_conn: {
+                    table: sorted(index["name"] for index in inspect(sync_conn).get_indexes(table))
+                    for table in ("clients", "deals", "reminders")
+                }
+            )
+        await engine.dispose()
+        return indexes
+
+    indexes = asyncio.run(runner())
+
+    assert "ix_client_phone_suffix_id" in indexes["clients"]
+    assert "ix_client_phone_suffix" not in indexes["clients"]
+    assert "ix_deal_followup_due" in indexes["deals"]
+    assert "ix_deal_manager_created" in indexes["deals"]
+    assert "ix_deal_manager_status_created" in indexes["deals"]
+    assert "ix_deal_manager_status" not in indexes["deals"]
+    assert "ix_reminder_due" in indexes["reminders"]
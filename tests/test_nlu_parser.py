@@ -0,0 +1,87 @@
+"""Accuracy and throughput of the intent matcher on a labelled corpus.
+
+The throughput comparison depends on the machine and its load, so it only
+runs when asked for: ``pytest -m benchmark``. The agreement and accuracy
+checks are the gate.
+"""
+from __future__ import annotations
+
+import timeit
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+
+from tgcrm.bot import nlu_parser
+from tgcrm.bot.nlu_parser import INTENT_KEYWORDS, detect_intent, extract_entities
+
+CORPUS_PATH = Path(__file__).parent / "data" / "nlu_corpus.tsv"
+# Share of corpus phrases the keyword matcher labels like a person would.
+MIN_ACCURACY = 0.92
+
+
+def _load_corpus() -> List[Tuple[str, str]]:
+    rows = []
+    for line in CORPUS_PATH.read_text(encoding="utf-8").splitlines():
+        if line and not line.startswith("#"):
+            intent, text = line.split("\t", 1)
+            rows.append((intent, text))
+    return rows
+
+
+CORPUS = _load_corpus()
+
+
+def _reference_intent(message_text: str) -> str:
+    """The original keyword scan, kept to prove the compiled matcher agrees with it."""
+
+    text = message_text.strip().lower()
+    if not text:
+        return "add_interaction"
+    if nlu_parser.PHONE_PATTERN.fullmatch(text.replace(" ", "")):
+        return "create_client"
+    if nlu_parser.FOUR_DIGITS_PATTERN.findall(text) and len(text) <= 10:
+        return "search_deal_by_last4"
+    for intent, keywords in INTENT_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return intent
+    if text.isdigit() and len(text) >= 4:
+        return "search_deal_by_last4"
+    return "add_interaction"
+
+
+def test_matcher_agrees_with_the_reference_scan_and_keeps_its_accuracy() -> None:
+    disagreements = [
+        text for _, text in CORPUS if detect_intent(text) != _reference_intent(text)
+    ]
+    assert disagreements == []
+
+    correct = sum(detect_intent(text) == intent for intent, text in CORPUS)
+    assert correct / len(CORPUS) >= MIN_ACCURACY
+
+
+@pytest.mark.benchmark
+def test_matcher_is_not_slower_than_the_reference_scan() -> None:
+    texts = [text for _, text in CORPUS]
+    classify = nlu_parser._classify.__wrapped__  # Uncached, to time the matching itself.
+
+    compiled = min(timeit.repeat(lambda: [classify(text) for text in texts], number=50, repeat=5))
+    reference = min(
+        timeit.repeat(lambda: [_reference_intent(text) for text in texts], number=50, repeat=5)
+    )
+    assert compiled <= reference, (
+        f"intent matching: {len(texts) * 50 / compiled:,.0f} phrases/s compiled, "
+        f"{len(texts) * 50 / reference:,.0f} phrases/s reference"
+    )
+
+
+def test_message_is_classified_once_per_text() -> None:
+    nlu_parser._classify.cache_clear()
+    text = "переведи сделку 4455 в статус оплачено"
+
+    assert detect_intent(text) == "change_status"
+    entities = extract_entities(text)
+
+    assert (entities["intent"], entities["identifier"]) == ("change_status", "4455")
+    info = nlu_parser._classify.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
@@ -0,0 +1,53 @@
+"""Tests for notifications sent by Celery tasks."""
+from __future__ import annotations
+
+import asyncio
+from typing import List, Tuple
+
+import pytest
+
+from tgcrm.services import notifications
+from tgcrm.services.notifications import notification_bot, send_notification
+
+
+class _FakeSession:
+    def __init__(self) -> None:
+        self.closed = 0
+
+    async def close(self) -> None:
+        self.closed += 1
+
+
+class _FakeBot:
+    def __init__(self) -> None:
+        self.session = _FakeSession()
+        self.sent: List[Tuple[int, str]] = []
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.sent.append((chat_id, text))
+
+
+def test_sends_inside_a_task_run_share_one_bot(monkeypatch: pytest.MonkeyPatch) -> None:
+    bots: List[_FakeBot] = []
+
+    def create_bot() -> _FakeBot:
+        bots.append(_FakeBot())
+        return bots[-1]
+
+    monkeypatch.setattr(notifications, "_create_bot", create_bot)
+
+    async def runner() -> None:
+        async with notification_bot():
+            pass
+        # Nothing was sent, so no bot was created.
+        assert bots == []
+
+        async with notification_bot():
+            for telegram_id in (1, 2, 3):
+                await send_notification(telegram_id, "🔔")
+        await send_notification(4, "🔔")
+
+    asyncio.run(runner())
+
+    assert [len(bot.sent) for bot in bots] == [3, 1]
+    assert [bot.session.closed for bot in bots] == [1, 1]
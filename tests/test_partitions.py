@@ -0,0 +1,95 @@
+"""Tests for interaction partition bookkeeping."""
+from __future__ import annotations
+
+import asyncio
+from datetime import date
+from typing import Any, List, Optional
+
+from tgcrm.db.partitions import (
+    MonthPartition,
+    archive_candidates,
+    create_partition_sql,
+    ensure_partitions,
+    partitions_between,
+)
+
+
+class _Result:
+    def __init__(self, rows: List[Any], rowcount: int = 0) -> None:
+        self.rows = rows
+        self.rowcount = rowcount
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def scalar(self) -> Optional[Any]:
+        return self.rows[0][0] if self.rows else None
+
+
+class _RecordingConnection:
+    """Answers the catalogue and EXISTS queries ``ensure_partitions`` issues."""
+
+    def __init__(self, existing: List[str], default_months: List[str]) -> None:
+        self.existing = existing
+        self.default_months = default_months
+        self.statements: List[str] = []
+
+    async def execute(self, statement: Any, params: Any = None) -> _Result:
+        sql = str(statement)
+        self.statements.append(sql)
+        if "pg_inherits" in sql:
+            return _Result([(name,) for name in self.existing])
+        if sql.startswith("SELECT EXISTS"):
+            return _Result([(any(f"'{month}'" in sql for month in self.default_months),)])
+        return _Result([], rowcount=3)
+
+
+def test_partitions_cover_each_month_across_year_boundary() -> None:
+    partitions = partitions_between(date(2025, 11, 15), date(2026, 2, 3))
+
+    assert [p.name for p in partitions] == [
+        "interactions_y2025m11",
+        "interactions_y2025m12",
+        "interactions_y2026m01",
+        "interactions_y2026m02",
+    ]
+    assert partitions[1].end == date(2026, 1, 1)
+    assert create_partition_sql(partitions[1]) == (
+        "CREATE TABLE IF NOT EXISTS interactions_y2025m12 PARTITION OF interactions "
+        "FOR VALUES FROM ('2025-12-01') TO ('2026-01-01')"
+    )
+
+
+def test_archive_candidates_only_include_fully_cold_months() -> None:
+    partitions = partitions_between(date(2025, 8, 1), date(2026, 10, 1))
+
+    cold = archive_candidates(partitions, older_than_months=12, today=date(2026, 10, 17))
+
+    assert [p.name for p in cold] == ["interactions_y2025m08", "interactions_y2025m09"]
+    assert MonthPartition.from_name("interactions_default") is None
+    assert MonthPartition.from_name("interactions_y2025m09") == cold[-1]
+
+
+def test_month_with_rows_in_the_default_partition_is_split_out() -> None:
+    connection = _RecordingConnection(
+        existing=["interactions_y2026m10", "interactions_default"],
+        # The maintenance task fell behind: November rows went to the default partition.
+        default_months=["2026-11-01"],
+    )
+
+    created = asyncio.run(ensure_partitions(connection, months_ahead=2, today=date(2026, 10, 17)))
+
+    # October already existed.
+    assert created == ["interactions_y2026m11", "interactions_y2026m12"]
+    changes = [sql for sql in connection.statements if not sql.startswith("SELECT")]
+    assert changes == [
+        "ALTER TABLE interactions DETACH PARTITION interactions_default",
+        create_partition_sql(MonthPartition(date(2026, 11, 1))),
+        "WITH moved AS (DELETE FROM interactions_default "
+        "WHERE created_at >= '2026-11-01' AND created_at < '2026-12-01' "
+        "RETURNING id, deal_id, type, ai_advice, manager_summary, created_at) "
+        "INSERT INTO interactions_y2026m11 (id, deal_id, type, ai_advice, manager_summary, "
+        "created_at) SELECT id, deal_id, type, ai_advice, manager_summary, created_at FROM moved",
+        "ALTER TABLE interactions ATTACH PARTITION interactions_default DEFAULT",
+        create_partition_sql(MonthPartition(date(2026, 12, 1))),
+    ]
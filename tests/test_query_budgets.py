@@ -0,0 +1,118 @@
+"""Tests for declared query budgets and the N+1 guard."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from tgcrm.db.instrumentation import (
+    QueryBudgetExceeded,
+    assert_max_queries,
+    strict_query_budgets,
+    tag_queries,
+)
+from tgcrm.db.models import Base, Client, Deal, Interaction, Manager, Reminder
+from tgcrm.tasks import reminders
+
+
+@tag_queries(budget=1)
+async def _load_clients_one_by_one(session: AsyncSession, ids: list[int]) -> None:
+    for client_id in ids:
+        await session.get(Client, client_id)
+
+
+def test_budget_raises_in_strict_mode_and_warns_otherwise(caplog: pytest.LogCaptureFixture) -> None:
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        async with session_factory() as session:
+            session.add_all(
+                [Client(phone_number=f"+7777000000{i}", phone_suffix=f"000{i}") for i in range(3)]
+            )
+            await session.commit()
+
+        async with session_factory() as session:
+            with pytest.raises(QueryBudgetExceeded) as excinfo:
+                await _load_clients_one_by_one(session, [1, 2, 3])
+            assert excinfo.value.counter.statements == 3
+
+        async with session_factory() as session:
+            with strict_query_budgets(False):
+                await _load_clients_one_by_one(session, [1, 2, 3])
+
+        async with session_factory() as session:
+            with pytest.raises(QueryBudgetExceeded):
+                with assert_max_queries(1):
+                    await session.execute(select(Client))
+                    await session.execute(select(Deal))
+        await engine.dispose()
+
+    caplog.set_level(logging.WARNING, logger="tgcrm.db.instrumentation")
+    asyncio.run(runner())
+    warnings = [record for record in caplog.records if record.getMessage() == "Query budget exceeded"]
+    assert len(warnings) == 1
+    assert warnings[0].extra["budget"] == 1
+
+
+@pytest.mark.parametrize("due", [1, 5])
+def test_due_reminders_issue_a_constant_number_of_statements(
+    monkeypatch: pytest.MonkeyPatch, due: int
+) -> None:
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        @asynccontextmanager
+        async def fake_get_session(*, readonly: bool = False) -> AsyncIterator[AsyncSession]:
+            async with session_factory() as session:
+                yield session
+                if not readonly:
+                    await session.commit()
+
+        monkeypatch.setattr(reminders, "get_session", fake_get_session)
+        notify = AsyncMock()
+        monkeypatch.setattr(reminders, "send_notification", notify)
+        monkeypatch.setattr("tgcrm.services.ai.get_ai_advice", AsyncMock(return_value="Позвоните"))
+
+        past = datetime.utcnow() - timedelta(minutes=5)
+        async with session_factory() as session:
+            for index in range(due):
+                manager = Manager(telegram_id=100 + index, name=f"M{index}")
+                client = Client(phone_number=f"+7777000{index:04d}", phone_suffix=f"{index:04d}")
+                deal = Deal(client=client, manager=manager)
+                session.add_all(
+                    [
+                        deal,
+                        Interaction(deal=deal, type="звонок", manager_summary="Обсудили счёт"),
+                        Reminder(deal=deal, remind_at=past, is_sent=False),
+                    ]
+                )
+            await session.commit()
+
+        # Strict budgets are on for the whole suite; the task's budget is checked
+        # on return regardless of how many reminders were due.
+        await reminders._send_due_reminders()
+
+        assert notify.await_count == due
+        async with session_factory() as session:
+            pending = await session.scalars(select(Reminder).where(Reminder.is_sent.is_(False)))
+            assert pending.all() == []
+        await engine.dispose()
+
+    asyncio.run(runner())
@@ -0,0 +1,111 @@
+"""Tests for SQL timing, slow-query logging and per-unit query counting."""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from tgcrm.db.instrumentation import (
+    LatencyHistogram,
+    count_queries,
+    instrument_engine,
+    query_histogram,
+    tag_queries,
+)
+from tgcrm.db.models import Base, Client, Deal
+from tgcrm.logging import JsonLogFormatter
+from tgcrm.services.deals import ensure_manager, get_active_deal_by_phone_suffix
+
+
+def test_statements_are_tagged_counted_and_logged_when_slow(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    @tag_queries("tests.load_clients")
+    async def load_clients(session: AsyncSession) -> None:
+        await session.execute(select(Client))
+
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        # A zero threshold makes every statement "slow".
+        instrument_engine(engine, slow_query_ms=0)
+        instrument_engine(engine, slow_query_ms=0)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        query_histogram.reset()
+        with count_queries("test-unit", warn_at=0) as counter:
+            async with session_factory() as session:
+                await load_clients(session)
+                await session.execute(select(Deal.id))
+
+        assert counter.statements == 2
+        assert counter.by_tag == {"tests.load_clients": 1, "untagged": 1}
+        assert query_histogram.snapshot()["tests.load_clients"]["count"] == 1
+        await engine.dispose()
+
+    caplog.set_level(logging.DEBUG, logger="tgcrm.db.instrumentation")
+    asyncio.run(runner())
+
+    slow = [record for record in caplog.records if record.getMessage() == "Slow query"]
+    tagged = [record for record in slow if record.extra["query_tag"] == "tests.load_clients"]
+    assert len(tagged) == 1
+    rendered = json.loads(JsonLogFormatter().format(tagged[0]))
+    assert rendered["unit"] == "test-unit"
+    assert rendered["statement"].startswith("SELECT")
+    assert rendered["duration_ms"] >= 0
+
+    summary = [record for record in caplog.records if record.getMessage() == "Query count"]
+    assert summary[-1].extra["queries"] == 2
+
+
+def test_query_count_exposes_lazy_loads() -> None:
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        instrument_engine(engine, slow_query_ms=10_000)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        async with session_factory() as session:
+            manager = await ensure_manager(session, telegram_id=1)
+            client = Client(phone_number="+77770000001", phone_suffix="0001")
+            session.add(Deal(client=client, manager=manager))
+            await session.commit()
+
+        async with session_factory() as session:
+            with count_queries("card") as counter:
+                deal = await get_active_deal_by_phone_suffix(
+                    session, phone_suffix="0001", manager=manager
+                )
+                assert deal is not None
+                await deal.awaitable_attrs.invoices
+
+        tags = counter.by_tag
+        # The innermost tagged function wins.
+        assert tags["get_active_deal_by_phone_suffix"] == 1
+        assert tags["load_recent_interactions"] == 1
+        # The relationship load happens outside any tagged service function.
+        assert tags["untagged"] == 1
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    histogram = LatencyHistogram(buckets=(10, 100))
+    for elapsed in (5, 50, 500):
+        histogram.observe("tag", elapsed)
+
+    series = histogram.snapshot()["tag"]
+    assert series["buckets"] == {"10": 1, "100": 2, "+Inf": 3}
+    assert series["count"] == 3
+    assert series["max_ms"] == 500
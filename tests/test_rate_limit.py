@@ -0,0 +1,176 @@
+"""Tests for the outbound send limiter."""
+from __future__ import annotations
+
+import asyncio
+from typing import List
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendChatAction, SendMessage
+
+from tgcrm.bot.rate_limit import RateLimitMiddleware, SendLimiter, SendPriority, send_priority
+
+
+def test_interactive_sends_overtake_a_proactive_backlog() -> None:
+    order: List[str] = []
+    limiter = SendLimiter(global_rate=20, chat_interval=0, group_interval=0)
+
+    async def send(chat_id: int, priority: SendPriority) -> None:
+        await limiter.acquire(chat_id, priority)
+        order.append(priority.name)
+
+    async def runner() -> None:
+        # The one-second burst (20 tokens) goes to the first proactive sends.
+        proactive = [
+            asyncio.create_task(send(chat_id, SendPriority.PROACTIVE)) for chat_id in range(25)
+        ]
+        await asyncio.sleep(0.01)
+        interactive = [
+            asyncio.create_task(send(1000 + chat_id, SendPriority.INTERACTIVE))
+            for chat_id in range(3)
+        ]
+        await asyncio.gather(*proactive, *interactive)
+
+    asyncio.run(runner())
+
+    assert order[:20] == ["PROACTIVE"] * 20
+    assert order[20:23] == ["INTERACTIVE"] * 3
+    assert order[23:] == ["PROACTIVE"] * 5
+    snapshot = limiter.metrics.snapshot()
+    assert snapshot["waiting"] == {"interactive": 0, "reminder": 0, "proactive": 0}
+    assert snapshot["wait_ms"]["proactive"]["count"] == 25
+
+
+def test_sends_to_one_chat_are_paced() -> None:
+    clock = {"now": 0.0}
+    limiter = SendLimiter(
+        global_rate=30, chat_interval=1.0, group_interval=3.0, clock=lambda: clock["now"]
+    )
+
+    async def runner() -> None:
+        await limiter.acquire(42, SendPriority.INTERACTIVE)
+        # The next send to the same private chat reserves the slot a second later.
+        assert limiter._chat_next_free[42] == 1.0
+        await limiter.acquire(-100, SendPriority.INTERACTIVE)
+        assert limiter._chat_next_free[-100] == 3.0
+
+    asyncio.run(runner())
+
+
+def test_flood_control_pauses_the_chat_and_retries() -> None:
+    limiter = SendLimiter(global_rate=100, chat_interval=0, group_interval=0)
+    middleware = RateLimitMiddleware(limiter, max_retries=2)
+    calls: List[str] = []
+
+    async def make_request(bot, method):  # type: ignore[no-untyped-def]
+        calls.append(type(method).__name__)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method, "Flood control exceeded", retry_after=0)
+        return "ok"
+
+    async def runner() -> None:
+        with send_priority(SendPriority.REMINDER):
+            assert await middleware(make_request, None, SendMessage(chat_id=7, text="hi")) == "ok"
+        assert await middleware(make_request, None, GetMe()) == "ok"
+
+    asyncio.run(runner())
+
+    assert calls == ["SendMessage", "SendMessage", "GetMe"]
+    snapshot = limiter.metrics.snapshot()
+    assert snapshot["retried"] == 1
+    assert snapshot["failed"] == 0
+    # GetMe is not a send and bypasses the limiter.
+    assert snapshot["sent"] == {"interactive": 0, "reminder": 1, "proactive": 0}
+
+
+class _SharedBucket:
+    """Stands in for the Redis bucket: one budget for several limiters."""
+
+    def __init__(self, tokens: int) -> None:
+        self.tokens = tokens
+        self.capacity = float(tokens)
+        self.paused_for = 0.0
+        self.available = True
+
+    async def take(self, reserve: float = 0.0) -> float:
+        if not self.available:
+            raise ConnectionError("Redis is down")
+        if self.tokens >= 1 + reserve:
+            self.tokens -= 1
+            return 0.0
+        return 0.05
+
+    async def pause(self, seconds: float) -> None:
+        self.paused_for = seconds
+
+
+def test_processes_draw_from_one_shared_budget() -> None:
+    bucket = _SharedBucket(tokens=4)
+    # Two processes, each allowed 100 sends per second on its own.
+    limiters = [
+        SendLimiter(global_rate=100, chat_interval=0, group_interval=0, shared_bucket=bucket)
+        for _ in range(2)
+    ]
+
+    async def runner() -> int:
+        sends = [
+            limiter.acquire(chat_id, SendPriority.INTERACTIVE)
+            for limiter in limiters
+            for chat_id in range(3)
+        ]
+        done, pending = await asyncio.wait(
+            [asyncio.ensure_future(send) for send in sends], timeout=0.02
+        )
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return len(done)
+
+    assert asyncio.run(runner()) == 4
+
+    bucket.available = False
+    asyncio.run(limiters[0].acquire(1, SendPriority.INTERACTIVE))
+    # Without Redis the process keeps sending from its own bucket.
+    assert limiters[0]._shared_retry_at > 0
+
+
+def test_lower_lanes_leave_shared_tokens_for_other_processes() -> None:
+    bucket = _SharedBucket(tokens=4)
+    worker, bot = (
+        SendLimiter(global_rate=100, chat_interval=0, group_interval=0, shared_bucket=bucket)
+        for _ in range(2)
+    )
+
+    async def sent_within(limiter: SendLimiter, priority: SendPriority, count: int) -> int:
+        sends = [asyncio.ensure_future(limiter.acquire(n, priority)) for n in range(count)]
+        done, pending = await asyncio.wait(sends, timeout=0.02)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return len(done)
+
+    async def runner() -> List[int]:
+        # A proactive burst in one process stops at half of the shared bucket...
+        proactive = await sent_within(worker, SendPriority.PROACTIVE, 10)
+        # ...so the bot process still answers interactively right away.
+        interactive = await sent_within(bot, SendPriority.INTERACTIVE, 10)
+        return [proactive, interactive]
+
+    assert asyncio.run(runner()) == [2, 2]
+
+def test_chat_actions_are_not_paced_per_chat() -> None:
+    clock = {"now": 0.0}
+    limiter = SendLimiter(
+        global_rate=30, chat_interval=1.0, group_interval=3.0, clock=lambda: clock["now"]
+    )
+    middleware = RateLimitMiddleware(limiter, max_retries=0)
+
+    async def make_request(bot, method):  # type: ignore[no-untyped-def]
+        return True
+
+    async def runner() -> None:
+        await middleware(make_request, None, SendChatAction(chat_id=42, action="typing"))
+        assert 42 not in limiter._chat_next_free
+        await middleware(make_request, None, SendMessage(chat_id=42, text="hi"))
+        assert limiter._chat_next_free[42] == 1.0
+
+    asyncio.run(runner())
@@ -0,0 +1,195 @@
+"""Tests for delivering due reminders."""
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, List
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from tgcrm.db.models import Base, Client, Deal, Interaction, Manager, Reminder
+from tgcrm.tasks import reminders
+
+
+def test_overlapping_runs_send_each_reminder_once_and_release_failures(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    delivered: List[int] = []
+
+    async def notify(telegram_id: int, text: str) -> None:
+        await asyncio.sleep(0.01)  # Let the other run interleave.
+        if telegram_id == 102:
+            raise ConnectionError("Telegram is unreachable")
+        delivered.append(telegram_id)
+
+    async def runner() -> List[bool]:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'crm.db'}")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        @asynccontextmanager
+        async def fake_get_session(*, readonly: bool = False) -> AsyncIterator[AsyncSession]:
+            async with session_factory() as session:
+                yield session
+                if not readonly:
+                    await session.commit()
+
+        monkeypatch.setattr(reminders, "get_session", fake_get_session)
+        monkeypatch.setattr(reminders, "send_notification", notify)
+
+        past = datetime.utcnow() - timedelta(minutes=5)
+        async with session_factory() as session:
+            for index in range(3):
+                manager = Manager(telegram_id=100 + index, name=f"M{index}")
+                client = Client(phone_number=f"+7777000{index:04d}", phone_suffix=f"{index:04d}")
+                session.add(Reminder(deal=Deal(client=client, manager=manager), remind_at=past))
+            await session.commit()
+
+        results = await asyncio.gather(
+            reminders._send_due_reminders(),
+            reminders._send_due_reminders(),
+            return_exceptions=True,
+        )
+        assert [type(result) for result in results].count(ConnectionError) == 1
+
+        async with session_factory() as session:
+            flags = (await session.scalars(select(Reminder.is_sent).order_by(Reminder.id))).all()
+        await engine.dispose()
+        return list(flags)
+
+    flags = asyncio.run(runner())
+
+    # Each reminder reached its manager at most once; the undelivered one is due again.
+    assert sorted(delivered) == [100, 101]
+    assert flags == [True, True, False]
+
+
+def test_follow_up_sends_after_the_replica_session_is_closed(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    open_sessions: List[bool] = []
+    delivered: List[int] = []
+
+    async def notify(telegram_id: int, text: str) -> None:
+        assert not open_sessions, "a database session is held across the send"
+        delivered.append(telegram_id)
+
+    async def advice(deal: Deal, interaction_type: str) -> str:
+        assert not open_sessions, "a database session is held across the AI call"
+        return "Позвоните клиенту"
+
+    async def no_overrides() -> dict:
+        return {}
+
+    async def runner() -> None:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'crm.db'}")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        @asynccontextmanager
+        async def fake_get_session(*, readonly: bool = False) -> AsyncIterator[AsyncSession]:
+            async with session_factory() as session:
+                open_sessions.append(readonly)
+                try:
+                    yield session
+                finally:
+                    open_sessions.pop()
+
+        monkeypatch.setattr(reminders, "get_session", fake_get_session)
+        monkeypatch.setattr(reminders, "send_notification", notify)
+        monkeypatch.setattr(reminders, "build_advice_for_interaction", advice)
+        monkeypatch.setattr(reminders.settings_cache, "get_all", no_overrides)
+        monkeypatch.setattr(reminders, "_is_within_working_hours", lambda *args: True)
+
+        stale = datetime.now(timezone.utc) - timedelta(days=2)
+        async with session_factory() as session:
+            for index in range(2):
+                manager = Manager(telegram_id=200 + index, name=f"M{index}")
+                client = Client(phone_number=f"+7777100{index:04d}", phone_suffix=f"{index:04d}")
+                session.add(Deal(client=client, manager=manager, last_interaction_at=stale))
+            await session.commit()
+
+        await reminders._proactive_follow_up()
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+    assert sorted(delivered) == [200, 201]
+
+
+def test_follow_up_pages_the_scan_and_loads_only_recent_history(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    histories: Dict[int, List[str]] = {}
+
+    async def notify(telegram_id: int, text: str) -> None:
+        pass
+
+    async def advice(deal: Deal, interaction_type: str) -> str:
+        histories[deal.manager.telegram_id] = sorted(
+            interaction.manager_summary for interaction in deal.interactions
+        )
+        return "Позвоните клиенту"
+
+    async def no_overrides() -> dict:
+        return {}
+
+    async def runner() -> int:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'crm.db'}")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        @asynccontextmanager
+        async def fake_get_session(*, readonly: bool = False) -> AsyncIterator[AsyncSession]:
+            async with session_factory() as session:
+                yield session
+
+        monkeypatch.setattr(reminders, "get_session", fake_get_session)
+        monkeypatch.setattr(reminders, "send_notification", notify)
+        monkeypatch.setattr(reminders, "build_advice_for_interaction", advice)
+        monkeypatch.setattr(reminders.settings_cache, "get_all", no_overrides)
+        monkeypatch.setattr(reminders, "_is_within_working_hours", lambda *args: True)
+        monkeypatch.setattr(reminders, "FOLLOW_UP_PAGE_SIZE", 2)
+
+        stale = datetime.now(timezone.utc) - timedelta(days=2)
+        async with session_factory() as session:
+            for index in range(5):
+                deal = Deal(
+                    client=Client(phone_number=f"+7777200{index:04d}", phone_suffix=f"{index:04d}"),
+                    manager=Manager(telegram_id=300 + index, name=f"M{index}"),
+                    # Two deals share a timestamp, so the cursor has to break the tie by id.
+                    last_interaction_at=stale - timedelta(hours=index // 2),
+                )
+                for step in range(7):
+                    deal.interactions.append(
+                        Interaction(
+                            type="звонок",
+                            manager_summary=f"#{step}",
+                            created_at=stale - timedelta(days=7 - step),
+                        )
+                    )
+                session.add(deal)
+            await session.commit()
+
+        # Three pages of 2, 2 and 1 deals; the strict budget allows 4 statements per page.
+        scanned = await reminders._proactive_follow_up()
+        await engine.dispose()
+        return scanned
+
+    assert asyncio.run(runner()) == 5
+
+    assert sorted(histories) == [300, 301, 302, 303, 304]
+    assert all(history == ["#2", "#3", "#4", "#5", "#6"] for history in histories.values())
@@ -0,0 +1,134 @@
+"""Tests for the cached bot setting overrides."""
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, List
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from tgcrm.db.models import Base
+from tgcrm.services import settings as settings_service
+from tgcrm.services.settings import SettingsCache, set_setting
+
+
+def test_cache_reloads_only_when_a_newer_version_is_announced() -> None:
+    stored: Dict[str, str] = {"supervisor_password": "old"}
+    published = [3]
+    loads: List[int] = []
+
+    async def loader() -> Dict[str, str]:
+        loads.append(1)
+        return dict(stored)
+
+    async def read_version() -> int:
+        return published[0]
+
+    cache = SettingsCache(loader, version_reader=read_version, max_age=3600)
+
+    async def runner() -> None:
+        assert await cache.get("supervisor_password") == "old"
+        assert await cache.get("supervisor_password") == "old"
+        assert len(loads) == 1
+        assert cache.loaded_version == 3
+
+        stored["supervisor_password"] = "new"
+        cache.mark_stale(3)
+        assert await cache.get("supervisor_password") == "old"
+
+        published[0] = 4
+        cache.mark_stale(4)
+        assert await cache.get("supervisor_password") == "new"
+        assert len(loads) == 2
+
+    asyncio.run(runner())
+
+
+def test_cache_expires_after_max_age_without_redis() -> None:
+    now = [0.0]
+    values = [{"workday_start": "09:00"}]
+
+    async def loader() -> Dict[str, str]:
+        return dict(values[0])
+
+    async def read_version() -> None:
+        return None
+
+    cache = SettingsCache(loader, version_reader=read_version, max_age=60, clock=lambda: now[0])
+
+    async def runner() -> None:
+        assert await cache.get("workday_start") == "09:00"
+        values[0] = {"workday_start": "08:00"}
+        now[0] = 30.0
+        assert await cache.get("workday_start") == "09:00"
+        now[0] = 61.0
+        assert await cache.get("workday_start") == "08:00"
+
+    asyncio.run(runner())
+
+
+def test_invalidation_is_published_after_commit_only(monkeypatch: pytest.MonkeyPatch) -> None:
+    published: List[int] = []
+
+    async def publish() -> int:
+        published.append(1)
+        return len(published)
+
+    monkeypatch.setattr(settings_service, "publish_invalidation", publish)
+
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+        async with session_factory() as session:
+            await set_setting(session, "lunch_start", "12:00")
+            await session.rollback()
+        assert published == []
+
+        async with session_factory() as session:
+            await set_setting(session, "lunch_start", "12:30")
+            assert published == []
+            await session.commit()
+        # Scheduled by the commit hook as a task; nothing blocks the commit itself.
+        await settings_service.wait_for_publishes()
+        assert published == [1]
+
+        await engine.dispose()
+
+    asyncio.run(runner())
+
+
+def test_each_event_loop_closes_the_client_it_opened(monkeypatch: pytest.MonkeyPatch) -> None:
+    from redis import asyncio as aioredis
+
+    clients: List["_FakeRedis"] = []
+
+    class _FakeRedis:
+        def __init__(self) -> None:
+            self.closed = False
+
+        async def get(self, key: str) -> bytes:
+            return b"7"
+
+        async def aclose(self) -> None:
+            self.closed = True
+
+    def from_url(*args: object, **kwargs: object) -> _FakeRedis:
+        clients.append(_FakeRedis())
+        return clients[-1]
+
+    monkeypatch.setattr(aioredis.Redis, "from_url", from_url)
+
+    async def task_run() -> int | None:
+        try:
+            return await settings_service.read_version()
+        finally:
+            await settings_service.close_redis_client()
+
+    # Two Celery task runs, each in its own event loop.
+    assert [asyncio.run(task_run()) for _ in range(2)] == [7, 7]
+    assert [client.closed for client in clients] == [True, True]
@@ -0,0 +1,165 @@
+"""Tests for per-chat ordered, cross-chat concurrent update handling."""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, Update
+
+from tgcrm.bot.scheduler import ChatEventIsolation, ChatScheduler, SchedulerMetrics
+
+
+def _message_update(update_id: int, chat_id: int, text: str) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Manager"},
+                "text": text,
+            },
+        }
+    )
+
+
+UPDATES = [
+    (1, "a1"),
+    (1, "a2"),
+    (1, "a3"),
+    (2, "b1"),
+    (3, "c1"),
+    (4, "d1"),
+]
+
+
+def _recording_router(log: List[Tuple[str, int, str]], active: Dict[str, int]) -> Router:
+    router = Router()
+
+    @router.message()
+    async def record(message: Message) -> None:
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        log.append(("start", message.chat.id, message.text))
+        await asyncio.sleep(0.05)
+        log.append(("end", message.chat.id, message.text))
+        active["now"] -= 1
+
+    return router
+
+
+def _assert_chat_order(log: List[Tuple[str, int, str]]) -> None:
+    chat_one = [(kind, text) for kind, chat, text in log if chat == 1]
+    assert chat_one == [
+        ("start", "a1"),
+        ("end", "a1"),
+        ("start", "a2"),
+        ("end", "a2"),
+        ("start", "a3"),
+        ("end", "a3"),
+    ]
+
+
+def test_polled_updates_are_ordered_per_chat_and_capped_across_chats() -> None:
+    log: List[Tuple[str, int, str]] = []
+    active = {"now": 0, "peak": 0}
+    metrics = SchedulerMetrics()
+
+    async def runner() -> None:
+        dispatcher = Dispatcher(events_isolation=ChatEventIsolation(2, metrics=metrics))
+        dispatcher.include_router(_recording_router(log, active))
+        bot = Bot(token="123456:test-token")
+
+        # What start_polling(handle_as_tasks=True) does: one task per update, in order.
+        await asyncio.gather(
+            *(
+                asyncio.create_task(
+                    dispatcher.feed_update(bot, _message_update(index, chat_id, text))
+                )
+                for index, (chat_id, text) in enumerate(UPDATES, start=1)
+            )
+        )
+        await bot.session.close()
+
+    asyncio.run(runner())
+
+    _assert_chat_order(log)
+    assert active["peak"] == 2
+    snapshot = metrics.snapshot()
+    assert snapshot["processed"] == len(UPDATES)
+    assert snapshot["waiting"] == snapshot["running"] == 0
+    # The first two updates take a slot without waiting; chat 1's backlog queues.
+    assert snapshot["max_waiting"] >= 3
+    assert snapshot["wait_ms"]["update"]["count"] == len(UPDATES)
+
+
+class Flow(StatesGroup):
+    second = State()
+
+
+def test_polled_update_sees_the_state_set_by_the_previous_one() -> None:
+    routed: List[Tuple[str, str]] = []
+    router = Router()
+
+    @router.message(StateFilter(None))
+    async def first_step(message: Message, state: FSMContext) -> None:
+        routed.append(("default", message.text or ""))
+        await asyncio.sleep(0.05)
+        await state.set_state(Flow.second)
+
+    @router.message(Flow.second)
+    async def second_step(message: Message) -> None:
+        routed.append(("second", message.text or ""))
+
+    async def runner() -> None:
+        dispatcher = Dispatcher(events_isolation=ChatEventIsolation(4, metrics=SchedulerMetrics()))
+        dispatcher.include_router(router)
+        bot = Bot(token="123456:test-token")
+        await asyncio.gather(
+            asyncio.create_task(dispatcher.feed_update(bot, _message_update(1, 1, "a"))),
+            asyncio.create_task(dispatcher.feed_update(bot, _message_update(2, 1, "b"))),
+        )
+        await bot.session.close()
+
+    asyncio.run(runner())
+
+    assert routed == [("default", "a"), ("second", "b")]
+
+
+def test_scheduler_reports_queue_depth_and_wait_times() -> None:
+    log: List[Tuple[str, int, str]] = []
+    active = {"now": 0, "peak": 0}
+    metrics = SchedulerMetrics()
+
+    async def runner() -> None:
+        dispatcher = Dispatcher()
+        dispatcher.include_router(_recording_router(log, active))
+        bot = Bot(token="123456:test-token")
+        scheduler = ChatScheduler(
+            lambda update: dispatcher.feed_update(bot, update), workers=3, metrics=metrics
+        )
+        await scheduler.start()
+        for index, (chat_id, text) in enumerate(UPDATES, start=1):
+            scheduler.submit(_message_update(index, chat_id, text))
+
+        depth = metrics.snapshot()
+        assert depth["waiting"] == len(UPDATES)
+        assert depth["deepest_chat_queue"] == 3
+
+        await scheduler.stop()
+        await bot.session.close()
+
+    asyncio.run(runner())
+
+    _assert_chat_order(log)
+    assert active["peak"] == 3
+    snapshot = metrics.snapshot()
+    assert snapshot["processed"] == len(UPDATES)
+    assert snapshot["chats_waiting"] == 0
+    assert snapshot["wait_ms"]["message"]["max_ms"] >= 100
@@ -0,0 +1,114 @@
+"""Tests for the per-update database session."""
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message, Update
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from tgcrm.bot.middlewares import DbSessionMiddleware, UpdateDb
+from tgcrm.db import session as db_session
+from tgcrm.db.models import Base, Client, Manager
+from tgcrm.db.session import get_session
+
+TELEGRAM_ID = 501
+
+
+def _update(text: str) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": TELEGRAM_ID, "type": "private"},
+                "from": {"id": TELEGRAM_ID, "is_bot": False, "first_name": "Dana"},
+                "text": text,
+            },
+        }
+    )
+
+
+def test_update_shares_one_session_and_commits_each_block(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    seen: Dict[str, Any] = {}
+    router = Router()
+
+    @router.message()
+    async def handle(message: Message, db: UpdateDb) -> None:
+        manager = await db.manager()
+        assert await db.manager() is manager
+        suffix = "0001" if message.text == "hello" else "0002"
+        async with get_session() as session:
+            session.add(Client(phone_number=f"+7701123{suffix}", phone_suffix=suffix))
+            seen["first"] = session
+        # The commit returned the connection to the pool while the handler goes on.
+        seen["checked_out"] = seen["pool"].checkedout()
+        # The block has committed: a connection outside the update already sees the client.
+        async with seen["factory"]() as outside:
+            seen[f"committed:{message.text}"] = await outside.scalar(select(func.count(Client.id)))
+        async with get_session(readonly=True) as session:
+            seen["second"] = session
+        if message.text == "fail":
+            async with get_session() as session:
+                session.add(Client(phone_number="+77011239999", phone_suffix="9999"))
+                raise RuntimeError("handler failed")
+
+    async def runner() -> List[int]:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'crm.db'}")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+        seen["factory"] = factory
+        monkeypatch.setattr(db_session, "_session_factory", factory)
+        seen["pool"] = engine.sync_engine.pool
+
+        dispatcher = Dispatcher()
+        dispatcher.update.outer_middleware(DbSessionMiddleware())
+        dispatcher.include_router(router)
+        bot = Bot(token="123456:test-token")
+
+        await dispatcher.feed_update(bot, _update("hello"))
+        with pytest.raises(RuntimeError):
+            await dispatcher.feed_update(bot, _update("fail"))
+
+        async with factory() as session:
+            counts = [
+                await session.scalar(select(func.count(Client.id))),
+                await session.scalar(select(func.count(Manager.id))),
+            ]
+        await bot.session.close()
+        await engine.dispose()
+        return counts
+
+    clients, managers = asyncio.run(runner())
+
+    assert seen["checked_out"] == 0
+    assert seen["first"] is seen["second"]
+    assert (seen["committed:hello"], seen["committed:fail"]) == (1, 2)
+    # Only the failing block was rolled back; what the update committed before it stays.
+    assert (clients, managers) == (2, 1)
+
+
+def test_get_session_outside_an_update_is_unchanged(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def runner() -> None:
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+        monkeypatch.setattr(db_session, "_session_factory", factory)
+
+        assert db_session.current_scope() is None
+        async with get_session() as first:
+            pass
+        async with get_session() as second:
+            pass
+        assert first is not second
+        await engine.dispose()
+
+    asyncio.run(runner())
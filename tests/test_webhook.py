@@ -0,0 +1,169 @@
+"""Tests for the webhook server, driven by a local fake Telegram client."""
+from __future__ import annotations
+
+import asyncio
+import os
+import signal
+import time
+from typing import Any, Dict, List, Tuple
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message, Update
+from aiohttp.test_utils import TestClient, TestServer
+
+from tgcrm.bot import webhook
+from tgcrm.bot.webhook import SCHEDULER_KEY, SECRET_HEADER, create_webhook_app, run_webhook
+from tgcrm.config import TelegramSettings
+
+SECRET = "s3cret"
+PATH = "/telegram/webhook"
+
+
+class FakeTelegram:
+    """Posts updates the way the Bot API does."""
+
+    def __init__(self, client: TestClient) -> None:
+        self.client = client
+        self.update_id = 0
+
+    async def send_text(self, chat_id: int, text: str, *, secret: str = SECRET) -> int:
+        self.update_id += 1
+        payload: Dict[str, Any] = {
+            "update_id": self.update_id,
+            "message": {
+                "message_id": self.update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Manager"},
+                "text": text,
+            },
+        }
+        response = await self.client.post(PATH, json=payload, headers={SECRET_HEADER: secret})
+        return response.status
+
+
+def test_webhook_keeps_chat_order_and_runs_chats_concurrently() -> None:
+    log: List[Tuple[str, int, str]] = []
+    router = Router()
+
+    @router.message()
+    async def record(message: Message) -> None:
+        log.append(("start", message.chat.id, message.text))
+        # The first message of chat 1 plays the slow AI call.
+        await asyncio.sleep(0.2 if message.text == "slow" else 0.01)
+        log.append(("end", message.chat.id, message.text))
+
+    async def runner() -> None:
+        dispatcher = Dispatcher()
+        dispatcher.include_router(router)
+        bot = Bot(token="123456:test-token")
+        app = create_webhook_app(dispatcher, bot, path=PATH, secret=SECRET, workers=4)
+
+        async with TestClient(TestServer(app)) as client:
+            telegram = FakeTelegram(client)
+            assert await telegram.send_text(1, "x", secret="wrong") == 401
+
+            started = time.perf_counter()
+            statuses = [
+                await telegram.send_text(1, "slow"),
+                await telegram.send_text(1, "after-slow"),
+                await telegram.send_text(2, "fast"),
+            ]
+            # Acknowledged before the slow handler finishes.
+            assert time.perf_counter() - started < 0.2
+            assert statuses == [200, 200, 200]
+
+            await app[SCHEDULER_KEY].stop()
+        await bot.session.close()
+
+    asyncio.run(runner())
+
+    chat_one = [entry for entry in log if entry[1] == 1]
+    assert chat_one == [
+        ("start", 1, "slow"),
+        ("end", 1, "slow"),
+        ("start", 1, "after-slow"),
+        ("end", 1, "after-slow"),
+    ]
+    # Chat 2 finished while chat 1 was still waiting on its slow handler.
+    assert log.index(("end", 2, "fast")) < log.index(("end", 1, "slow"))
+
+
+def test_webhook_mode_refuses_to_start_without_a_secret() -> None:
+    telegram = TelegramSettings(
+        TELEGRAM_BOT_TOKEN="123456:test-token",
+        TELEGRAM_MODE="webhook",
+        TELEGRAM_WEBHOOK_URL="https://crm.example.com",
+        TELEGRAM_WEBHOOK_SECRET="",
+    )
+
+    async def runner() -> None:
+        bot = Bot(token="123456:test-token")
+        with pytest.raises(RuntimeError, match="TELEGRAM_WEBHOOK_SECRET"):
+            await run_webhook(Dispatcher(), bot, telegram)
+        with pytest.raises(ValueError):
+            create_webhook_app(Dispatcher(), bot, path=PATH, secret="", workers=1)
+        await bot.session.close()
+
+    asyncio.run(runner())
+
+
+def test_sigterm_drains_acknowledged_updates_before_returning(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    handled: List[str] = []
+    router = Router()
+
+    @router.message()
+    async def record(message: Message) -> None:
+        await asyncio.sleep(0.1)
+        handled.append(message.text or "")
+
+    telegram = TelegramSettings(
+        TELEGRAM_BOT_TOKEN="123456:test-token",
+        TELEGRAM_MODE="webhook",
+        TELEGRAM_WEBHOOK_URL="https://crm.example.com",
+        TELEGRAM_WEBHOOK_SECRET=SECRET,
+        TELEGRAM_WEBHOOK_HOST="127.0.0.1",
+        TELEGRAM_WEBHOOK_PORT=0,
+    )
+    apps = []
+
+    def capture_app(*args: Any, **kwargs: Any) -> Any:
+        apps.append(create_webhook_app(*args, **kwargs))
+        return apps[-1]
+
+    monkeypatch.setattr(webhook, "create_webhook_app", capture_app)
+
+    async def runner() -> None:
+        dispatcher = Dispatcher()
+        dispatcher.include_router(router)
+        bot = Bot(token="123456:test-token")
+
+        async def set_webhook(*args: Any, **kwargs: Any) -> bool:
+            return True
+
+        monkeypatch.setattr(bot, "set_webhook", set_webhook)
+        serving = asyncio.create_task(run_webhook(dispatcher, bot, telegram))
+        while not apps or not apps[0][SCHEDULER_KEY]._tasks:
+            await asyncio.sleep(0.01)
+        update = {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": 1, "type": "private"},
+                "from": {"id": 1, "is_bot": False, "first_name": "Manager"},
+                "text": "acknowledged",
+            },
+        }
+        apps[0][SCHEDULER_KEY].submit(Update.model_validate(update, context={"bot": bot}))
+
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(serving, timeout=5)
+        await bot.session.close()
+
+    asyncio.run(runner())
+
+    assert handled == ["acknowledged"]